@@ -9,6 +9,9 @@ setup(
     entry_points={
         'console_scripts': [
             'sc-processing=main.run:main',
+            'sc-reannotate=main._3_Processing._2_POSTprocessing.scRNA_adata.reannotate_ceph:main',
+            'sc-metrics=main._3_Processing._2_POSTprocessing.report.metrics_store:main',
+            'sc-benchmark=main._4_Monitoring.benchmark_versions:main',
         ],
     },
     install_requires=[
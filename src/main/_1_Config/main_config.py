@@ -13,6 +13,30 @@ WORKDIR = os.path.dirname(ROOT_DIR)
 MAX_diff_date_multiome  =   10
 WORK_data_type          =   'fastq'
 multiome_pattern        =   r'\d{6}_.*-\d{6}_.*'
+# Порт /metrics (Prometheus), None - выключено; переопределяется SC_METRICS_PORT
+METRICS_port            =   None
+# True - BAM (шаблоны 'bam' профиля хранения) не загружаются на Ceph
+RETENTION_drop_bam      =   False
+
+# Профили хранения результатов на Ceph (пути относительно директории образца, '**' - любая глубина):
+#   drop        -   не загружаются (scratch martian/seeksoultools)
+#   compress    -   сжимаются pigz перед загрузкой
+#   bam         -   выравнивания, не загружаются при RETENTION_drop_bam
+TENX_retention          =   {
+                            'drop'      :   ['*_CS'],
+                            'compress'  :   ['_perf', '_finalstate', '_vdrkill'],
+                            'bam'       :   ['outs/*.bam', 'outs/*.bam.bai', 'outs/*.bam.csi']
+                            }
+TENX_multi_retention    =   {
+                            'drop'      :   ['*_CS'],
+                            'compress'  :   ['_perf', '_finalstate', '_vdrkill'],
+                            'bam'       :   ['outs/**/*.bam', 'outs/**/*.bam.bai', 'outs/**/*.bam.csi']
+                            }
+SG_retention            =   {
+                            'drop'      :   ['step1/*.fq.gz', 'step1/*.fastq.gz'],
+                            'compress'  :   ['**/*.log'],
+                            'bam'       :   ['step2/**/*.bam', 'step2/**/*.bam.bai']
+                            }
 
 class SupportedTypes(Enum):
     SUPPORT_types   =   [
@@ -46,10 +70,19 @@ class Paths(Enum):
     FASTQ_load              =       '/mnt/cephfs*_ro/FASTQS/uvd*'
     FASTQ_save              =       '1.Data/FASTQ'
     REFS_local_dir          =       '/mnt/raid0/ofateev/refs'
+    REFS_ceph_dir           =       '/mnt/cephfs8_rw/functional-genomics/ofateev/refs'
+    REFS_manifests          =       '1.Data/Info/ref_manifests'
     SOFT_local_dir          =       '/mnt/raid0/ofateev/soft'
     RUNsheet_save           =       '1.Data/RunSheet'
     CEPH_sheet_parse        =       '1.Data/Info/results_parsing.csv'
     CEPH_sheet_parse_raw    =       '/mnt/cephfs8_rw/functional-genomics/ofateev/Parse_df/results_parsing.csv'
+    METRICS_store           =       '1.Data/Info/sc_metrics.sqlite'
+    MAIL_spool              =       '1.Data/MailSpool'
+    MONITORING_spans        =       '1.Data/Monitoring/spans.jsonl'
+    MONITORING_profiles     =       '1.Data/Monitoring/tool_profiles.jsonl'
+    MONITORING_log          =       '1.Data/Monitoring/sc_processing.jsonl'
+    MONITORING_disk         =       '1.Data/Monitoring/disk_reservations.json'
+    BENCHMARK_save          =       '2.Results/Benchmark'
     IMG_save                =       '1.Data/Image'
     SKIP_list_save          =       f'{str_path}/main/_1_Config'
 
@@ -70,6 +103,71 @@ class FilterParams(Enum):
         'max_len1'     :   150
     }
 
+class CramParams(Enum):
+    # BAM -> CRAM после завершения образца (10X), threads - на одну конвертацию, parallel - одновременных конвертаций
+    args    =   {
+        'enabled'      :   False,
+        'threads'      :   8,
+        'parallel'     :   2
+    }
+
+class DiskParams(Enum):
+    # Место в WORKDIR: флоуселл допускается, если после резерва свободно не меньше max(watermark_gb, watermark_fraction * диск)
+    args    =   {
+        'enabled'            :   True,
+        'watermark_gb'       :   500,
+        'watermark_fraction' :   0.05,
+        'wait_minutes'       :   15,
+        'max_wait_hours'     :   2
+    }
+
+class RefCacheParams(Enum):
+    # Прогрев page cache референсов перед запуском образцов (read=False - только posix_fadvise WILLNEED)
+    args    =   {
+        'enabled'      :   True,
+        'read'         :   True,
+        'threads'      :   4,
+        'min_resident' :   0.9,
+        'hot_hours'    :   6
+    }
+
+class RefRegistryParams(Enum):
+    # Референсы из TypeConfig: манифест (размеры, sha256), проверка при старте, подгрузка отсутствующих с REFS_ceph_dir
+    args    =   {
+        'enabled'      :   True,
+        'threads'      :   8,
+        'sync'         :   True
+    }
+
+class SharedStarParams(Enum):
+    # Один STAR-индекс в разделяемой памяти на референс для SeekGene (seeksoultools --star_path + --genomeLoad LoadAndKeep)
+    # min_samples - минимум образцов группы; star - путь к STAR (None - из сборки seeksoultools)
+    args    =   {
+        'enabled'          :   False,
+        'seq_types'        :   ['SC_SeekGene_RNA', 'SC_SeekGene_FullRNA'],
+        'min_samples'      :   2,
+        'bam_sort_ram_gb'  :   20,
+        'star'             :   None
+    }
+
+class StallParams(Enum):
+    # Зависание образца: лог не растёт minutes минут и CPU ниже cpu_percent; retries - перезапусков после остановки
+    args    =   {
+        'enabled'      :   True,
+        'minutes'      :   90,
+        'cpu_percent'  :   5,
+        'retries'      :   1
+    }
+
+class LogParams(Enum):
+    # JSONL лог (MONITORING_log): ротация по размеру, console - дублировать сообщения в stdout
+    args    =   {
+        'level'        :   'INFO',
+        'max_bytes'    :   100 * 1024 ** 2,
+        'backups'      :   10,
+        'console'      :   True
+    }
+
 class TypeConfig(Enum):
     SC_TENX_RNA             =   "SC_TENX_RNA"
     SC_TENX_ATAC            =   "SC_TENX_ATAC"
@@ -109,7 +207,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/10X/scRNA",
                                                 "ceph"      :   f"{CEPH}/10X_SC_RES/scRNA",
                                                 "postfix"   :   "outs/web_summary.html",
-                                                "stat"      :   "outs/metrics_summary.csv"
+                                                "stat"      :   "outs/metrics_summary.csv",
+                                                "retention" :   TENX_retention
                                                 },
                     'SC_TENX_ATAC'          :   {
                                                 'GRCh38'    :   {'ref':'10x_scATAC_GRCh38'},
@@ -120,7 +219,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/10X/scATAC",
                                                 "ceph"      :   f"{CEPH}/10X_SC_RES/scATAC",
                                                 "postfix"   :   "outs/web_summary.html",
-                                                "stat"      :   "outs/summary.csv"
+                                                "stat"      :   "outs/summary.csv",
+                                                "retention" :   TENX_retention
                                                 },
                     'SC_TENX_Visium_FFPE'   :   {
                                                 'GRCh38'    :   {'ref':'10x_VisiumFFPE_GRCh38',
@@ -133,7 +233,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/10X/visiumFFPE",
                                                 "ceph"      :   f"{CEPH}/10X_SC_RES/Visium_FFPE",
                                                 "postfix"   :   "outs/web_summary.html",
-                                                "stat"      :   "outs/metrics_summary.csv"},
+                                                "stat"      :   "outs/metrics_summary.csv",
+                                                "retention" :   TENX_retention},
                     'SC_TENX_Multiome'      :   {
                                                 'GRCh38'    :   {'ref':'10x_scMultiome_GRCh38'},
                                                 'MM10'      :   {'ref':'10x_scMultiome_MM10'},
@@ -143,7 +244,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/10X/Multiome",
                                                 "ceph"      :   f"{CEPH}/10X_SC_RES/scMultiome",
                                                 "postfix"   :   "outs/web_summary.html",
-                                                "stat"      :   "outs/summary.csv"
+                                                "stat"      :   "outs/summary.csv",
+                                                "retention" :   TENX_retention
                                                 },
                     'SC_SeekGene_RNA'       :   {
                                                 'GRCh38'    :   {'ref':'SG_scRNA_GRCh38'},
@@ -154,7 +256,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/SG/scRNA",
                                                 "ceph"      :   f"{CEPH}/SG_SC_RES/scRNA",
                                                 "postfix"   :   "_report.html",
-                                                "stat"      :   "_summary.csv"
+                                                "stat"      :   "_summary.csv",
+                                                "retention" :   SG_retention
                                                 },
                     'SC_SeekGene_VDJ'       :   {
                                                 'GRCh38'    :   {'ref':'SG_scRNA_GRCh38'},
@@ -165,7 +268,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/SG/scVDJ",
                                                 "ceph"      :   f"{CEPH}/SG_SC_RES/scVDJ",
                                                 "postfix"   :   "outs/report.html",
-                                                "stat"      :   "outs/metrics_summary.csv"
+                                                "stat"      :   "outs/metrics_summary.csv",
+                                                "retention" :   SG_retention
                                                 },
                     'SC_SeekGene_FullRNA'   :   {
                                                 'GRCh38'    :   {'ref':'SG_scRNA_GRCh38'},
@@ -176,7 +280,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/SG/FullLength",
                                                 "ceph"      :   f"{CEPH}/SG_SC_RES/flRNA",
                                                 "postfix"   :   "_report.html",
-                                                "stat"      :   "_summary.csv"
+                                                "stat"      :   "_summary.csv",
+                                                "retention" :   SG_retention
                                                 },
                     'SC_SeekGene_Multiome'  :   {
                                                 'GRCh38'    :   {'ref':'SG_scMultiome_GRCh38'},
@@ -187,7 +292,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/SG/Multiome",
                                                 "ceph"      :   f"{CEPH}/SG_SC_RES/scMultiome",
                                                 "postfix"   :   "outs/*_report.html",
-                                                "stat"      :   "outs/*_summary.csv"
+                                                "stat"      :   "outs/*_summary.csv",
+                                                "retention" :   SG_retention
                                                 },    
                     'SC_TENX_CellPlex'      :   {
                                                 'GRCh38'    :   {'ref':'10x_scRNA_GRCh38'},
@@ -199,7 +305,8 @@ class TypeConfig(Enum):
                                                 "local"     :   "2.Results/10X/CellPlex",
                                                 "ceph"      :   f"{CEPH}/10X_SC_RES/CellPlex",
                                                 "postfix"   :   "outs/per_sample_outs/*/web_summary.html",
-                                                "stat"      :   "outs/per_sample_outs/*/metrics_summary.csv"
+                                                "stat"      :   "outs/per_sample_outs/*/metrics_summary.csv",
+                                                "retention" :   TENX_multi_retention
                                                 },
             }
             return _paths[self.value]
\ No newline at end of file
@@ -2,6 +2,8 @@ import os
 import subprocess
 from typing import Optional
 
+from main._4_Monitoring.structured_log import log
+
 
 def load_bcl(
         flowcell    :   str,
@@ -29,12 +31,12 @@ def load_bcl(
         )
         target_path = f"{save_bcl}/{flowcell}"
         if os.path.exists(target_path):
-            print(f"✅[3.0.1 Load BCL] BCL loaded to {target_path}")
+            log(f"✅[3.0.1 Load BCL] BCL loaded to {target_path}")
             return target_path
         else:
-            print(f"❌[3.0.1 Load BCL] Path not exist: {target_path}")
+            log(f"❌[3.0.1 Load BCL] Path not exist: {target_path}")
             return None
             
     except Exception as e:
-        print(f"❌[3.0.1 Load BCL] Ошибка для {flowcell}: {str(e)}")
+        log(f"❌[3.0.1 Load BCL] Ошибка для {flowcell}: {str(e)}")
         return None
\ No newline at end of file
@@ -1,5 +1,7 @@
 import  subprocess
 from typing import Optional
+
+from main._4_Monitoring.structured_log import log
 def load_airflow_parse( workdir:str,
                         info_sheet_ceph8:str,
                         info_sheet:str)-> Optional[str]:
@@ -20,7 +22,7 @@ def load_airflow_parse( workdir:str,
                        stdout   =   subprocess.PIPE,
                        stderr   =   subprocess.PIPE)
         
-        print(f"✅[3.0.1 Load sheet info] Rsync \033[1m{'1.Data' + info_sheet.replace(workdir, '')}\033[0m complete!")
+        log(f"✅[3.0.1 Load sheet info] Rsync \033[1m{'1.Data' + info_sheet.replace(workdir, '')}\033[0m complete!")
     except subprocess.CalledProcessError as e:
-        print(f"❌[3.0.1 Load sheet info] Rsync error \033[1m{'1.Data' + info_sheet.replace(workdir, '')}\033[0m\nError code: {e.returncode}")
+        log(f"❌[3.0.1 Load sheet info] Rsync error \033[1m{'1.Data' + info_sheet.replace(workdir, '')}\033[0m\nError code: {e.returncode}")
     return info_sheet
\ No newline at end of file
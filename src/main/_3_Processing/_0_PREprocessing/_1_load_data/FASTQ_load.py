@@ -3,6 +3,8 @@ import subprocess
 from glob import glob
 from typing import Optional
 
+from main._4_Monitoring.structured_log import log
+
 def load_fastq(
         sample_id   :   str, 
         flowcell    :   str,
@@ -24,7 +26,7 @@ def load_fastq(
             existing_files = [f for f in glob(pattern) 
                             if os.path.basename(f).startswith(f"{sample_id}_S")]
             if existing_files:
-                print(f"✅[3.0.1 Load FASTQ] Files already exist for {flowcell}:{sample_id} ({len(existing_files)} files)")
+                log(f"✅[3.0.1 Load FASTQ] Files already exist for {flowcell}:{sample_id} ({len(existing_files)} files)")
                 return True
         backup_dirs = ['bak_multilines', 'bak_before_fastp', 'bak_before_repair']
         for backup_dir in backup_dirs:
@@ -34,7 +36,7 @@ def load_fastq(
                 backup_files = [f for f in glob(backup_pattern) 
                               if os.path.basename(f).startswith(f"{sample_id}_S")]
                 if backup_files:
-                    print(f"✅[3.0.1 Load FASTQ] Files exist in {backup_dir} for {flowcell}:{sample_id}")
+                    log(f"✅[3.0.1 Load FASTQ] Files exist in {backup_dir} for {flowcell}:{sample_id}")
                     return True
     access_fastq = []
     if not os.path.exists(fastq_flowcell_path):
@@ -48,7 +50,7 @@ def load_fastq(
         fastq_flowcell_path, f"{save_fastq}/{flowcell}/"
     ]
     try:
-        print(f"🕒[3.0.1 Load FASTQ] Loading files for {flowcell}:{sample_id}")
+        log(f"🕒[3.0.1 Load FASTQ] Loading files for {flowcell}:{sample_id}")
         result = subprocess.run(
             load_fastq_cmd,
             check   =   False,
@@ -59,12 +61,12 @@ def load_fastq(
         count_fastq_files = [f for f in glob(pattern) 
                            if os.path.basename(f).startswith(f"{sample_id}_S")]
         if len(count_fastq_files) > 0:
-            print(f"✅[3.0.1 Load FASTQ] Loaded {len(count_fastq_files)} files for {flowcell}:{sample_id}")
+            log(f"✅[3.0.1 Load FASTQ] Loaded {len(count_fastq_files)} files for {flowcell}:{sample_id}")
             return True
         else:
-            print(f"❌[3.0.1 Load FASTQ] No files found for {flowcell}:{sample_id}")
+            log(f"❌[3.0.1 Load FASTQ] No files found for {flowcell}:{sample_id}")
             return False
             
     except Exception as e:
-        print(f"❌[3.0.1 Load FASTQ] Error for {flowcell}:{sample_id}: {str(e)}")
+        log(f"❌[3.0.1 Load FASTQ] Error for {flowcell}:{sample_id}: {str(e)}")
         return False
\ No newline at end of file
@@ -3,6 +3,8 @@ import subprocess
 from glob import glob
 from typing import Optional
 
+from main._4_Monitoring.structured_log import log
+
 
 def load_sample_sheet_flowcell(
         flowcell    :   str,
@@ -33,7 +35,7 @@ def load_sample_sheet_flowcell(
         )
         samplesheet_files = glob(f"{save_fastq}/{flowcell}/*.csv")
         if len(samplesheet_files) == 1:
-            print(f"✅[3.0.1 Load SampleSheet] SampleSheet loaded for {flowcell}")
+            log(f"✅[3.0.1 Load SampleSheet] SampleSheet loaded for {flowcell}")
             return True
         else:
             alt_patterns = [
@@ -41,11 +43,11 @@ def load_sample_sheet_flowcell(
             for pattern in alt_patterns:
                 samplesheet_files = glob(pattern)
                 if len(samplesheet_files) >= 1:
-                    print(f"✅[3.0.1 Load SampleSheet] SampleSheet found for {flowcell}")
+                    log(f"✅[3.0.1 Load SampleSheet] SampleSheet found for {flowcell}")
                     return True
-            print(f"❌[3.0.1 Load SampleSheet] No SampleSheet for {flowcell}")
+            log(f"❌[3.0.1 Load SampleSheet] No SampleSheet for {flowcell}")
             return False
             
     except Exception as e:
-        print(f"❌[3.0.1 Load SampleSheet] Error for {flowcell}: {str(e)}")
+        log(f"❌[3.0.1 Load SampleSheet] Error for {flowcell}: {str(e)}")
         return False
\ No newline at end of file
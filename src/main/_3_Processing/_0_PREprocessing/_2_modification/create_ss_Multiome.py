@@ -2,6 +2,8 @@ from glob import glob
 import pandas as pd
 import os
 
+from main._4_Monitoring.structured_log import log
+
 def create_ss_tenx_multiome(
                         sample:str,
                         flowcell:str,
@@ -22,11 +24,11 @@ def create_ss_tenx_multiome(
 
     if set(samples_rna) == set(samples_atac):
         samples = samples_rna
-        print("✅[3.0.2 Multiome 10X SS] Samples match between RNA and ATAC")
+        log("✅[3.0.2 Multiome 10X SS] Samples match between RNA and ATAC")
     else:
-        print( '❌[3.0.2 Multiome 10X SS] Error: RNA and ATAC samples do not match!')
-        print(f'❌[3.0.2 Multiome 10X SS] RNA only:   {set(samples_rna) - set(samples_atac)}')
-        print(f'❌[3.0.2 Multiome 10X SS] ATAC only:  {set(samples_atac) - set(samples_rna)}')
+        log( '❌[3.0.2 Multiome 10X SS] Error: RNA and ATAC samples do not match!')
+        log(f'❌[3.0.2 Multiome 10X SS] RNA only:   {set(samples_rna) - set(samples_atac)}')
+        log(f'❌[3.0.2 Multiome 10X SS] ATAC only:  {set(samples_atac) - set(samples_rna)}')
         samples = None
 
     if samples is not None:
@@ -39,7 +41,7 @@ def create_ss_tenx_multiome(
             ss_df       =   pd.DataFrame([rna_row, atac_row], columns=columns)
             ss_df.to_csv(ss_path, index=False)
         else:
-            print(f'✅[3.0.2 Multiome 10X SS] Sample sheet already exists!')
+            log(f'✅[3.0.2 Multiome 10X SS] Sample sheet already exists!')
         return ss_path
     else:
         return None
\ No newline at end of file
@@ -2,6 +2,8 @@ import pandas as pd
 from datetime import datetime
 import re
 
+from main._4_Monitoring.structured_log import log
+
 def extract_date_from_flowcell(flowcell):
 	if pd.isna(flowcell):
 		return None
@@ -24,18 +26,18 @@ def process_multiome_data(df:pd.DataFrame,
 	multiome_df     =   result_df[multiome_mask].copy()
 	
 	if multiome_df.empty:
-		print("⚠️[3.0.2 Conver multiome] No contains Multiome in Desct_TYPE")
+		log("⚠️[3.0.2 Conver multiome] No contains Multiome in Desct_TYPE")
 		return result_df
 	
 	invalid_multiome_types  =   set(multiome_df['Desct_TYPE'].unique()) - set(valid_types)
 	if invalid_multiome_types:
-		print(f"⚠️[3.0.2 Conver multiome] Find Multiome not supported types")
+		log(f"⚠️[3.0.2 Conver multiome] Find Multiome not supported types")
 		for t in invalid_multiome_types:
-			print(f"👉[3.0.2 Conver multiome] {t}")
+			log(f"👉[3.0.2 Conver multiome] {t}")
 	
 	multiome_df     =   multiome_df[multiome_df['Desct_TYPE'].isin(valid_types)].copy()
 	if multiome_df.empty:
-		print("⚠️[3.0.2 Conver multiome] Not Multiome in supported types")
+		log("⚠️[3.0.2 Conver multiome] Not Multiome in supported types")
 		return result_df
 	
 	processed_samples = set()
@@ -43,14 +45,14 @@ def process_multiome_data(df:pd.DataFrame,
 	
 	for sample_id, group in multiome_df.groupby('Sample_ID'):
 		if len(group) < 2:
-			print(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' find only {len(group)} record Multiome.\n⚠️[Conver multiome] Need 2 (RNA and ATAC).")
+			log(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' find only {len(group)} record Multiome.\n⚠️[Conver multiome] Need 2 (RNA and ATAC).")
 			continue
 		
 		rna_records     =   group[group['Desct_TYPE'].str.endswith('_RNA')]
 		atac_records    =   group[group['Desct_TYPE'].str.endswith('_ATAC')]
 		
 		if rna_records.empty or atac_records.empty:
-			print(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' not foundet RNA and ATAC")
+			log(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' not foundet RNA and ATAC")
 			continue
 		
 		rna_record      =   rna_records.iloc[0]
@@ -62,7 +64,7 @@ def process_multiome_data(df:pd.DataFrame,
 		if rna_date and atac_date:
 			actual_date_diff = abs((rna_date - atac_date).days)
 			if actual_date_diff > max_date_diff:
-				print(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' data diff in Flowcell name: {actual_date_diff} days (> {max_date_diff} days)")
+				log(f"⚠️[3.0.2 Conver multiome] For Sample_ID '{sample_id}' data diff in Flowcell name: {actual_date_diff} days (> {max_date_diff} days)")
 				continue
 		
 		base_type       =   rna_record['Desct_TYPE'].replace('_RNA', '')
@@ -111,7 +113,7 @@ def process_multiome_data(df:pd.DataFrame,
 	if rows_to_drop:
 		result_df = result_df.drop(rows_to_drop)
 	
-	print(f"✅[3.0.2 Conver multiome] Processed {len(processed_samples)} Multiome samples")
+	log(f"✅[3.0.2 Conver multiome] Processed {len(processed_samples)} Multiome samples")
 	return result_df
 
 
@@ -124,18 +126,18 @@ def process_cellplex_data(df:pd.DataFrame,
 	cellplex_df     =   result_df[cellplex_mask].copy()
 
 	if cellplex_df.empty:
-		print("⚠️[3.0.2 Conver cellplex] No contains CellPlexs in Desct_TYPE")
+		log("⚠️[3.0.2 Conver cellplex] No contains CellPlexs in Desct_TYPE")
 		return result_df
 	
 	invalid_cellplex_types  =   set(cellplex_df['Desct_TYPE'].unique()) - set(valid_types)
 	if invalid_cellplex_types:
-		print(f"⚠️[3.0.2 Conver cellplex] Find CellPlex not supported types")
+		log(f"⚠️[3.0.2 Conver cellplex] Find CellPlex not supported types")
 		for t in invalid_cellplex_types:
-			print(f"👉[3.0.2 Conver cellplex] {t}")
+			log(f"👉[3.0.2 Conver cellplex] {t}")
 	
 	cellplex_df     =   cellplex_df[cellplex_df['Desct_TYPE'].isin(valid_types)].copy()
 	if cellplex_df.empty:
-		print("⚠️[3.0.2 Conver cellplex] Not CellPlex in supported types")
+		log("⚠️[3.0.2 Conver cellplex] Not CellPlex in supported types")
 		return result_df
 	
 	processed_indices = []
@@ -145,7 +147,7 @@ def process_cellplex_data(df:pd.DataFrame,
 		cellplex_df_flowcell = cellplex_df[cellplex_df['Flowcell'] == flowcell]
 		
 		if len(cellplex_df_flowcell) < 2:
-			print(f"⚠️[3.0.2 Conver cellplex] For Flowcell '{flowcell}' find only {len(cellplex_df_flowcell)} record CellPlex.\n⚠️[Conver cellplex] Need 2 per sample (GEX and MUX).")
+			log(f"⚠️[3.0.2 Conver cellplex] For Flowcell '{flowcell}' find only {len(cellplex_df_flowcell)} record CellPlex.\n⚠️[Conver cellplex] Need 2 per sample (GEX and MUX).")
 			continue
 		
 		processed_indices.extend(cellplex_df_flowcell.index.tolist())
@@ -166,7 +168,7 @@ def process_cellplex_data(df:pd.DataFrame,
 						   axis=0,
 						   ignore_index=True)
 	
-	print(f"✅[3.0.2 Conver cellplex] Processed {len(cellplex_df)} CellPlex samples")
+	log(f"✅[3.0.2 Conver cellplex] Processed {len(cellplex_df)} CellPlex samples")
 	return result_df
 
 def extract_cellplex_data(x:str):
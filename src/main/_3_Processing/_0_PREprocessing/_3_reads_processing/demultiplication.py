@@ -8,6 +8,8 @@ from glob import glob
 from typing import Optional
 from bs4 import BeautifulSoup as Soup
 
+from main._4_Monitoring.structured_log import log
+
 
 def get_runinfo(file: str) -> Optional[str]:
     try:
@@ -18,19 +20,19 @@ def get_runinfo(file: str) -> Optional[str]:
         cycles = [read['NumCycles'] for read in reads if 'NumCycles' in read.attrs]
         
         if len(cycles) != len(index_read):
-            print(f"⚠️[3.0.3 Demultiplex] Cycle length ({len(cycles)}) != index length ({len(index_read)})")
+            log(f"⚠️[3.0.3 Demultiplex] Cycle length ({len(cycles)}) != index length ({len(index_read)})")
             return None
         result = ','.join(f"{index}{cycle}" for index, cycle in zip(index_read, cycles))
-        print(f"✅[3.0.3 Demultiplex] Flag --use-bases-mask: {result}")
+        log(f"✅[3.0.3 Demultiplex] Flag --use-bases-mask: {result}")
         return result
     except FileNotFoundError:
-        print(f"❌[3.0.3 Demultiplex] File not found: {file}")
+        log(f"❌[3.0.3 Demultiplex] File not found: {file}")
         return None
     except KeyError as e:
-        print(f"❌[3.0.3 Demultiplex] Parse error XML: key zero exist {e}")
+        log(f"❌[3.0.3 Demultiplex] Parse error XML: key zero exist {e}")
         return None
     except Exception as e:
-        print(f"❌[3.0.3 Demultiplex] Parse error RunInfo.xml: {e}")
+        log(f"❌[3.0.3 Demultiplex] Parse error RunInfo.xml: {e}")
         return None
 
 
@@ -38,14 +40,14 @@ def bcl2fastq(
         bcl     :   str,
         fastq   :   str) -> Optional[str]:
     if not bcl or not os.path.exists(bcl):
-        print(f"❌[3.0.3 Demultiplex] BCL not exist: {bcl}")
+        log(f"❌[3.0.3 Demultiplex] BCL not exist: {bcl}")
         return None
     flowcell = os.path.basename(bcl)
     samplesheet_files = glob(f'{bcl}/*.csv')
     if not samplesheet_files:
         samplesheet_files = glob(f'{bcl}/*.CSV')
     if not samplesheet_files:
-        print(f"❌[3.0.3 Demultiplex] Samplesheet not found {bcl}")
+        log(f"❌[3.0.3 Demultiplex] Samplesheet not found {bcl}")
         return None
     samplesheet = samplesheet_files[0]
     output_dir = f"{fastq}/{flowcell}"
@@ -65,9 +67,9 @@ def bcl2fastq(
     ]
     copy_ss = ['cp', '-f', samplesheet, output_dir]
     log_path = f"{output_dir}/bcl2fastq.log"
-    print(f"🕒[3.0.3 Demultiplex] Run bcl2fastq for {flowcell}")
-    print(f"🕒[3.0.3 Demultiplex] Samplesheet: {samplesheet}")
-    print(f"🕒[3.0.3 Demultiplex] Out dir: {output_dir}")
+    log(f"🕒[3.0.3 Demultiplex] Run bcl2fastq for {flowcell}")
+    log(f"🕒[3.0.3 Demultiplex] Samplesheet: {samplesheet}")
+    log(f"🕒[3.0.3 Demultiplex] Out dir: {output_dir}")
     try:
         with open(log_path, "w") as log_file:
             result = subprocess.run(
@@ -78,25 +80,25 @@ def bcl2fastq(
             )
         subprocess.run(copy_ss, check=False, capture_output=True)
         if result.returncode == 0:
-            print(f"✅[3.0.3 Demultiplex] bcl2fastq complect {flowcell}")
+            log(f"✅[3.0.3 Demultiplex] bcl2fastq complect {flowcell}")
             fastq_files = glob(f"{output_dir}/*.fastq.gz")
             if fastq_files:
-                print(f"✅[3.0.3 Demultiplex] Created {len(fastq_files)} FASTQ files")
+                log(f"✅[3.0.3 Demultiplex] Created {len(fastq_files)} FASTQ files")
                 return output_dir
             else:
-                print(f"⚠️[3.0.3 Demultiplex] FASTQ files not created, check log: {log_path}")
+                log(f"⚠️[3.0.3 Demultiplex] FASTQ files not created, check log: {log_path}")
                 return None
         else:
-            print(f"❌[3.0.3 Demultiplex] bcl2fastq exist with error (code: {result.returncode})")
-            print(f"🕒[3.0.3 Demultiplex] Check logs: {log_path}")
+            log(f"❌[3.0.3 Demultiplex] bcl2fastq exist with error (code: {result.returncode})")
+            log(f"🕒[3.0.3 Demultiplex] Check logs: {log_path}")
             fastq_files = glob(f"{output_dir}/*.fastq.gz")
             if fastq_files:
-                print(f"⚠️[3.0.3 Demultiplex] Find {len(fastq_files)} FASTQ files")
+                log(f"⚠️[3.0.3 Demultiplex] Find {len(fastq_files)} FASTQ files")
                 return output_dir
             return None
         
     except Exception as e:
-        print(f"❌[3.0.3 Demultiplex] Ошибка при запуске bcl2fastq: {str(e)}")
+        log(f"❌[3.0.3 Demultiplex] Ошибка при запуске bcl2fastq: {str(e)}")
         return None
 
 
@@ -104,24 +106,24 @@ def bcl2fastq_atac(
         bcl     :   str,
         fastq   :   str) -> Optional[str]:
     if not bcl or not os.path.exists(bcl):
-        print(f"❌[3.0.3 Demultiplex ATAC] BCL not exist: {bcl}")
+        log(f"❌[3.0.3 Demultiplex ATAC] BCL not exist: {bcl}")
         return None
     flowcell = os.path.basename(bcl)
     samplesheet_files = glob(f'{bcl}/*.csv')
     if not samplesheet_files:
         samplesheet_files = glob(f'{bcl}/*.CSV')
     if not samplesheet_files:
-        print(f"❌[3.0.3 Demultiplex ATAC] Samplesheet not found  {bcl}")
+        log(f"❌[3.0.3 Demultiplex ATAC] Samplesheet not found  {bcl}")
         return None
     samplesheet = samplesheet_files[0]
     runinfo_files = glob(f'{bcl}/RunInfo.xml')
     if not runinfo_files:
-        print(f"❌[3.0.3 Demultiplex ATAC] RunInfo.xml not found {bcl}")
+        log(f"❌[3.0.3 Demultiplex ATAC] RunInfo.xml not found {bcl}")
         return None
     runinfo = runinfo_files[0]
     runinfo_mask = get_runinfo(runinfo)
     if not runinfo_mask:
-        print(f"❌[3.0.3 Demultiplex ATAC] Mask export error RunInfo.xml")
+        log(f"❌[3.0.3 Demultiplex ATAC] Mask export error RunInfo.xml")
         return None
     output_dir = f"{fastq}/{flowcell}"
     os.makedirs(output_dir, exist_ok=True)
@@ -145,9 +147,9 @@ def bcl2fastq_atac(
     ]
     copy_ss = ['cp', '-f', samplesheet, output_dir]
     log_path = f"{output_dir}/bcl2fastq_atac.log"
-    print(f"🕒[3.0.3 Demultiplex ATAC] Start run bcl2fastq for ATAC {flowcell}")
-    print(f"🕒[3.0.3 Demultiplex ATAC] Reads mask: {runinfo_mask}")
-    print(f"🕒[3.0.3 Demultiplex ATAC] Output dir: {output_dir}")
+    log(f"🕒[3.0.3 Demultiplex ATAC] Start run bcl2fastq for ATAC {flowcell}")
+    log(f"🕒[3.0.3 Demultiplex ATAC] Reads mask: {runinfo_mask}")
+    log(f"🕒[3.0.3 Demultiplex ATAC] Output dir: {output_dir}")
     try:
         with open(log_path, "w") as log_file:
             result = subprocess.run(
@@ -158,22 +160,22 @@ def bcl2fastq_atac(
             )
         subprocess.run(copy_ss, check=False, capture_output=True)
         if result.returncode == 0:
-            print(f"✅[3.0.3 Demultiplex ATAC] bcl2fastq completed successfully {flowcell}")
+            log(f"✅[3.0.3 Demultiplex ATAC] bcl2fastq completed successfully {flowcell}")
             fastq_files = glob(f"{output_dir}/*.fastq.gz")
             if fastq_files:
-                print(f"✅[3.0.3 Demultiplex ATAC] Create {len(fastq_files)} FASTQ files")
+                log(f"✅[3.0.3 Demultiplex ATAC] Create {len(fastq_files)} FASTQ files")
                 return output_dir
             else:
-                print(f"⚠️[3.0.3 Demultiplex ATAC] FASTQ files not create, check log: {log_path}")
+                log(f"⚠️[3.0.3 Demultiplex ATAC] FASTQ files not create, check log: {log_path}")
                 return None
         else:
-            print(f"❌[3.0.3 Demultiplex ATAC] bcl2fastq exist error (code: {result.returncode})")
-            print(f"🕒[3.0.3 Demultiplex ATAC] Check logs: {log_path}")
+            log(f"❌[3.0.3 Demultiplex ATAC] bcl2fastq exist error (code: {result.returncode})")
+            log(f"🕒[3.0.3 Demultiplex ATAC] Check logs: {log_path}")
             fastq_files = glob(f"{output_dir}/*.fastq.gz")
             if fastq_files:
-                print(f"⚠️[3.0.3 Demultiplex ATAC] Find {len(fastq_files)} FASTQ files")
+                log(f"⚠️[3.0.3 Demultiplex ATAC] Find {len(fastq_files)} FASTQ files")
                 return output_dir
             return None 
     except Exception as e:
-        print(f"❌[3.0.3 Demultiplex ATAC] Error bcl2fastq: {str(e)}")
+        log(f"❌[3.0.3 Demultiplex ATAC] Error bcl2fastq: {str(e)}")
         return None
\ No newline at end of file
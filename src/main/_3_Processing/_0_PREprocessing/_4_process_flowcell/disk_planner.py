@@ -0,0 +1,236 @@
+"""
+Планирование места на рабочем диске (WORKDIR, /mnt/raid0) до загрузки флоуселла.
+
+Нужно образцу = размер FASTQ * коэффициент расширения типа (FASTQ + fastp/repair + BAM и временные файлы
+инструмента + копии для сводки). Если в tool_profiles.jsonl достаточно запусков, коэффициент берётся по
+записанным инструментом байтам. Резервы всех процессов sc-processing на этом сервере хранятся в
+'1.Data/Monitoring/disk_reservations.json' (блокировка fcntl, записи завершившихся процессов удаляются).
+
+Флоуселл допускается, если свободно - зарезервировано - нужно >= watermark.
+"""
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+from glob import glob
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+# байт на диске на байт FASTQ (с самими FASTQ)
+EXPANSION_factors   =   {
+                        'SC_TENX_RNA'           :   3.0,
+                        'SC_TENX_CellPlex'      :   3.0,
+                        'SC_TENX_ATAC'          :   3.5,
+                        'SC_TENX_Multiome'      :   3.5,
+                        'SC_TENX_Visium_FFPE'   :   2.5,
+                        'SC_SeekGene_RNA'       :   3.0,
+                        'SC_SeekGene_VDJ'       :   2.0,
+                        'SC_SeekGene_Multiome'  :   3.5,
+                        }
+DEFAULT_factor      =   3.0
+MIN_profile_runs    =   3
+
+
+class SampleNeed(NamedTuple):
+    key: str
+    fastq_bytes: int        # FASTQ (источник или уже загруженные)
+    loaded: bool            # FASTQ уже в WORKDIR
+    factor: float
+    need_bytes: int         # ещё не занято на диске
+
+
+def _gb(value: float) -> str:
+    return f"{value / 1024 ** 3:.0f} GB"
+
+
+def fastq_size(root: str, flowcell: str, sample_ids: List[str], suffix: str = '') -> int:
+    """
+    Размер FASTQ образцов: '{root}/{fc}{suffix}/{sample_id}_S*.fastq.gz' (раскладка FASTQ_load).
+    Multiome ('fcA-fcB') - по обеим частям флоуселла.
+    """
+    from main._1_Config.main_config import multiome_pattern
+    flowcells   =   flowcell.split('-') if re.match(multiome_pattern, flowcell) else [flowcell]
+    total       =   0
+    for fc in flowcells:
+        for sample_id in sample_ids:
+            for path in glob(f"{root}/{fc}{suffix}/{sample_id}_S*.fastq.gz"):
+                try:
+                    total += os.path.getsize(path)
+                except OSError:
+                    pass
+    return total
+
+
+def learned_factors(path: str = None) -> Dict[str, float]:
+    """Медиана (записано инструментом / FASTQ) + 1 по истории запусков, если запусков достаточно"""
+    from main._3_Processing._0_PREprocessing._4_process_flowcell.runtime_model import load_profiles
+    ratios: Dict[str, List[float]] = {}
+    for record in load_profiles(path):
+        if record.get('write_gb') is None:
+            continue
+        ratios.setdefault(record.get('seq_type'), []).append(record['write_gb'] * 1024 ** 3 / record['fastq_bytes'])
+    factors = {}
+    for seq_type, values in ratios.items():
+        if len(values) >= MIN_profile_runs:
+            values.sort()
+            factors[seq_type] = values[len(values) // 2] + 1.0
+    return factors
+
+
+def estimate_needs(flowcell_sample_processed: Dict[str, Dict[str, Any]],
+                   fastq_load: str,
+                   fastq_save: str,
+                   factors: Dict[str, float] = None) -> List[SampleNeed]:
+    """Оценка по образцам; образцы с готовыми результатами места не требуют"""
+    factors = {**EXPANSION_factors, **(factors or {})}
+    needs   = []
+    for key, value in flowcell_sample_processed.items():
+        if value.get('Path result html prefix') and glob(value['Path result html prefix']):
+            continue
+        flowcell    =   value['Flowcell']
+        sample_ids  =   value['CellPlex_ID'].split('|') if value.get('CellPlex_ID') else [value['Sample_ID']]
+        factor      =   factors.get(value['SeqType'], DEFAULT_factor)
+        local       =   fastq_size(fastq_save, flowcell, sample_ids)
+        if local:
+            needs.append(SampleNeed(key, local, True, factor, int(local * (factor - 1))))
+            continue
+        source      =   fastq_size(fastq_load, flowcell, sample_ids, suffix='_fastq4')
+        needs.append(SampleNeed(key, source, False, factor, int(source * factor)))
+    return needs
+
+
+class DiskPlanner:
+    def __init__(self, root: str, ledger_path: str, watermark_gb: float = 500, watermark_fraction: float = 0.05):
+        self.root               =   root
+        self.ledger_path        =   ledger_path
+        self.watermark_gb       =   watermark_gb
+        self.watermark_fraction =   watermark_fraction
+
+    @classmethod
+    def from_config(cls) -> 'DiskPlanner':
+        from main._1_Config.main_config import WORKDIR, Paths, DiskParams
+        params = DiskParams.args.value
+        return cls(root                 =   WORKDIR,
+                   ledger_path          =   f"{WORKDIR}/{Paths.MONITORING_disk.value}",
+                   watermark_gb         =   params['watermark_gb'],
+                   watermark_fraction   =   params['watermark_fraction'])
+
+    def watermark(self) -> int:
+        total = shutil.disk_usage(self.root).total
+        return int(max(self.watermark_gb * 1024 ** 3, total * self.watermark_fraction))
+
+    @contextmanager
+    def _ledger(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        os.makedirs(os.path.dirname(self.ledger_path), exist_ok=True)
+        with open(f"{self.ledger_path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = {}
+                if os.path.exists(self.ledger_path):
+                    try:
+                        with open(self.ledger_path, 'r') as f:
+                            entries = json.load(f)
+                    except (OSError, ValueError):
+                        entries = {}
+                entries = {key: entry for key, entry in entries.items() if _pid_alive(entry.get('pid'))}
+                yield entries
+                tmp_path = f"{self.ledger_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f, indent=1)
+                os.replace(tmp_path, self.ledger_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reserved(self) -> int:
+        with self._ledger() as entries:
+            return sum(entry['bytes'] for entry in entries.values())
+
+    def headroom(self) -> int:
+        """Свободно - зарезервировано - watermark"""
+        return shutil.disk_usage(self.root).free - self.reserved() - self.watermark()
+
+    def try_reserve(self, needs: List[SampleNeed]) -> bool:
+        """Резервирует место под все образцы сразу или ничего"""
+        total = sum(need.need_bytes for need in needs)
+        with self._ledger() as entries:
+            reserved = sum(entry['bytes'] for key, entry in entries.items() if key not in {n.key for n in needs})
+            if shutil.disk_usage(self.root).free - reserved - total < self.watermark():
+                return False
+            for need in needs:
+                entries[need.key] = {'bytes': need.need_bytes, 'pid': os.getpid(),
+                                     'created': time.strftime('%Y-%m-%d %H:%M:%S')}
+        _update_metrics(self)
+        return True
+
+    def consume_loaded(self, needs: List[SampleNeed]):
+        """После загрузки флоуселла FASTQ уже лежат в WORKDIR и учтены в свободном месте"""
+        with self._ledger() as entries:
+            for need in needs:
+                if not need.loaded and need.key in entries:
+                    entries[need.key]['bytes'] = max(entries[need.key]['bytes'] - need.fastq_bytes, 0)
+        _update_metrics(self)
+
+    def release(self, keys: List[str]):
+        with self._ledger() as entries:
+            for key in keys:
+                entries.pop(key, None)
+        _update_metrics(self)
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _update_metrics(planner: DiskPlanner):
+    from main._4_Monitoring.metrics_server import DISK_free, DISK_reserved
+    DISK_free.set(shutil.disk_usage(planner.root).free)
+    DISK_reserved.set(planner.reserved())
+
+
+def admit_flowcell(flowcell_sample_processed: Dict[str, Dict[str, Any]],
+                   fastq_load: str,
+                   fastq_save: str,
+                   planner: DiskPlanner = None) -> Optional[List[SampleNeed]]:
+    """
+    Ждёт, пока флоуселл поместится на диск (проверка каждые wait_minutes, не дольше max_wait_hours).
+    Возвращает зарезервированные образцы ([] - проверка выключена) или None - места так и не хватило.
+    """
+    from main._1_Config.main_config import DiskParams
+    from main._4_Monitoring.structured_log import log
+    params = DiskParams.args.value
+    if not params['enabled']:
+        return []
+    planner =   planner or DiskPlanner.from_config()
+    try:
+        factors = learned_factors()
+    except Exception:
+        factors = {}
+    needs   =   estimate_needs(flowcell_sample_processed, fastq_load, fastq_save, factors)
+    if not needs:
+        return []
+    unknown = [need.key for need in needs if not need.fastq_bytes]
+    if unknown:
+        log(f"⚠️[3.0 Disk] FASTQ size unknown for {len(unknown)} samples, only the watermark is checked for them")
+    total   =   sum(need.need_bytes for need in needs)
+    deadline=   time.time() + params['max_wait_hours'] * 3600
+    while True:
+        if planner.try_reserve(needs):
+            log(f"✅[3.0 Disk] Reserved {_gb(total)} for {len(needs)} samples "
+                f"(free {_gb(shutil.disk_usage(planner.root).free)}, watermark {_gb(planner.watermark())})")
+            return needs
+        headroom = planner.headroom()
+        log(f"⚠️[3.0 Disk] Not enough space in {planner.root}: need {_gb(total)}, available {_gb(max(headroom, 0))} "
+            f"above watermark {_gb(planner.watermark())}")
+        if time.time() + params['wait_minutes'] * 60 > deadline:
+            return None
+        time.sleep(params['wait_minutes'] * 60)
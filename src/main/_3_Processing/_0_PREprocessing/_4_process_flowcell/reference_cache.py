@@ -0,0 +1,166 @@
+"""
+Прогрев page cache референсов перед запуском образцов.
+
+Одновременный старт нескольких cellranger/STAR с холодным индексом - это случайное чтение одних и тех же
+десятков ГБ всеми процессами сразу. Перед запуском файлы индекса читаются последовательно один раз
+(posix_fadvise WILLNEED + чтение блоками, как 'vmtouch -t'), образцы с общим референсом запускаются группой.
+
+Горячим референс считается, если в page cache не меньше min_resident его байт (mincore, как 'vmtouch -v');
+если mincore недоступен - если он прогревался этим процессом за последние hot_hours часов.
+"""
+import os
+import mmap
+import time
+import ctypes
+import ctypes.util
+import threading
+from glob import glob
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from main._4_Monitoring.instrumentation import span
+
+# файлы индексов, которые читают инструменты (10X и SeekGene: star/, ATAC: fasta/ с bwa-индексом)
+WARM_globs      =   ['star/*', 'fasta/*', 'genes/*', 'reference.json']
+READ_block      =   16 * 1024 ** 2
+MINCORE_sample  =   1024 ** 3          # файлы меньше - не проверяются (вклад мал)
+
+_PAGE           =   mmap.PAGESIZE
+_PROT_READ      =   0x1
+_MAP_SHARED     =   0x01
+_MAP_FAILED     =   ctypes.c_void_p(-1).value
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.mmap.restype      =   ctypes.c_void_p
+    _libc.mmap.argtypes     =   [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    _libc.munmap.argtypes   =   [ctypes.c_void_p, ctypes.c_size_t]
+    _libc.mincore.argtypes  =   [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+except (OSError, AttributeError):
+    _libc = None
+
+
+def reference_files(ref_dir: str) -> List[str]:
+    files = set()
+    for pattern in WARM_globs:
+        files.update(path for path in glob(os.path.join(ref_dir, pattern)) if os.path.isfile(path))
+    return sorted(files)
+
+
+def resident_bytes(path: str) -> Optional[int]:
+    """Байт файла в page cache (mincore); None - не удалось проверить"""
+    if _libc is None:
+        return None
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = _libc.mmap(None, size, _PROT_READ, _MAP_SHARED, fd, 0)
+        if addr in (None, _MAP_FAILED):
+            return None
+        try:
+            pages   =   (size + _PAGE - 1) // _PAGE
+            vector  =   (ctypes.c_ubyte * pages)()
+            if _libc.mincore(ctypes.c_void_p(addr), size, vector) != 0:
+                return None
+            return (pages - bytes(vector).count(0)) * _PAGE
+        finally:
+            _libc.munmap(ctypes.c_void_p(addr), size)
+    finally:
+        os.close(fd)
+
+
+def warm_file(path: str, read: bool = True) -> int:
+    """WILLNEED для всего файла и последовательное чтение блоками; возвращает прочитанные байты"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        total = 0
+        if read:
+            while True:
+                chunk = os.read(fd, READ_block)
+                if not chunk:
+                    break
+                total += len(chunk)
+        return total
+    finally:
+        os.close(fd)
+
+
+class ReferenceCache:
+    def __init__(self, threads: int = 4, read: bool = True, min_resident: float = 0.9, hot_hours: float = 6):
+        self.read           =   read
+        self.min_resident   =   min_resident
+        self.hot_seconds    =   hot_hours * 3600
+        self._executor      =   ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ref-warm')
+        self._lock          =   threading.Lock()
+        self._warming: Dict[str, Future] = {}
+        self._warmed: Dict[str, float] = {}     # ref_dir -> время прогрева
+
+    @classmethod
+    def from_config(cls) -> 'ReferenceCache':
+        from main._1_Config.main_config import RefCacheParams
+        params = RefCacheParams.args.value
+        return cls(threads=params['threads'], read=params['read'], min_resident=params['min_resident'],
+                   hot_hours=params['hot_hours'])
+
+    def resident_fraction(self, ref_dir: str) -> Optional[float]:
+        total, resident = 0, 0
+        for path in reference_files(ref_dir):
+            size = os.path.getsize(path)
+            if size < MINCORE_sample:
+                continue
+            in_cache = resident_bytes(path)
+            if in_cache is None:
+                return None
+            total, resident = total + size, resident + in_cache
+        return min(resident / total, 1.0) if total else None
+
+    def is_hot(self, ref_dir: str) -> bool:
+        try:
+            fraction = self.resident_fraction(ref_dir)
+        except OSError:
+            fraction = None
+        if fraction is not None:
+            return fraction >= self.min_resident
+        warmed = self._warmed.get(ref_dir)
+        return warmed is not None and time.time() - warmed < self.hot_seconds
+
+    def _warm(self, ref_dir: str) -> Tuple[str, int, float]:
+        start   =   time.perf_counter()
+        files   =   reference_files(ref_dir)
+        with span('3.1.2 Reference warm', reference=ref_dir, files=len(files)) as warm_span:
+            # файлы одного референса - последовательно (одно потоковое чтение), разные референсы - параллельно
+            total = sum(warm_file(path, self.read) for path in files)
+            warm_span.set(read_bytes_total=total)
+        with self._lock:
+            self._warmed[ref_dir] = time.time()
+        return ref_dir, total, time.perf_counter() - start
+
+    def warm_async(self, ref_dir: str) -> Optional[Future]:
+        """Прогрев в фоне; None - референс уже горячий"""
+        with self._lock:
+            future = self._warming.get(ref_dir)
+            if future is not None and not future.done():
+                return future
+        if self.is_hot(ref_dir):
+            with self._lock:
+                self._warmed[ref_dir] = time.time()
+            return None
+        future = self._executor.submit(self._warm, ref_dir)
+        with self._lock:
+            self._warming[ref_dir] = future
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def group_by_reference(order: List[str], flowcell_sample_processed: Dict[str, Dict[str, Any]]) -> List[Tuple[str, List[str]]]:
+    """Образцы с общим референсом подряд; группы - в порядке первого образца (порядок плана сохраняется)"""
+    groups: Dict[str, List[str]] = {}
+    for key in order:
+        groups.setdefault(flowcell_sample_processed[key]['Path to refs'], []).append(key)
+    return list(groups.items())
@@ -0,0 +1,292 @@
+"""
+Реестр референсов: список из TypeConfig._get_params(), манифесты, проверка и подгрузка с Ceph.
+
+    registry = ReferenceRegistry.from_config()
+    registry.verify_all_async()                         # run.main: проверка в фоне
+    registry.ensure(['SG_scRNA_GRCh38'])                # перед загрузкой флоуселла
+
+Манифест '1.Data/Info/ref_manifests/<ref>.json' - список файлов с размерами и sha256, строится один раз
+по копии на Ceph (если доступна) или по локальной копии. Проверка локальной копии: все файлы на месте,
+размеры совпадают, sha256 совпадает; sha256 пересчитывается только для файлов, у которых изменились
+размер или mtime с прошлой проверки ('1.Data/Info/ref_verify_cache.json').
+Отсутствующий или повреждённый референс копируется с Ceph (rsync) и проверяется заново.
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+import subprocess
+from glob import glob
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+HASH_block      =   8 * 1024 ** 2
+SKIP_names      =   {'.rsync-partial'}
+
+
+class RefStatus(NamedTuple):
+    ref: str
+    ok: bool
+    files: int
+    size_bytes: int
+    problems: List[str]         # первые несколько проблем
+    hashed: int                 # файлов, для которых sha256 пересчитан
+
+
+def configured_references() -> Dict[str, List[str]]:
+    """Имя референса -> типы данных, которые его используют"""
+    from main._1_Config.main_config import TypeConfig
+    refs: Dict[str, List[str]] = {}
+    for seq_type in TypeConfig:
+        for value in seq_type._get_params().values():
+            if isinstance(value, dict) and value.get('ref'):
+                refs.setdefault(value['ref'], []).append(seq_type.value)
+    return refs
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_block), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _walk(root: str) -> Dict[str, os.stat_result]:
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if name not in SKIP_names]
+        for name in filenames:
+            if name in SKIP_names:
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                files[os.path.relpath(path, root)] = os.stat(path)
+    return files
+
+
+class ReferenceRegistry:
+    def __init__(self, local_dir: str, ceph_dir: str, manifest_dir: str, threads: int = 8, sync: bool = True):
+        self.local_dir      =   local_dir
+        self.ceph_dir       =   ceph_dir
+        self.manifest_dir   =   manifest_dir
+        self.cache_path     =   os.path.join(os.path.dirname(manifest_dir), 'ref_verify_cache.json')
+        self.sync_enabled   =   sync
+        self.references     =   configured_references()
+        self._executor      =   ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ref-verify')
+        self._lock          =   threading.Lock()
+        self._verifying: Dict[str, Future] = {}
+        self._status: Dict[str, RefStatus] = {}
+        self._cache: Dict[str, List[Any]] = self._load_cache()
+
+    @classmethod
+    def from_config(cls) -> 'ReferenceRegistry':
+        from main._1_Config.main_config import WORKDIR, Paths, RefRegistryParams
+        params = RefRegistryParams.args.value
+        return cls(local_dir    =   Paths.REFS_local_dir.value,
+                   ceph_dir     =   Paths.REFS_ceph_dir.value,
+                   manifest_dir =   f"{WORKDIR}/{Paths.REFS_manifests.value}",
+                   threads      =   params['threads'],
+                   sync         =   params['sync'])
+
+    # ---- кэш проверок: путь -> [size, mtime_ns, sha256]
+    def _load_cache(self) -> Dict[str, List[Any]]:
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with self._lock:
+            snapshot = dict(self._cache)
+        tmp_path = f"{self.cache_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _cached_sha256(self, path: str, st: os.stat_result) -> Tuple[str, bool]:
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2], False
+        digest = sha256_file(path)
+        with self._lock:
+            self._cache[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest, True
+
+    # ---- манифесты
+    def manifest_path(self, ref: str) -> str:
+        return os.path.join(self.manifest_dir, f"{ref}.json")
+
+    def load_manifest(self, ref: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path(ref), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def build_manifest(self, ref: str) -> Optional[Dict[str, Any]]:
+        """По копии на Ceph (эталон), если её нет - по локальной"""
+        source = os.path.join(self.ceph_dir, ref)
+        if not os.path.isdir(source):
+            source = os.path.join(self.local_dir, ref)
+        if not os.path.isdir(source):
+            return None
+        files   =   _walk(source)
+        digests =   dict(zip(files, self._executor.map(lambda rel: self._cached_sha256(os.path.join(source, rel), files[rel])[0],
+                                                       list(files))))
+        manifest = {
+            'ref'       :   ref,
+            'source'    :   source,
+            'created'   :   time.strftime('%Y-%m-%d %H:%M:%S'),
+            'files'     :   {rel: {'size': files[rel].st_size, 'sha256': digests[rel]} for rel in sorted(files)},
+        }
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        with open(self.manifest_path(ref), 'w') as f:
+            json.dump(manifest, f, indent=1)
+        self._save_cache()
+        return manifest
+
+    # ---- проверка
+    def verify(self, ref: str) -> RefStatus:
+        local = os.path.join(self.local_dir, ref)
+        if not os.path.isdir(local):
+            return RefStatus(ref, False, 0, 0, ['missing'], 0)
+        manifest = self.load_manifest(ref) or self.build_manifest(ref)
+        if manifest is None:
+            return RefStatus(ref, False, 0, 0, ['no manifest'], 0)
+        present     =   _walk(local)
+        problems    =   []
+        to_hash     =   []
+        for rel, expected in manifest['files'].items():
+            st = present.get(rel)
+            if st is None:
+                problems.append(f"missing {rel}")
+            elif st.st_size != expected['size']:
+                problems.append(f"size {rel}: {st.st_size} != {expected['size']}")
+            else:
+                to_hash.append((rel, st, expected['sha256']))
+        results = list(self._executor.map(lambda item: (item[0], item[2]) + self._cached_sha256(os.path.join(local, item[0]), item[1]),
+                                          to_hash))
+        hashed = 0
+        for rel, expected, actual, recomputed in results:
+            hashed += recomputed
+            if actual != expected:
+                problems.append(f"sha256 {rel}")
+        if hashed:
+            self._save_cache()
+        size = sum(entry['size'] for entry in manifest['files'].values())
+        return RefStatus(ref, not problems, len(manifest['files']), size, problems[:5], hashed)
+
+    def verify_async(self, ref: str) -> Future:
+        with self._lock:
+            future = self._verifying.get(ref)
+            if future is None:
+                future = self._verifying[ref] = threading_future(self._verify_and_store, ref)
+            return future
+
+    def _verify_and_store(self, ref: str) -> RefStatus:
+        status = self.verify(ref)
+        with self._lock:
+            self._status[ref] = status
+        return status
+
+    def verify_all_async(self) -> Dict[str, Future]:
+        """Проверка всех локальных референсов в фоне (отсутствующие подгружаются при первом использовании)"""
+        return {ref: self.verify_async(ref) for ref in self.references
+                if os.path.isdir(os.path.join(self.local_dir, ref))}
+
+    # ---- подгрузка
+    def sync(self, ref: str) -> bool:
+        from main._4_Monitoring.structured_log import log
+        from main._4_Monitoring.instrumentation import span
+        source = os.path.join(self.ceph_dir, ref)
+        if not os.path.isdir(source):
+            log(f"❌[3.0 References] {ref} not found in {self.ceph_dir}")
+            return False
+        target = os.path.join(self.local_dir, ref)
+        os.makedirs(self.local_dir, exist_ok=True)
+        with open(os.path.join(self.local_dir, f".{ref}.sync.lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)        # второй процесс дождётся первой копии
+            log(f"🕒[3.0 References] Syncing {ref} from {source}")
+            with span('3.0 Reference sync', reference=ref) as sync_span:
+                try:
+                    result = subprocess.run(['rsync', '-a', '--delete', '--partial-dir=.rsync-partial',
+                                             f"{source}/", f"{target}/"],
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                    returncode, error = result.returncode, result.stderr.strip()[-500:]
+                except OSError as e:
+                    returncode, error = -1, str(e)
+                if returncode != 0:
+                    sync_span.status = 'failed'
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        if returncode != 0:
+            log(f"❌[3.0 References] rsync {ref} failed: {error}")
+            return False
+        return True
+
+    def ensure(self, refs: List[str]) -> bool:
+        """Все референсы на месте и целы (с подгрузкой с Ceph); False - хотя бы один недоступен"""
+        from main._4_Monitoring.structured_log import log
+        ok = True
+        for ref in sorted(set(refs)):
+            status = self.verify_async(ref).result()
+            if not status.ok and self.sync_enabled:
+                log(f"⚠️[3.0 References] {ref}: {', '.join(status.problems)}")
+                with self._lock:
+                    self._verifying.pop(ref, None)
+                if self.sync(ref):
+                    status = self.verify_async(ref).result()
+            if status.ok:
+                log(f"✅[3.0 References] {ref}: {status.files} files, {status.size_bytes / 1024 ** 3:.1f} GB verified")
+            else:
+                log(f"❌[3.0 References] {ref} is not usable: {', '.join(status.problems)}")
+                ok = False
+        return ok
+
+    def report(self) -> List[RefStatus]:
+        with self._lock:
+            return [self._status[ref] for ref in sorted(self._status)]
+
+
+def threading_future(func, *args) -> Future:
+    """Future, выполняемый в отдельном потоке (проверка сама распределяет хэширование по пулу)"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name='ref-verify-main', daemon=True).start()
+    return future
+
+
+_REGISTRY: Optional[ReferenceRegistry] = None
+
+
+def get_registry() -> ReferenceRegistry:
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = ReferenceRegistry.from_config()
+    return _REGISTRY
+
+
+def admit_references(flowcell_sample_processed: Dict[str, Dict[str, Any]], registry: ReferenceRegistry = None) -> bool:
+    """
+    Референсы всех необработанных образцов флоуселла на месте и целы (недостающие подгружаются с Ceph).
+    False - хотя бы один референс недоступен, флоуселл откладывается.
+    """
+    from main._1_Config.main_config import RefRegistryParams
+    if not RefRegistryParams.args.value['enabled']:
+        return True
+    registry = registry or get_registry()
+    refs = {os.path.basename(value['Path to refs'].rstrip('/')) for value in flowcell_sample_processed.values()
+            if value.get('Path to refs') and not (value.get('Path result html prefix') and glob(value['Path result html prefix']))}
+    return registry.ensure(sorted(refs))
@@ -0,0 +1,174 @@
+"""
+Прогноз времени и памяти образца по истории запусков ('1.Data/Monitoring/tool_profiles.jsonl').
+
+Для каждого ключа (SeqType, версия инструмента, референс) - линейная регрессия по размеру FASTQ (ГБ):
+    cpu_s   ~ a + b * fastq_gb      (работа не зависит от числа ядер)
+    rss_gb  ~ a + b * fastq_gb
+Время на c ядрах = cpu_s / (c * utilization), utilization - медиана cpu_s / (wall_s * cores) по истории.
+Если по ключу мало запусков, используется более общий ключ: (SeqType, инструмент) -> (SeqType,).
+"""
+import os
+import json
+import math
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MIN_runs_regression =   3           # меньше - модель "в среднем на ГБ"
+MEMORY_margin       =   1.3         # запас к прогнозу пикового RSS
+MIN_cores           =   4
+MIN_memory_gb       =   40
+
+
+class Prediction(NamedTuple):
+    cpu_s: float
+    rss_gb: float
+    utilization: float
+    runs: int
+    key: Tuple[str, ...]
+
+    def wall_s(self, cores: int) -> float:
+        return self.cpu_s / max(cores * self.utilization, 1e-6)
+
+
+class SamplePlan(NamedTuple):
+    key: str                        # '<flowcell>:<sample>'
+    cores: int
+    memory_gb: int
+    eta_s: Optional[float]          # None - нет истории
+    prediction: Optional[Prediction]
+
+
+def load_profiles(path: str = None) -> List[Dict[str, Any]]:
+    """Успешные запуски с известным размером FASTQ"""
+    if path is None:
+        from main._1_Config.main_config import WORKDIR, Paths
+        path = f"{WORKDIR}/{Paths.MONITORING_profiles.value}"
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if (record.get('returncode') == 0 and record.get('fastq_bytes')
+                    and record.get('wall_s', 0) > 0 and record.get('cpu_s', 0) > 0):
+                records.append(record)
+    return records
+
+
+def _fit(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """y ~ a + b * x методом наименьших квадратов; при малом числе точек - b = mean(y / x)"""
+    if len(x) >= MIN_runs_regression and np.ptp(x) > 0:
+        (a, b), *_ = np.linalg.lstsq(np.column_stack([np.ones_like(x), x]), y, rcond=None)
+        if b > 0:
+            return float(max(a, 0.0)), float(b)
+    return 0.0, float(np.mean(y / np.maximum(x, 1e-3)))
+
+
+class RuntimeModel:
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self._models: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for record in records:
+            for key in self._keys(record.get('seq_type'), record.get('tool'), record.get('reference')):
+                groups.setdefault(key, []).append(record)
+        for key, group in groups.items():
+            gb          =   np.array([r['fastq_bytes'] / 1024 ** 3 for r in group], dtype=float)
+            cpu         =   np.array([r['cpu_s'] for r in group], dtype=float)
+            rss         =   np.array([r.get('rss_peak_gb', 0.0) for r in group], dtype=float)
+            utilization =   np.array([r['cpu_s'] / (r['wall_s'] * max(r.get('cores') or 1, 1)) for r in group], dtype=float)
+            self._models[key] = {
+                'cpu'           :   _fit(gb, cpu),
+                'rss'           :   _fit(gb, rss),
+                'utilization'   :   float(np.clip(np.median(utilization), 0.05, 1.0)),
+                'runs'          :   len(group),
+            }
+
+    @staticmethod
+    def _keys(seq_type: str, tool: str, reference: str) -> List[Tuple[str, ...]]:
+        return [(seq_type, tool, reference), (seq_type, tool), (seq_type,)]
+
+    @classmethod
+    def from_history(cls, path: str = None) -> 'RuntimeModel':
+        return cls(load_profiles(path))
+
+    def predict(self, seq_type: str, tool: str, reference: str, fastq_bytes: int) -> Optional[Prediction]:
+        if not fastq_bytes:
+            return None
+        gb = fastq_bytes / 1024 ** 3
+        for key in self._keys(seq_type, tool, reference):
+            model = self._models.get(key)
+            if model is None:
+                continue
+            (cpu_a, cpu_b), (rss_a, rss_b) = model['cpu'], model['rss']
+            return Prediction(cpu_s=cpu_a + cpu_b * gb, rss_gb=rss_a + rss_b * gb,
+                              utilization=model['utilization'], runs=model['runs'], key=key)
+        return None
+
+
+def plan_resources(flowcell_sample_processed: Dict[str, Dict[str, Any]],
+                   total_cores: int     =   100,
+                   total_memory: int    =   1000,
+                   max_cores: int       =   30,
+                   max_memory: int      =   300,
+                   model: RuntimeModel  =   None
+                   ) -> Optional[List[SamplePlan]]:
+    """
+    Ядра делятся пропорционально прогнозу cpu_s (все образцы запускаются одновременно и должны закончить
+    примерно вместе), память - по прогнозу пика RSS с запасом. Порядок - самые долгие первыми.
+    None - ни для одного образца нет истории (используется choose_resources).
+    """
+    from main._4_Monitoring.process_sampler import sample_fastq_bytes
+
+    model       =   model or RuntimeModel.from_history()
+    predictions =   {}
+    for key, value in flowcell_sample_processed.items():
+        predictions[key] = model.predict(value['SeqType'], value['Tool version'],
+                                         value['Reference name'], sample_fastq_bytes(value))
+    known = {key: p for key, p in predictions.items() if p is not None}
+    if not known:
+        return None
+
+    # образцы без истории получают среднюю по флоуселлу работу
+    mean_work   =   float(np.mean([p.cpu_s / p.utilization for p in known.values()]))
+    work        =   {key: (p.cpu_s / p.utilization if p else mean_work) for key, p in predictions.items()}
+    total_work  =   sum(work.values())
+    budget      =   max(total_cores, MIN_cores * len(work))
+    cores       =   {key: int(min(max(math.floor(budget * w / total_work), MIN_cores), max_cores)) for key, w in work.items()}
+    # остаток ядер - самым долгим
+    spare = total_cores - sum(cores.values())
+    for key in sorted(work, key=work.get, reverse=True):
+        if spare <= 0:
+            break
+        add = min(max_cores - cores[key], spare)
+        cores[key] += add
+        spare -= add
+
+    even_memory =   int(min(total_memory / len(work), max_memory))
+    memory      =   {}
+    for key, prediction in predictions.items():
+        if prediction:
+            memory[key] = int(min(max(math.ceil(prediction.rss_gb * MEMORY_margin), MIN_memory_gb), max_memory))
+        else:
+            memory[key] = max(even_memory, MIN_memory_gb)
+    if sum(memory.values()) > total_memory:
+        scale   =   total_memory / sum(memory.values())
+        memory  =   {key: max(int(value * scale), MIN_memory_gb) for key, value in memory.items()}
+
+    plans = []
+    for key, prediction in predictions.items():
+        eta = prediction.wall_s(cores[key]) if prediction else None
+        plans.append(SamplePlan(key, cores[key], memory[key], eta, prediction))
+    plans.sort(key=lambda plan: plan.eta_s if plan.eta_s is not None else -1, reverse=True)
+    return plans
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return 'n/a'
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h {rest // 60:02d}m"
@@ -0,0 +1,157 @@
+"""
+Общий STAR-индекс в разделяемой памяти для образцов SeekGene на одном референсе.
+
+    STAR --genomeDir {ref}/star --genomeLoad LoadAndExit      # перед запуском группы образцов
+    seeksoultools rna run ... --star_path {wrapper}           # wrapper добавляет --genomeLoad LoadAndKeep
+    STAR --genomeDir {ref}/star --genomeLoad Remove           # после завершения всех образцов
+
+Wrapper ('{WORKDIR}/1.Data/STAR_shared/<ref>/STAR') вызывает настоящий STAR из сборки seeksoultools.
+Опции, несовместимые с общей памятью (построение индекса, --sjdbGTFfile/--sjdbFileChrStartEnd на лету,
+--twopassMode Basic), передаются без изменений - такой вызов загрузит индекс сам, как раньше.
+"""
+import os
+import re
+import stat
+import atexit
+import shutil
+import hashlib
+import threading
+import weakref
+import subprocess
+from glob import glob
+from typing import Dict, List, Optional
+
+STAR_candidates     =   ['external/conda/bin/STAR', 'bin/STAR', 'STAR']
+WRAPPER_template    =   """#!/bin/bash
+# generated by sc-processing (shared_star.py): attach to the STAR genome kept in shared memory
+REAL_STAR="{star}"
+case " $* " in
+    *" --runMode genomeGenerate "*|*" --genomeLoad "*|*" --sjdbGTFfile "*|*" --sjdbFileChrStartEnd "*|*" --twopassMode Basic "*)
+        exec "$REAL_STAR" "$@" ;;
+    *" --genomeDir "*)
+        extra=(--genomeLoad LoadAndKeep)
+        case " $* " in
+            *"SortedByCoordinate"*) case " $* " in *" --limitBAMsortRAM "*) ;; *) extra+=(--limitBAMsortRAM {bam_sort_ram}) ;; esac ;;
+        esac
+        exec "$REAL_STAR" "$@" "${{extra[@]}}" ;;
+esac
+exec "$REAL_STAR" "$@"
+"""
+_INSTANCES          =   weakref.WeakSet()        # один atexit на процесс, а не на каждый флоуселл (режим демона)
+
+
+def find_star(toolpath: str, star: str = None) -> Optional[str]:
+    """STAR, которым пользуется seeksoultools (одна версия индекса и бинаря обязательна)"""
+    if star:
+        return star if os.access(star, os.X_OK) else None
+    for candidate in STAR_candidates:
+        path = os.path.join(toolpath, candidate)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return shutil.which('STAR')
+
+
+def genome_bytes(genome_dir: str) -> int:
+    return sum(os.path.getsize(path) for name in ('Genome', 'SA', 'SAindex')
+               for path in glob(os.path.join(genome_dir, name)))
+
+
+def shm_limit_bytes() -> Optional[int]:
+    """kernel.shmmax; сегмент STAR не может быть больше"""
+    try:
+        with open('/proc/sys/kernel/shmmax', 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class SharedStarGenome:
+    def __init__(self, workdir: str, bam_sort_ram_gb: int = 20):
+        self.root               =   os.path.join(workdir, '1.Data', 'STAR_shared')
+        self.bam_sort_ram       =   bam_sort_ram_gb * 1024 ** 3
+        self._lock              =   threading.Lock()
+        self._loaded: Dict[str, str] = {}      # genome_dir -> STAR
+        _INSTANCES.add(self)
+
+    @classmethod
+    def from_config(cls) -> 'SharedStarGenome':
+        from main._1_Config.main_config import WORKDIR, SharedStarParams
+        return cls(WORKDIR, SharedStarParams.args.value['bam_sort_ram_gb'])
+
+    def _workspace(self, genome_dir: str) -> str:
+        name = re.sub(r'[^\w.-]', '_', os.path.basename(os.path.dirname(genome_dir.rstrip('/'))))
+        path = os.path.join(self.root, f"{name}_{hashlib.md5(genome_dir.encode()).hexdigest()[:8]}")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _run(self, star: str, genome_dir: str, mode: str) -> subprocess.CompletedProcess:
+        workspace = self._workspace(genome_dir)
+        return subprocess.run([star, '--genomeDir', genome_dir, '--genomeLoad', mode,
+                               '--outFileNamePrefix', f"{workspace}/{mode}_",
+                               '--outSAMtype', 'None'],
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=workspace)
+
+    def wrapper(self, star: str, genome_dir: str) -> str:
+        path = os.path.join(self._workspace(genome_dir), 'STAR')
+        with open(path, 'w') as f:
+            f.write(WRAPPER_template.format(star=star, bam_sort_ram=self.bam_sort_ram))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return path
+
+    def load(self, toolpath: str, genome_dir: str, star: str = None) -> Optional[str]:
+        """
+        Загружает индекс (LoadAndExit) и возвращает путь к wrapper для --star_path.
+        None - общий индекс недоступен (нет STAR, индекс больше shmmax, ошибка загрузки), образцы работают как раньше.
+        """
+        from main._4_Monitoring.structured_log import log
+        from main._4_Monitoring.instrumentation import span
+        with self._lock:
+            if genome_dir in self._loaded:
+                return self.wrapper(self._loaded[genome_dir], genome_dir)
+        star = find_star(toolpath, star)
+        if star is None:
+            log(f"⚠️[3.1.2 STAR shared] STAR not found in {toolpath}, genome is loaded per sample")
+            return None
+        size, limit = genome_bytes(genome_dir), shm_limit_bytes()
+        if limit is not None and size > limit:
+            log(f"⚠️[3.1.2 STAR shared] Genome {genome_dir} ({size / 1024 ** 3:.1f} GB) exceeds kernel.shmmax "
+                f"({limit / 1024 ** 3:.1f} GB), genome is loaded per sample")
+            return None
+        with span('3.1.2 STAR genome load', reference=genome_dir, genome_bytes=size) as load_span:
+            result = self._run(star, genome_dir, 'LoadAndExit')
+            if result.returncode != 0:
+                load_span.status = 'failed'
+        if result.returncode != 0:
+            log(f"⚠️[3.1.2 STAR shared] LoadAndExit failed for {genome_dir}: {result.stdout.strip()[-500:]}")
+            return None
+        with self._lock:
+            self._loaded[genome_dir] = star
+        log(f"✅[3.1.2 STAR shared] Genome {genome_dir} ({size / 1024 ** 3:.1f} GB) loaded into shared memory")
+        return self.wrapper(star, genome_dir)
+
+    def remove(self, genome_dir: str):
+        from main._4_Monitoring.structured_log import log
+        with self._lock:
+            star = self._loaded.pop(genome_dir, None)
+        if star is None:
+            return
+        result = self._run(star, genome_dir, 'Remove')
+        if result.returncode == 0:
+            log(f"🧹[3.1.2 STAR shared] Genome {genome_dir} removed from shared memory")
+        else:
+            log(f"⚠️[3.1.2 STAR shared] Remove failed for {genome_dir} (check 'ipcs -m'): {result.stdout.strip()[-500:]}")
+
+    def remove_all(self):
+        for genome_dir in list(self._loaded):
+            self.remove(genome_dir)
+
+
+@atexit.register
+def _remove_all_instances():
+    for instance in list(_INSTANCES):
+        instance.remove_all()
+
+
+def star_args(wrapper: Optional[str]) -> List[str]:
+    """Аргументы seeksoultools для общего индекса"""
+    return ['--star_path', wrapper] if wrapper else []
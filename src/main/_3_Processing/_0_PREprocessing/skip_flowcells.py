@@ -3,6 +3,8 @@ import warnings
 import time
 import json
 import re
+
+from main._4_Monitoring.structured_log import log
 warnings.filterwarnings("ignore")
 os.environ["PYTHONWARNINGS"] = "ignore"
 
@@ -15,14 +17,14 @@ def load_skip_flowcells(path_to_file:str):
             with open(SKIP_FLOWCELLS_FILE, 'r') as f:
                 data = json.load(f)
                 skip_list = data.get('skip_flowcells', [])
-                print(f"✅[3.0 Skip list] Loaded {len(skip_list)} skip_flowcells")
+                log(f"✅[3.0 Skip list] Loaded {len(skip_list)} skip_flowcells")
                 return skip_list
         except Exception as e:
-            print(f"\033[91m⚠️[3.0 Skip list] Error loading skip_flowcells: {e}\033[0m")
-            print(f"🕐[3.0 Skip list] Creating new file...")
+            log(f"\033[91m⚠️[3.0 Skip list] Error loading skip_flowcells: {e}\033[0m")
+            log(f"🕐[3.0 Skip list] Creating new file...")
             return []
     else:
-        print(f"⚠️[3.0 Skip list] skip_flowcells file does not exist, creating new one")
+        log(f"⚠️[3.0 Skip list] skip_flowcells file does not exist, creating new one")
         # Create initial file with empty list
         initial_data = {
             'skip_flowcells': [
@@ -34,10 +36,10 @@ def load_skip_flowcells(path_to_file:str):
         try:
             with open(SKIP_FLOWCELLS_FILE, 'w') as f:
                 json.dump(initial_data, f, indent=2)
-            print(f"🕐[3.0 Skip list] Created initial skip_flowcells file: {SKIP_FLOWCELLS_FILE}")
+            log(f"🕐[3.0 Skip list] Created initial skip_flowcells file: {SKIP_FLOWCELLS_FILE}")
             return initial_data['skip_flowcells']
         except Exception as e:
-            print(f"\033[91m❌[3.0 Skip list] Error creating skip_flowcells file: {e}\033[0m")
+            log(f"\033[91m❌[3.0 Skip list] Error creating skip_flowcells file: {e}\033[0m")
             return []
 
 def save_skip_flowcells(path_to_file:str,
@@ -51,9 +53,9 @@ def save_skip_flowcells(path_to_file:str,
         }
         with open(SKIP_FLOWCELLS_FILE, 'w') as f:
             json.dump(data, f, indent=2)
-        print(f"\033[92m✅[3.0 Skip list] Skip_flowcells list updated. Total: {len(skip_list)}\033[0m")
+        log(f"\033[92m✅[3.0 Skip list] Skip_flowcells list updated. Total: {len(skip_list)}\033[0m")
     except Exception as e:
-        print(f"\033[91m❌[3.0 Skip list] Error saving skip_flowcells: {e}\033[0m")
+        log(f"\033[91m❌[3.0 Skip list] Error saving skip_flowcells: {e}\033[0m")
 
 def add_to_skip_flowcells(path_to_file:str, 
                         flowcell:str,
@@ -63,6 +65,6 @@ def add_to_skip_flowcells(path_to_file:str,
         skip_list.append(flowcell)
         save_skip_flowcells(path_to_file    =   path_to_file,
                             skip_list       =   skip_list)
-        print(f"\033[91m✅[3.0 Skip list] Added to skip_flowcells: {flowcell} - {reason}\033[0m")
+        log(f"\033[91m✅[3.0 Skip list] Added to skip_flowcells: {flowcell} - {reason}\033[0m")
     else:
-        print(f"\033[93m⚠️[3.0 Skip list] Flowcell {flowcell} already in skip_flowcells list\033[0m")
\ No newline at end of file
+        log(f"\033[93m⚠️[3.0 Skip list] Flowcell {flowcell} already in skip_flowcells list\033[0m")
\ No newline at end of file
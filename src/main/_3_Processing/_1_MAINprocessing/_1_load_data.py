@@ -10,6 +10,9 @@ from main._3_Processing._0_PREprocessing._1_load_data.SampleSheet_load  import
 from main._3_Processing._0_PREprocessing._3_reads_processing.demultiplication    import  bcl2fastq, bcl2fastq_atac
 from main._3_Processing._0_PREprocessing._3_reads_processing.filter_reads_fastp  import  fastp_reads_with_repair
 from main._1_Config.main_config import multiome_pattern
+from main._4_Monitoring.instrumentation import span, traced
+from main._4_Monitoring.metrics_server import BYTES_transferred
+from main._4_Monitoring.structured_log import log
 
 
 def load_fastq_wrapper(args: Tuple) -> bool:
@@ -20,27 +23,30 @@ def load_fastq_wrapper(args: Tuple) -> bool:
 			fastq_files = [f for f in os.listdir(sample_fastq_dir) 
 						  if f.endswith(('.fastq.gz'))]
 			if fastq_files:
-				print(f"ℹ️[3.1.1 Load FASTQ] Files already exist for {flowcell}:{sample_id}")
+				log(f"ℹ️[3.1.1 Load FASTQ] Files already exist for {flowcell}:{sample_id}")
 				return True
-		result = load_fastq(
-			sample_id       =   sample_id,
-			flowcell        =   flowcell,
-			user            =   username,
-			password        =   password,
-			load_fastq      =   fastq_load,
-			save_fastq      =   fastq_save,
-			check_existing  =   True
-		)
+		with span('3.1.1 Load FASTQ', flowcell=flowcell, sample=sample_id):
+			result = load_fastq(
+				sample_id       =   sample_id,
+				flowcell        =   flowcell,
+				user            =   username,
+				password        =   password,
+				load_fastq      =   fastq_load,
+				save_fastq      =   fastq_save,
+				check_existing  =   True
+			)
+		if result and os.path.isdir(sample_fastq_dir):
+			BYTES_transferred.inc(sum(entry.stat().st_size for entry in os.scandir(sample_fastq_dir) if entry.is_file()), kind='fastq')
 		return bool(result)
 	except Exception as e:
-		print(f"❌[3.1.1 Load FASTQ Wrapper] Error for {flowcell}:{sample_id}: {str(e)}")
+		log(f"❌[3.1.1 Load FASTQ Wrapper] Error for {flowcell}:{sample_id}: {str(e)}")
 		return False
 
 def load_fastq_parallel(
 		args_list: List[Tuple], 
 		max_workers: int = 5) -> Dict[Tuple, bool]:
 	results = {}
-	print(f"🕒[3.1.1 Load FASTQ Parallel] Parallel loading of {len(args_list)} samples")
+	log(f"🕒[3.1.1 Load FASTQ Parallel] Parallel loading of {len(args_list)} samples")
 	
 	with ThreadPoolExecutor(max_workers=max_workers) as executor:
 		future_to_args = {}
@@ -59,19 +65,20 @@ def load_fastq_parallel(
 				else:
 					results[args] = bool(result)
 				if results[args]:
-					print(f"✅[3.1.1 Load FASTQ {completed}/{len(args_list)}] Success: {flowcell}:{sample_id}")
+					log(f"✅[3.1.1 Load FASTQ {completed}/{len(args_list)}] Success: {flowcell}:{sample_id}")
 				else:
-					print(f"❌[3.1.1 Load FASTQ {completed}/{len(args_list)}] Failed: {flowcell}:{sample_id}")        
+					log(f"❌[3.1.1 Load FASTQ {completed}/{len(args_list)}] Failed: {flowcell}:{sample_id}")        
 			except Exception as e:
-				print(f"❌[3.1.1 Load FASTQ Parallel] Error for {flowcell}:{sample_id}: {str(e)}")
+				log(f"❌[3.1.1 Load FASTQ Parallel] Error for {flowcell}:{sample_id}: {str(e)}")
 				results[args] = False
 	success_count = 0
 	for value in results.values():
 		if isinstance(value, bool) and value:
 			success_count += 1
-	print(f"✅[3.1.1 Load FASTQ Parallel] Total: {success_count}/{len(args_list)} samples loaded successfully")
+	log(f"✅[3.1.1 Load FASTQ Parallel] Total: {success_count}/{len(args_list)} samples loaded successfully")
 	return results
 
+@traced('3.1.1 Load flowcell')
 def load_flowcell(
 		flowcell_sample_processed: Dict,
 		bcl_load:   str, 
@@ -94,38 +101,82 @@ def load_flowcell(
 	seq_types   =   [x.get('SeqType', '') for x in flowcell_sample_processed.values()]
 	atac_keys   =   'SC_TENX_ATAC' in seq_types
 	flRNA_keys  =   'SC_SeekGene_FullRNA' in seq_types
-	print(f"🕒[3.1.1 Load flowcell] Starting '{type_load_data}' loading for {len(flowcells)} flowcells")
+	log(f"🕒[3.1.1 Load flowcell] Starting '{type_load_data}' loading for {len(flowcells)} flowcells")
 	if type_load_data == 'bcl':
 		for flowcell_full in flowcells:
-			print(f"🕒[3.1.1 Load BCL] Processing flowcell: {flowcell_full}")
+			log(f"🕒[3.1.1 Load BCL] Processing flowcell: {flowcell_full}")
 			if re.match(multiome_pattern, flowcell_full):
 				flowcell_parts = flowcell_full.split('-')
-				print(f"🕒[3.1.1 Load BCL] Multiome detected: {flowcell_parts}")
+				log(f"🕒[3.1.1 Load BCL] Multiome detected: {flowcell_parts}")
 				for fc_part in flowcell_parts:
-					print(f"🕒[3.1.1 Load BCL] Loading BCL for {fc_part}")
+					log(f"🕒[3.1.1 Load BCL] Loading BCL for {fc_part}")
+					with span('3.1.1 Load BCL', flowcell=fc_part):
+						bcl_res_folder = load_bcl(
+							flowcell=fc_part,
+							user=username,
+							password=password,
+							load_bcl=bcl_load,
+							save_bcl=bcl_save)
+					if bcl_res_folder:
+						log(f"✅[3.1.1 Load BCL] BCL loaded for {fc_part}")
+						if atac_keys:
+							log(f"🕒[3.1.1 Demultiplex] Running bcl2fastq for ATAC: {fc_part}")
+							with span('3.1.1 Demultiplex', flowcell=fc_part, mode='atac'):
+								fastq_res_folder = bcl2fastq_atac(
+									bcl=bcl_res_folder, 
+									fastq=fastq_save)
+						else:
+							log(f"🕒[3.1.1 Demultiplex] Running bcl2fastq: {fc_part}")
+							with span('3.1.1 Demultiplex', flowcell=fc_part):
+								fastq_res_folder = bcl2fastq(
+									bcl=bcl_res_folder, 
+									fastq=fastq_save)
+						if flRNA_keys and filter_reads and fastq_res_folder:
+							log(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA: {fc_part}")
+							with span('3.1.1 Filter reads', flowcell=fc_part):
+								fastq_res_folder = fastp_reads_with_repair(
+									fastq_save=fastq_save,
+									flowcell=fc_part,
+									core=core,
+									min_length=min_length,
+									max_len1=max_len1,
+									more_arg=[],
+									run_repair=True,
+									parallel_samples=filter_parallel_samples
+								)
+						results[fc_part] = bool(fastq_res_folder)
+					else:
+						log(f"❌[3.1.1 Load BCL] Failed to load BCL for {fc_part}")
+						results[fc_part] = False
+			else:
+				log(f"🕒[3.1.1 Load BCL] Loading BCL for {flowcell_full}")
+				with span('3.1.1 Load BCL', flowcell=flowcell_full):
 					bcl_res_folder = load_bcl(
-						flowcell=fc_part,
+						flowcell=flowcell_full,
 						user=username,
 						password=password,
 						load_bcl=bcl_load,
 						save_bcl=bcl_save)
-					if bcl_res_folder:
-						print(f"✅[3.1.1 Load BCL] BCL loaded for {fc_part}")
-						if atac_keys:
-							print(f"🕒[3.1.1 Demultiplex] Running bcl2fastq for ATAC: {fc_part}")
+				if bcl_res_folder:
+					log(f"✅[3.1.1 Load BCL] BCL loaded for {flowcell_full}")
+					if atac_keys:
+						log(f"🕒[3.1.1 Demultiplex] Running bcl2fastq for ATAC: {flowcell_full}")
+						with span('3.1.1 Demultiplex', flowcell=flowcell_full, mode='atac'):
 							fastq_res_folder = bcl2fastq_atac(
 								bcl=bcl_res_folder, 
 								fastq=fastq_save)
-						else:
-							print(f"🕒[3.1.1 Demultiplex] Running bcl2fastq: {fc_part}")
+					else:
+						log(f"🕒[3.1.1 Demultiplex] Running bcl2fastq: {flowcell_full}")
+						with span('3.1.1 Demultiplex', flowcell=flowcell_full):
 							fastq_res_folder = bcl2fastq(
 								bcl=bcl_res_folder, 
 								fastq=fastq_save)
-						if flRNA_keys and filter_reads and fastq_res_folder:
-							print(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA: {fc_part}")
+					if flRNA_keys and filter_reads and fastq_res_folder:
+						log(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA: {flowcell_full}")
+						with span('3.1.1 Filter reads', flowcell=flowcell_full):
 							fastq_res_folder = fastp_reads_with_repair(
 								fastq_save=fastq_save,
-								flowcell=fc_part,
+								flowcell=flowcell_full,
 								core=core,
 								min_length=min_length,
 								max_len1=max_len1,
@@ -133,49 +184,13 @@ def load_flowcell(
 								run_repair=True,
 								parallel_samples=filter_parallel_samples
 							)
-						results[fc_part] = bool(fastq_res_folder)
-					else:
-						print(f"❌[3.1.1 Load BCL] Failed to load BCL for {fc_part}")
-						results[fc_part] = False
-			else:
-				print(f"🕒[3.1.1 Load BCL] Loading BCL for {flowcell_full}")
-				bcl_res_folder = load_bcl(
-					flowcell=flowcell_full,
-					user=username,
-					password=password,
-					load_bcl=bcl_load,
-					save_bcl=bcl_save)
-				if bcl_res_folder:
-					print(f"✅[3.1.1 Load BCL] BCL loaded for {flowcell_full}")
-					if atac_keys:
-						print(f"🕒[3.1.1 Demultiplex] Running bcl2fastq for ATAC: {flowcell_full}")
-						fastq_res_folder = bcl2fastq_atac(
-							bcl=bcl_res_folder, 
-							fastq=fastq_save)
-					else:
-						print(f"🕒[3.1.1 Demultiplex] Running bcl2fastq: {flowcell_full}")
-						fastq_res_folder = bcl2fastq(
-							bcl=bcl_res_folder, 
-							fastq=fastq_save)
-					if flRNA_keys and filter_reads and fastq_res_folder:
-						print(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA: {flowcell_full}")
-						fastq_res_folder = fastp_reads_with_repair(
-							fastq_save=fastq_save,
-							flowcell=flowcell_full,
-							core=core,
-							min_length=min_length,
-							max_len1=max_len1,
-							more_arg=[],
-							run_repair=True,
-							parallel_samples=filter_parallel_samples
-						)
 					results[flowcell_full] = bool(fastq_res_folder)
 				else:
-					print(f"❌[3.1.1 Load BCL] Failed to load BCL for {flowcell_full}")
+					log(f"❌[3.1.1 Load BCL] Failed to load BCL for {flowcell_full}")
 					results[flowcell_full] = False
 	
 	elif type_load_data == 'fastq':
-		print(f"🕒[3.1.1 Load SampleSheet] Loading SampleSheet for {len(flowcells)} flowcells")
+		log(f"🕒[3.1.1 Load SampleSheet] Loading SampleSheet for {len(flowcells)} flowcells")
 
 		flowcell_samplesheet_status = {}
 		for flowcell_full in flowcells:
@@ -243,11 +258,12 @@ def load_flowcell(
 
 		if  len(fastq_args_list) == 0:
 			return results
-		fastq_results = load_fastq_parallel(
-							args_list       =   fastq_args_list, 
-							max_workers     =   fastq_parallel_workers)
+		with span('3.1.1 Load FASTQ Parallel', samples=len(fastq_args_list)):
+			fastq_results = load_fastq_parallel(
+								args_list       =   fastq_args_list, 
+								max_workers     =   fastq_parallel_workers)
 		if flRNA_keys and filter_reads:
-			print(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA samples")
+			log(f"🕒[3.1.1 Filter reads] Filtering reads for FullRNA samples")
 			flowcell_samples = {}
 			for (sample_id, flowcell, *_), success in fastq_results.items():
 				if success:
@@ -256,17 +272,18 @@ def load_flowcell(
 					flowcell_samples[flowcell].append(sample_id)
 			for flowcell, samples in flowcell_samples.items():
 				if samples:
-					print(f"🕒[3.1.1 Filter reads] Processing {len(samples)} samples for {flowcell}")
-					fastp_reads_with_repair(
-						fastq_save          =   fastq_save,
-						flowcell            =   flowcell,
-						core                =   core,
-						min_length          =   min_length,
-						max_len1            =   max_len1,
-						more_arg            =   [],
-						run_repair          =   True,
-						parallel_samples    =   filter_parallel_samples
-					)
+					log(f"🕒[3.1.1 Filter reads] Processing {len(samples)} samples for {flowcell}")
+					with span('3.1.1 Filter reads', flowcell=flowcell, samples=len(samples)):
+						fastp_reads_with_repair(
+							fastq_save          =   fastq_save,
+							flowcell            =   flowcell,
+							core                =   core,
+							min_length          =   min_length,
+							max_len1            =   max_len1,
+							more_arg            =   [],
+							run_repair          =   True,
+							parallel_samples    =   filter_parallel_samples
+						)
 		for (s_id, flowcell, *_), success in fastq_results.items():
 			if s_id in dict_for_cellplex:
 				key_sample = dict_for_cellplex[s_id]
@@ -276,10 +293,10 @@ def load_flowcell(
 			key = f"{flowcell}:{key_sample}"
 			results[key] = success
 	else:
-		print(f"❌[3.1.1 Load flowcell] Unknown loading type: {type_load_data}")
+		log(f"❌[3.1.1 Load flowcell] Unknown loading type: {type_load_data}")
 	success_count = 0
 	for value in results.values():
 		if isinstance(value, bool) and value:
 			success_count += 1
-	print(f"✅[3.1.1 Load flowcell] Loading completed. Success: {success_count}/{len(results)}")
+	log(f"✅[3.1.1 Load flowcell] Loading completed. Success: {success_count}/{len(results)}")
 	return results
\ No newline at end of file
@@ -6,6 +6,7 @@ import scparadise
 import matplotlib.pyplot as plt
 import sys
 import os
+import re
 import traceback
 import logging
 from io import StringIO
@@ -18,7 +19,22 @@ import time
 import inspect
 
 from main._3_Processing._2_POSTprocessing.scRNA_adata._ann_scparadise 	import process_annotation
+from main._3_Processing._2_POSTprocessing.scRNA_adata._plot_annotation 	import pending_plot_caches, render_annotation_plots
 from main._3_Processing._0_PREprocessing._4_process_flowcell.resource 	import choose_resources, dynamic_import
+from main._3_Processing._0_PREprocessing._4_process_flowcell.runtime_model import plan_resources, format_duration
+from main._3_Processing._0_PREprocessing._4_process_flowcell.reference_cache import ReferenceCache, group_by_reference
+from main._3_Processing._0_PREprocessing._4_process_flowcell.shared_star import SharedStarGenome, star_args
+from main._3_Processing._2_POSTprocessing.bam_to_cram                   import convert_sample_bams
+from main._1_Config.main_config                                         import CramParams, StallParams, RefCacheParams, SharedStarParams
+from main._4_Monitoring.instrumentation                                 import span, traced, record_span
+from main._4_Monitoring.metrics_server                                  import SAMPLES_queued, SAMPLES_running, SAMPLES_stalled
+from main._4_Monitoring.process_sampler                                 import ProcessTreeSampler, series_path, sample_fastq_bytes
+from main._4_Monitoring.structured_log                                  import log, pool_options
+from main._4_Monitoring.tool_log_follower                               import ToolLogFollower, kill_process_tree, release_pipestance
+
+POLL_interval   =   30
+
+@traced('3.1.2 Processing')
 def processing_flowcell(
     flowcell_sample_processed:dict,
     core:int            =   None,
@@ -31,153 +47,384 @@ def processing_flowcell(
     unique_organisms_name   =   list({sample_data['Organism'] for sample_data in flowcell_sample_processed.values()})
     unique_typeseqs         =   list({sample_data['SeqType'] for sample_data in flowcell_sample_processed.values()})
 
+    sample_plans    =   {}
     if core == None and mem == None:
         per_sample_core, per_sample_mem     =   choose_resources(samples_num)
+        to_run  =   {key: value for key, value in flowcell_sample_processed.items()
+                     if not glob(value['Path result html prefix'])}
+        try:
+            plans = plan_resources(to_run) if to_run else None
+        except Exception as e:
+            log(f"⚠️[3.1.2 Processing] Runtime prediction failed, static resources are used: {e}")
+            plans = None
+        if plans:
+            sample_plans = {plan.key: plan for plan in plans}
     else:
         per_sample_core, per_sample_mem     =   core, mem
 
-    total_core      =   max(per_sample_core * samples_num, 4)   # Minimum 4 cores per sample
-    total_memory    =   max(per_sample_mem * samples_num, 40)   # Minimum 40 GB RAM per sample
+    if sample_plans:
+        total_core      =   sum(plan.cores for plan in sample_plans.values())
+        total_memory    =   sum(plan.memory_gb for plan in sample_plans.values())
+        etas            =   [plan.eta_s for plan in sample_plans.values() if plan.eta_s is not None]
+        flowcell_eta    =   max(etas) if etas else None
+        # самые долгие образцы запускаются первыми
+        order           =   list(sample_plans) + [key for key in flowcell_sample_processed if key not in sample_plans]
+    else:
+        total_core      =   max(per_sample_core * samples_num, 4)   # Minimum 4 cores per sample
+        total_memory    =   max(per_sample_mem * samples_num, 40)   # Minimum 40 GB RAM per sample
+        flowcell_eta    =   None
+        order           =   list(flowcell_sample_processed)
 
    
-    print( "┌───────────────────────────────────────────────────────────────────────────────────────────────────────────────┐")
-    print( "│              3.1.2 Flowcell processing info                                                                   │")
-    print( "├───────────────────────────────────────────────────────────────────────────────────────────────────────────────┤")
-    print(f"│ ℹ️ Start to processed flowcells_:   {unique_flowcells}")
-    print(f"│ ℹ️ Sample number________________:   {samples_num}")
-    print(f"│ ℹ️ Organism reference___________:   {unique_organisms_name}")
-    print(f"│ ℹ️ Type seq_____________________:   {unique_typeseqs}")
-    print(f"│ ⚙️ Total resources allocated____:   {total_core} cores, {total_memory} GB RAM")
-    print(f"│ ⚙️ Resources per sample_________:   {per_sample_core} cores, {per_sample_mem} GB RAM")
-    print( "└───────────────────────────────────────────────────────────────────────────────────────────────────────────────┘")
+    log( "┌───────────────────────────────────────────────────────────────────────────────────────────────────────────────┐")
+    log( "│              3.1.2 Flowcell processing info                                                                   │")
+    log( "├───────────────────────────────────────────────────────────────────────────────────────────────────────────────┤")
+    log(f"│ ℹ️ Start to processed flowcells_:   {unique_flowcells}")
+    log(f"│ ℹ️ Sample number________________:   {samples_num}")
+    log(f"│ ℹ️ Organism reference___________:   {unique_organisms_name}")
+    log(f"│ ℹ️ Type seq_____________________:   {unique_typeseqs}")
+    log(f"│ ⚙️ Total resources allocated____:   {total_core} cores, {total_memory} GB RAM")
+    if sample_plans:
+        for plan in sample_plans.values():
+            source = f"{plan.prediction.runs} runs" if plan.prediction else 'no history'
+            log(f"│ ⚙️ {plan.key.split(':')[-1]:<28}:   {plan.cores} cores, {plan.memory_gb} GB RAM, ETA {format_duration(plan.eta_s)} ({source})")
+        log(f"│ 🕒 Predicted flowcell ETA_______:   {format_duration(flowcell_eta)}")
+    else:
+        log(f"│ ⚙️ Resources per sample_________:   {per_sample_core} cores, {per_sample_mem} GB RAM")
+    log( "└───────────────────────────────────────────────────────────────────────────────────────────────────────────────┘")
     
     processes: List[subprocess.Popen]       =   []
     log_files                               =   []
     ceph_paths: List[str]                   =   []
     sample_log_map: Dict[str, Any]          =   {}
+    running: Dict[str, Tuple[subprocess.Popen, Any, dict, float, int, int]] = {}
     
     successful_samples: List[str]           =   []
     already_processed_samples: List[str]    =   []
     failed_samples: List[str]               =   [] 
-    for key, value in flowcell_sample_processed.items():
-        os.makedirs(os.path.dirname(value['Path local results']), 
-                    exist_ok=True)
-        os.makedirs(value['Path local results'], 
-                    exist_ok=True)
+    sampler                                 =   ProcessTreeSampler()
+    ref_cache                               =   None
+    shared_star                             =   None
+    try:
+        sampler.start()
+        stall_params                            =   StallParams.args.value
+        followers: Dict[str, ToolLogFollower]   =   {}
+        restarts: Dict[str, int]                =   {}
+
+        def watch_sample(sample_id: str, proc: subprocess.Popen, log_file, value: dict, sample_core: int, sample_mem: int):
+            running[sample_id] = (proc, log_file, value, time.time(), sample_core, sample_mem)
+            SAMPLES_running.set(len(running))
+            followers[sample_id] = ToolLogFollower(sample_id, log_file.name,
+                                                   stall_minutes    =   stall_params['minutes'],
+                                                   cpu_percent      =   stall_params['cpu_percent'])
+            sampler.watch(sample_id, proc.pid, series_path(value),
+                          flowcell      =   value['Flowcell'],
+                          sample        =   sample_id,
+                          seq_type      =   value['SeqType'],
+                          tool          =   value['Tool version'],
+                          reference     =   value['Reference name'],
+                          cores         =   sample_core,
+                          memory_gb     =   sample_mem,
+                          fastq_bytes   =   sample_fastq_bytes(value))
+
+        def handle_stall(sample_id: str):
+            """Останавливает зависший инструмент и перезапускает его (не больше retries раз)"""
+            proc, log_file, value, started, sample_core, sample_mem = running[sample_id]
+            follower = followers[sample_id]
+            cpu = sampler.cpu_percent(sample_id)
+            if cpu is None:
+                if not follower.reported:
+                    log(f"⚠️[3.1.2 Progress] {sample_id}: no log output for {follower.idle_seconds() / 60:.0f} min "
+                        f"at {follower.progress()}, CPU is not measured - process is kept")
+                    follower.reported = True
+                return
+            log(f"⚠️[3.1.2 Progress] {sample_id}: stalled for {follower.idle_seconds() / 60:.0f} min at "
+                f"{follower.progress()}, CPU {cpu:.0f}%, last line: {follower.last_line[:200]}")
+            kill_process_tree(proc)
+            if restarts.get(sample_id, 0) >= stall_params['retries']:
+                SAMPLES_stalled.inc(action='failed')
+                return      # завершение обработается в цикле опроса как ошибка
+            restarts[sample_id] = restarts.get(sample_id, 0) + 1
+            SAMPLES_stalled.inc(action='restarted')
+            del running[sample_id]
+            log_file.close()
+            sampler.finish(sample_id, returncode=proc.returncode, stalled=True)
+            record_span('3.1.2 Tool run', started, time.time(),
+                        status      =   'stalled',
+                        flowcell    =   value['Flowcell'],
+                        sample      =   sample_id,
+                        returncode  =   proc.returncode)
+            if os.path.exists(log_file.name):
+                os.replace(log_file.name, re.sub(r'\.log$', '', log_file.name) + f'.stalled{restarts[sample_id]}.log')
+            release_pipestance(value)
+            new_proc, new_log_file, _ = process_sample(sample_processed  =   value,
+                                                       core              =   sample_core,
+                                                       memory            =   sample_mem,
+                                                       more_arg          =   sample_star_args(value))
+            if new_proc is None:
+                if new_log_file:
+                    new_log_file.close()
+                log(f"❌[3.1.2 Progress] {sample_id}: restart failed")
+                failed_samples.append(sample_id)
+                SAMPLES_running.set(len(running))
+                return
+            log(f"🔄[3.1.2 Progress] {sample_id}: restarted ({restarts[sample_id]}/{stall_params['retries']})")
+            watch_sample(sample_id, new_proc, new_log_file, value, sample_core, sample_mem)
+
+
+        # образцы с общим референсом запускаются подряд, холодные референсы прогреваются в фоне заранее
+        groups          =   group_by_reference(order, flowcell_sample_processed)
+        order           =   [key for _, keys in groups for key in keys]
+        ref_cache       =   ReferenceCache.from_config() if RefCacheParams.args.value['enabled'] else None
+        ref_warming     =   {}
+        cold_refs       =   set()
+        pending_refs    =   {ref_dir: [key for key in keys if not glob(flowcell_sample_processed[key]['Path result html prefix'])]
+                             for ref_dir, keys in groups}
+        if ref_cache:
+            for ref_dir, keys in pending_refs.items():
+                if keys:
+                    ref_warming[ref_dir] = ref_cache.warm_async(ref_dir)
+
+        # SeekGene на общем референсе: один STAR-индекс в разделяемой памяти на группу
+        star_params     =   SharedStarParams.args.value
+        shared_star     =   SharedStarGenome.from_config() if star_params['enabled'] else None
+        star_wrappers: Dict[str, Optional[str]] = {}
+
+        def sample_star_args(value: Dict[str, Any]) -> List[str]:
+            # wrapper только для типов, которые выравниваются STAR'ом (VDJ и прочие запускаются как раньше)
+            if value['SeqType'] not in star_params['seq_types']:
+                return []
+            return star_args(star_wrappers.get(value['Path to refs']))
+
+        SAMPLES_queued.set(len(order))
+        for key in order:
+            value       =   flowcell_sample_processed[key]
+            ref_dir     =   value['Path to refs']
+            warming     =   ref_warming.pop(ref_dir, None)
+            if warming is not None:
+                try:
+                    _, warmed_bytes, seconds = warming.result()
+                    log(f"🔥[3.1.2 Reference] Warmed {ref_dir}: {warmed_bytes / 1024 ** 3:.1f} GB in {seconds:.0f}s")
+                except Exception as e:
+                    log(f"⚠️[3.1.2 Reference] Warming {ref_dir} failed, launches are staggered: {e}")
+                    cold_refs.add(ref_dir)
+            elif ref_cache is None:
+                cold_refs.add(ref_dir)
+            if (shared_star and ref_dir not in star_wrappers and value['SeqType'] in star_params['seq_types']
+                    and sum(flowcell_sample_processed[pending]['SeqType'] in star_params['seq_types']
+                            for pending in pending_refs.get(ref_dir, [])) >= star_params['min_samples']):
+                star_wrappers[ref_dir] = shared_star.load(toolpath      =   value['Path install tool'],
+                                                          genome_dir    =   f"{ref_dir}/star",
+                                                          star          =   star_params['star'])
+            plan        =   sample_plans.get(key)
+            sample_core =   plan.cores if plan else per_sample_core
+            sample_mem  =   plan.memory_gb if plan else per_sample_mem
+            os.makedirs(os.path.dirname(value['Path local results']), 
+                        exist_ok=True)
+            os.makedirs(value['Path local results'], 
+                        exist_ok=True)
         
-        sample_id   =   value['Sample_ID']
-        # Output : run_process, log_file, ceph_res
-        proc, log_file, ceph_path = process_sample(
-                    sample_processed            =   value,
-                    core                        =   per_sample_core,
-                    memory                      =   per_sample_mem
-        )
-        postfix_path_res    =   value['Path result html prefix']    #
-        existing_results    =   glob(postfix_path_res)              # '/mnt/raid0/ofateev/projects/SC_auto/2.Results/SG/scRNA/240411_A01022_0750_AHNFHFDRXY/962000685201_h/*_report.html'
-        if existing_results:
-            already_processed_samples.append(sample_id)
-            print(f"✅[3.1.2 Processing] Results already exist for {sample_id}.")
-        if proc != None:
-            print(f"🕐[3.1.2 Processing] Process {sample_id} started.")
-        if proc and log_file:
-            processes.append(proc)
-            log_files.append(log_file)
-            ceph_paths.append(ceph_path)
-        sample_log_map[sample_id] = {
-            'log_file'      :   log_file,
-            'ceph_path'     :   ceph_path,
-            'seq_type'      :   value['SeqType'],
-            'flowcell'      :   value['Flowcell'],
-            'organism'      :   value['Reference name'],
-            'organism_name' :   value['Organism'],
-            'tissue'        :   value['Tissue'],
-            'row_index'     :   len(processes) - 1}
-        time.sleep(2)
+            sample_id   =   value['Sample_ID']
+            # Output : run_process, log_file, ceph_res
+            proc, log_file, ceph_path = process_sample(
+                        sample_processed            =   value,
+                        core                        =   sample_core,
+                        memory                      =   sample_mem,
+                        more_arg                    =   sample_star_args(value)
+            )
+            postfix_path_res    =   value['Path result html prefix']    #
+            existing_results    =   glob(postfix_path_res)              # '/mnt/raid0/ofateev/projects/SC_auto/2.Results/SG/scRNA/240411_A01022_0750_AHNFHFDRXY/962000685201_h/*_report.html'
+            if existing_results:
+                already_processed_samples.append(sample_id)
+                log(f"✅[3.1.2 Processing] Results already exist for {sample_id}.")
+            if proc != None:
+                log(f"🕐[3.1.2 Processing] Process {sample_id} started.")
+            if proc and log_file:
+                processes.append(proc)
+                log_files.append(log_file)
+                ceph_paths.append(ceph_path)
+                watch_sample(sample_id, proc, log_file, value, sample_core, sample_mem)
+            sample_log_map[sample_id] = {
+                'log_file'      :   log_file,
+                'ceph_path'     :   ceph_path,
+                'seq_type'      :   value['SeqType'],
+                'flowcell'      :   value['Flowcell'],
+                'organism'      :   value['Reference name'],
+                'organism_name' :   value['Organism'],
+                'tissue'        :   value['Tissue'],
+                'row_index'     :   len(processes) - 1}
+            SAMPLES_queued.dec()
+            if proc is not None and ref_dir in cold_refs:
+                time.sleep(2)
 
-    for i, proc in enumerate(processes):
-        proc.wait()
-        sample_id   =   list(sample_log_map.keys())[i]
-        if proc.returncode != 0:
-            print(f"❌[3.1.2 Processing] Process {sample_id} failed with code: {proc.returncode}")
-            failed_samples.append(sample_id)
-        else:
-            print(f"✅[3.1.2 Processing] Process {sample_id} completed successfully.")
-            successful_samples.append(sample_id)
+        cram_params     =   CramParams.args.value
+        cram_executor   =   ThreadPoolExecutor(max_workers=cram_params['parallel']) if cram_params['enabled'] else None
+        cram_futures    =   []
+
+        def submit_cram(sample_data: dict):
+            if cram_executor and 'TENX' in sample_data['SeqType']:
+                cram_futures.append(cram_executor.submit(convert_sample_bams, sample_data, cram_params['threads']))
+
+        for sample_id in already_processed_samples:
+            for sample_data in flowcell_sample_processed.values():
+                if sample_data['Sample_ID'] == sample_id:
+                    submit_cram(sample_data)
+
+        # опрос вместо последовательного wait: конвертация BAM начинается сразу после завершения образца
+        while running:
+            for sample_id, (proc, log_file, sample_data, started, sample_core, sample_mem) in list(running.items()):
+                if proc.poll() is None:
+                    follower = followers[sample_id]
+                    for event in follower.poll():
+                        log(f"🔄[3.1.2 Progress] {sample_id}: {event}")
+                    if stall_params['enabled'] and follower.stalled(sampler.cpu_percent(sample_id)):
+                        handle_stall(sample_id)
+                    continue
+                del running[sample_id]
+                followers[sample_id].poll()
+                SAMPLES_running.set(len(running))
+                log_file.close()
+                usage = sampler.finish(sample_id, returncode=proc.returncode)
+                if usage:
+                    sample_data['Resource usage'] = usage
+                record_span('3.1.2 Tool run', started, time.time(),
+                            status      =   'ok' if proc.returncode == 0 else 'failed',
+                            flowcell    =   sample_data['Flowcell'],
+                            sample      =   sample_id,
+                            seq_type    =   sample_data['SeqType'],
+                            tool        =   sample_data['Tool version'],
+                            returncode  =   proc.returncode,
+                            cores       =   sample_core,
+                            memory_gb   =   sample_mem,
+                            **(usage or {}))
+                if proc.returncode != 0:
+                    log(f"❌[3.1.2 Processing] Process {sample_id} failed with code: {proc.returncode}")
+                    failed_samples.append(sample_id)
+                else:
+                    log(f"✅[3.1.2 Processing] Process {sample_id} completed successfully.")
+                    successful_samples.append(sample_id)
+                    submit_cram(sample_data)
+            if running:
+                time.sleep(POLL_interval)
+        sampler.stop()
+        if ref_cache:
+            ref_cache.shutdown()
+        if shared_star:
+            shared_star.remove_all()
+
+        if cram_executor:
+            for future in concurrent.futures.as_completed(cram_futures):
+                try:
+                    sample_id, success, message = future.result()
+                except Exception as e:
+                    log(f"⚠️[3.1.2 CRAM] Conversion error: {e}")
+                    continue
+                if success:
+                    log(f"✅[3.1.2 CRAM] {sample_id}: {message}")
+                else:
+                    log(f"⚠️[3.1.2 CRAM] {sample_id}: {message}, BAM is kept")
+            cram_executor.shutdown()
     
-    all_successful_samples = successful_samples + already_processed_samples
-    all_processing_successful = len(failed_samples) == 0
+        all_successful_samples = successful_samples + already_processed_samples
+        all_processing_successful = len(failed_samples) == 0
     
-    print("🔄[3.1.2 Processing] Updating sample status...")
-    for sample_id in all_successful_samples:
-        for key, sample_data in flowcell_sample_processed.items():
-            if sample_data['Sample_ID'] == sample_id:
-                if sample_data.get('Processed status') == False:
-                    sample_data['Processed status'] = True
-                    print(f"ℹ️[3.1.2 Processing] Updated 'Processed status' to True for {sample_id}")
-                if 'Annotation status' not in sample_data:
-                    sample_data['Annotation status'] = False
-                    print(f"ℹ️[3.1.2 Processing] Added 'Annotation status' = False for {sample_id}")
-                break
-
-    print("🧬[3.1.2 Processing] Checking samples for annotation...")
-    samples_for_annotation = []
-    if len(all_successful_samples) != 0:
-        print(f"✅[3.1.2 Processing] All successful samples: {all_successful_samples}")
-    for sample_id in all_successful_samples:
-        for key, sample_data in flowcell_sample_processed.items():
-            if sample_data['Organism'] == 'human':
+        log("🔄[3.1.2 Processing] Updating sample status...")
+        for sample_id in all_successful_samples:
+            for key, sample_data in flowcell_sample_processed.items():
                 if sample_data['Sample_ID'] == sample_id:
-                    seq_type    =   sample_data['SeqType']
-                    vdj_type    =   sample_data.get('VDJ type', '')
-                    if seq_type in ['SC_SeekGene_RNA', 'SC_TENX_RNA']:
-                        samples_for_annotation.append(sample_data)
-                        print(f"🧬[3.1.2 Annotation] Sample {sample_id} added for annotation (SeqType: {seq_type})")
-                    elif seq_type == 'SC_SeekGene_VDJ' and vdj_type == '5':
-                        samples_for_annotation.append(sample_data)
-                        print(f"🧬[3.1.2 Annotation] Sample {sample_id} added for annotation (SeqType: {seq_type}, VDJ type: {vdj_type})")
+                    if sample_data.get('Processed status') == False:
+                        sample_data['Processed status'] = True
+                        log(f"ℹ️[3.1.2 Processing] Updated 'Processed status' to True for {sample_id}")
+                    if 'Annotation status' not in sample_data:
+                        sample_data['Annotation status'] = False
+                        log(f"ℹ️[3.1.2 Processing] Added 'Annotation status' = False for {sample_id}")
                     break
 
-    annotation_successful = True
-    annotation_failures = []
+        log("🧬[3.1.2 Processing] Checking samples for annotation...")
+        samples_for_annotation = []
+        if len(all_successful_samples) != 0:
+            log(f"✅[3.1.2 Processing] All successful samples: {all_successful_samples}")
+        for sample_id in all_successful_samples:
+            for key, sample_data in flowcell_sample_processed.items():
+                if sample_data['Organism'] == 'human':
+                    if sample_data['Sample_ID'] == sample_id:
+                        seq_type    =   sample_data['SeqType']
+                        vdj_type    =   sample_data.get('VDJ type', '')
+                        if seq_type in ['SC_SeekGene_RNA', 'SC_TENX_RNA']:
+                            samples_for_annotation.append(sample_data)
+                            log(f"🧬[3.1.2 Annotation] Sample {sample_id} added for annotation (SeqType: {seq_type})")
+                        elif seq_type == 'SC_SeekGene_VDJ' and vdj_type == '5':
+                            samples_for_annotation.append(sample_data)
+                            log(f"🧬[3.1.2 Annotation] Sample {sample_id} added for annotation (SeqType: {seq_type}, VDJ type: {vdj_type})")
+                        break
+
+        annotation_successful = True
+        annotation_failures = []
     
-    if samples_for_annotation:
-        print(f"🧬[3.1.2 Annotation] Starting annotation for {len(samples_for_annotation)} samples...")
-        max_workers = min(len(samples_for_annotation), multiprocessing.cpu_count())
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
+        if samples_for_annotation:
+            log(f"🧬[3.1.2 Annotation] Starting annotation for {len(samples_for_annotation)} samples...")
+            max_workers = min(len(samples_for_annotation), multiprocessing.cpu_count())
+            with span('3.1.2 Annotation', samples=len(samples_for_annotation)), \
+                 ProcessPoolExecutor(max_workers=max_workers, **pool_options()) as executor:
+                futures = []
+                for sample_data in samples_for_annotation:
+                    future = executor.submit(
+                        run_annotation_task,
+                        sample_data =   sample_data,
+                        work_dir    =   work_dir
+                    )
+                    futures.append(future)
+                annotation_results = []
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        result = future.result()
+                        annotation_results.append(result)
+                        sample_id, success, message = result
+                        for key, sample_data in flowcell_sample_processed.items():
+                            if sample_data['Sample_ID'] == sample_id:
+                                sample_data['Annotation status'] = success
+                                break
+                        if success:
+                            log(f"✅[3.1.2 Annotation] Successfully annotated {sample_id}")
+                        else:
+                            log(f"❌[3.1.2 Annotation] Failed to annotate {sample_id}: {message}")
+                            annotation_successful = False
+                            annotation_failures.append(sample_id)
+                    except Exception as e:
+                        log(f"❌[3.1.2 Annotation] Error in annotation task: {str(e)}")
+                        annotation_successful = False
+                        annotation_failures.append("Unknown sample - exception")
+            plot_samples = {}      # кэш -> образец
             for sample_data in samples_for_annotation:
-                future = executor.submit(
-                    run_annotation_task,
-                    sample_data =   sample_data,
-                    work_dir    =   work_dir
-                )
-                futures.append(future)
-            annotation_results = []
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    annotation_results.append(result)
-                    sample_id, success, message = result
-                    for key, sample_data in flowcell_sample_processed.items():
-                        if sample_data['Sample_ID'] == sample_id:
-                            sample_data['Annotation status'] = success
-                            break
-                    if success:
-                        print(f"✅[3.1.2 Annotation] Successfully annotated {sample_id}")
-                    else:
-                        print(f"❌[3.1.2 Annotation] Failed to annotate {sample_id}: {message}")
+                if sample_data.get('Annotation status'):
+                    for cache_path in pending_plot_caches(sample_data['Path local annotation png']):
+                        plot_samples[cache_path] = sample_data
+            if plot_samples:
+                with span('3.1.2 Annotation plots', plots=len(plot_samples)):
+                    plot_results = render_annotation_plots(cache_paths  =   list(plot_samples),
+                                                           max_workers  =   min(len(plot_samples), multiprocessing.cpu_count()))
+                # образец без PNG не готов: флоуселл не отправляется и не считается обработанным, перезапуск дорисует из кэша
+                for cache_path, rendered in plot_results.items():
+                    sample_data = plot_samples[cache_path]
+                    if not rendered and sample_data['Annotation status']:
+                        sample_data['Annotation status'] = False
                         annotation_successful = False
-                        annotation_failures.append(sample_id)
-                except Exception as e:
-                    print(f"❌[3.1.2 Annotation] Error in annotation task: {str(e)}")
-                    annotation_successful = False
-                    annotation_failures.append("Unknown sample - exception")
-        if annotation_failures:
-            print(f"❌[3.1.2 Annotation] Failed annotations: {annotation_failures}")
+                        annotation_failures.append(sample_data['Sample_ID'])
+                        log(f"❌[3.1.2 Annotation] Plot for {sample_data['Sample_ID']} was not rendered from {cache_path}")
+            if annotation_failures:
+                log(f"❌[3.1.2 Annotation] Failed annotations: {annotation_failures}")
         
-        print(f"🧬[3.1.2 Annotation] Completed annotation for {len(samples_for_annotation)} samples")
-    else:
-        print("ℹ️[3.1.2 Annotation] No samples require annotation")
+            log(f"🧬[3.1.2 Annotation] Completed annotation for {len(samples_for_annotation)} samples")
+        else:
+            log("ℹ️[3.1.2 Annotation] No samples require annotation")
+    finally:
+        # ошибка запуска, опроса или перезапуска не должна оставлять опрос процессов, прогрев и STAR-индекс в памяти
+        sampler.stop()
+        if ref_cache:
+            ref_cache.shutdown()
+        if shared_star:
+            shared_star.remove_all()
+
     overall_success = all_processing_successful and annotation_successful
     
     return flowcell_sample_processed, overall_success 
@@ -186,15 +433,17 @@ def processing_flowcell(
 def run_annotation_task(sample_data: Dict[str, Any], 
                         work_dir: str
                         ) -> Tuple[str, bool, str]:
-    return process_annotation(sample_processed  =   sample_data, 
-                              #work_dir          =   work_dir
-                              )
+    with span('3.1.2 Annotation sample', flowcell=sample_data['Flowcell'], sample=sample_data['Sample_ID']):
+        return process_annotation(sample_processed  =   sample_data, 
+                                  #work_dir          =   work_dir
+                                  )
 
 
 def process_sample(
     sample_processed:dict,
     core:       int = 10,
     memory:     int = 100,
+    more_arg:   List[str] = None,
     
 ) -> Tuple[Optional[subprocess.Popen], Optional[Any], Optional[str]]:
  
@@ -219,6 +468,9 @@ def process_sample(
         add_args['cmo_cellplex']        =   sample_processed['CellPlex_CMO']
         add_args['samples_cellplex']    =   sample_processed['CellPlex_ID']
         add_args['plex_cellplex']       =   sample_processed['CellPlex_PLEX']
+
+    if more_arg:
+        add_args['more_arg']            =   more_arg
     
     postfix_path_res    =   sample_processed['Path result html prefix'] # '/mnt/raid0/ofateev/projects/SC_auto/2.Results/SG/scRNA/240411_A01022_0750_AHNFHFDRXY/962000685201_h/*_report.html'
     result_dir          =   sample_processed['Path local results']      # '/mnt/raid0/ofateev/projects/SC_auto/2.Results/SG/scRNA/240411_A01022_0750_AHNFHFDRXY'
@@ -266,6 +518,6 @@ def process_sample(
                                         cwd     =   result_dir)
         return run_process, log_file, ceph_res
     except Exception as e:
-        print(f"❌[3.1.2 Processing] Error processing sample {sample_id}: {e}")
+        log(f"❌[3.1.2 Processing] Error processing sample {sample_id}: {e}")
         #traceback.print_exc()
         return None, None, None
\ No newline at end of file
@@ -0,0 +1,108 @@
+import os
+import time
+import subprocess
+from glob import glob
+from typing import Any, Dict, List, Optional, Tuple
+
+from main._4_Monitoring.instrumentation import span
+
+# BAM cellranger/spaceranger/cellranger-arc, пути относительно директории образца
+BAM_globs       =   [
+                    'outs/possorted_genome_bam.bam',
+                    'outs/gex_possorted_bam.bam',
+                    'outs/atac_possorted_bam.bam',
+                    'outs/per_sample_outs/*/count/sample_alignments.bam',
+                    ]
+FASTA_globs     =   ['fasta/genome.fa', 'fasta/*.fa', 'fasta/*.fasta']
+
+
+def sample_bams(sample_dir: str) -> List[str]:
+    return sorted({bam for pattern in BAM_globs for bam in glob(os.path.join(sample_dir, pattern))})
+
+
+def reference_fasta(ref_dir: str) -> Optional[str]:
+    """FASTA генома из '{Path to refs}' (10X: fasta/genome.fa)"""
+    for pattern in FASTA_globs:
+        found = sorted(glob(os.path.join(ref_dir, pattern)))
+        if found:
+            return found[0]
+    return None
+
+
+def _samtools(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(['samtools', *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def _count_reads(path: str, threads: int, fasta: str = None) -> Optional[int]:
+    args = ['view', '-c', '-@', str(threads)]
+    if fasta:
+        args += ['-T', fasta]
+    result = _samtools(*args, path)
+    return int(result.stdout.strip()) if result.returncode == 0 else None
+
+
+def convert_bam_to_cram(bam_path: str, fasta: str, threads: int = 8) -> Tuple[str, bool, str]:
+    """
+    BAM -> CRAM + .crai рядом с BAM. Число записей сверяется, только после этого BAM и индекс удаляются.
+    Пока проверка не прошла, CRAM лежит во временном файле и не попадёт на Ceph.
+    """
+    start       =   time.perf_counter()
+    cram_path   =   f"{os.path.splitext(bam_path)[0]}.cram"
+    tmp_path    =   f"{cram_path}.tmp"
+    convert     =   _samtools('view', '-C', '-@', str(threads), '-T', fasta, '-o', tmp_path, bam_path)
+    if convert.returncode != 0:
+        _remove(tmp_path)
+        return bam_path, False, f"samtools view failed: {convert.stderr.strip()[:500]}"
+
+    # подсчёт по BAM и по CRAM параллельно
+    with open(os.devnull, 'w') as devnull:
+        bam_count_proc = subprocess.Popen(['samtools', 'view', '-c', '-@', str(max(threads // 2, 1)), bam_path],
+                                          stdout=subprocess.PIPE, stderr=devnull, text=True)
+        cram_count  =   _count_reads(tmp_path, max(threads // 2, 1), fasta)
+        bam_out, _  =   bam_count_proc.communicate()
+    bam_count = int(bam_out.strip()) if bam_count_proc.returncode == 0 else None
+    if bam_count is None or cram_count is None or bam_count != cram_count:
+        _remove(tmp_path)
+        return bam_path, False, f"read count mismatch: BAM {bam_count}, CRAM {cram_count}"
+
+    os.replace(tmp_path, cram_path)
+    index = _samtools('index', '-@', str(threads), cram_path)
+    if index.returncode != 0:
+        _remove(cram_path)
+        return bam_path, False, f"samtools index failed: {index.stderr.strip()[:500]}"
+
+    bam_size = os.path.getsize(bam_path)
+    for path in (bam_path, f"{bam_path}.bai", f"{bam_path}.csi"):
+        _remove(path)
+    cram_size = os.path.getsize(cram_path)
+    return bam_path, True, (f"{bam_count} reads, {bam_size / 1024 ** 3:.2f} GB -> {cram_size / 1024 ** 3:.2f} GB "
+                            f"({time.perf_counter() - start:.0f}s)")
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def convert_sample_bams(sample_processed: Dict[str, Any], threads: int = 8) -> Tuple[str, bool, str]:
+    """Конвертация всех BAM образца; True - BAM нет или все сконвертированы"""
+    sample_id   =   sample_processed['Sample_ID']
+    sample_dir  =   f"{sample_processed['Path local results']}/{sample_id}_{sample_processed['Prefix reference']}"
+    bams        =   sample_bams(sample_dir)
+    if not bams:
+        return sample_id, True, "no BAM files"
+    fasta       =   reference_fasta(sample_processed['Path to refs'])
+    if not fasta:
+        return sample_id, False, f"genome FASTA not found in {sample_processed['Path to refs']}"
+
+    messages, success = [], True
+    for bam in bams:
+        with span('3.1.2 CRAM', flowcell=sample_processed['Flowcell'], sample=sample_id, threads=threads) as cram_span:
+            bam_size = os.path.getsize(bam)
+            _, converted, message = convert_bam_to_cram(bam, fasta, threads)
+            cram_span.set(bam_bytes=bam_size)
+            if not converted:
+                cram_span.status = 'failed'
+        success = success and converted
+        messages.append(f"{os.path.relpath(bam, sample_dir)}: {message}")
+    return sample_id, success, '; '.join(messages)
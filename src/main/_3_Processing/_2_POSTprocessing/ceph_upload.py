@@ -0,0 +1,257 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from main._4_Monitoring.metrics_server import BYTES_uploaded
+from main._4_Monitoring.structured_log import log
+
+CHUNK_size  =   8 * 1024 * 1024
+
+
+def _glob_regex(pattern: str) -> 're.Pattern':
+    """Шаблон относительно корня директории образца: '*' - внутри имени, '**' - любая глубина"""
+    regex, i = '', 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex, i = regex + '(?:.*/)?', i + 3
+        elif pattern.startswith('**', i):
+            regex, i = regex + '.*', i + 2
+        elif pattern[i] == '*':
+            regex, i = regex + '[^/]*', i + 1
+        elif pattern[i] == '?':
+            regex, i = regex + '[^/]', i + 1
+        else:
+            regex, i = regex + re.escape(pattern[i]), i + 1
+    return re.compile(regex + r'\Z')
+
+
+def _matches(rel_path: str, patterns: List['re.Pattern']) -> bool:
+    """Путь совпадает сам или лежит внутри совпавшей директории"""
+    parts = rel_path.split(os.sep)
+    return any(regex.match('/'.join(parts[:i])) for regex in patterns for i in range(1, len(parts) + 1))
+
+
+def retention_excludes(retention: Optional[Dict[str, List[str]]], drop_bam: bool = False) -> List[str]:
+    """Шаблоны профиля хранения, которые не загружаются на Ceph"""
+    if not retention:
+        return []
+    return list(retention.get('drop', [])) + (list(retention.get('bam', [])) if drop_bam else [])
+
+
+def _rsync_exclude(pattern: str) -> str:
+    # '/...' привязывает шаблон к корню передачи, '**/...' - совпадение на любой глубине
+    return f"--exclude={pattern[3:]}" if pattern.startswith('**/') else f"--exclude=/{pattern}"
+
+
+def _local_files(root: str, excludes: List[str] = ()) -> List[str]:
+    """Относительные пути обычных файлов (симлинки не загружаются: rsync --no-links) без исключённых"""
+    patterns    =   [_glob_regex(pattern) for pattern in excludes]
+    files       =   []
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_dir = os.path.relpath(dir_path, root)
+        dir_names[:] = [d for d in dir_names
+                        if not os.path.islink(os.path.join(dir_path, d))
+                        and not _matches(os.path.normpath(os.path.join(rel_dir, d)), patterns)]
+        for file_name in file_names:
+            file_path   =   os.path.join(dir_path, file_name)
+            rel_path    =   os.path.relpath(file_path, root)
+            if not os.path.islink(file_path) and not _matches(rel_path, patterns):
+                files.append(rel_path)
+    return sorted(files)
+
+
+def _excluded_size(root: str, excludes: List[str]) -> int:
+    if not excludes:
+        return 0
+    kept = set(_local_files(root, excludes))
+    return sum(os.path.getsize(os.path.join(root, rel_path)) for rel_path in _local_files(root) if rel_path not in kept)
+
+
+def compress_matching(root: str, compress: List[str], excludes: List[str] = (), threads: int = 4) -> int:
+    """Сжимает файлы профиля хранения на месте (pigz, иначе gzip): 'file' -> 'file.gz'. Возвращает число файлов"""
+    if not compress:
+        return 0
+    patterns    =   [_glob_regex(pattern) for pattern in compress]
+    files       =   [os.path.join(root, rel_path) for rel_path in _local_files(root, excludes)
+                     if not rel_path.endswith('.gz') and _matches(rel_path, patterns)]
+    if not files:
+        return 0
+    pigz        =   shutil.which('pigz')
+    cmd         =   [pigz, '-p', str(threads)] if pigz else ['gzip']
+    result      =   _run(cmd + ['-f', '--', *files])
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[0])} failed: {result.stderr.strip()}")
+    return len(files)
+
+
+def write_sha256_manifest(root: str, manifest_path: str, excludes: List[str] = (), files: List[str] = None) -> Tuple[int, int]:
+    """
+    Манифест в формате 'sha256sum -c' для загружаемых файлов директории. Возвращает (файлов, байт)
+    files - явный список относительных путей (файлы верхнего уровня) вместо обхода директории
+    """
+    files, n_bytes = (sorted(files) if files is not None else _local_files(root, excludes)), 0
+    with open(manifest_path, 'w') as manifest:
+        for rel_path in files:
+            digest = hashlib.sha256()
+            with open(os.path.join(root, rel_path), 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_size), b''):
+                    digest.update(chunk)
+                    n_bytes += len(chunk)
+            manifest.write(f"{digest.hexdigest()}  ./{rel_path}\n")
+    return len(files), n_bytes
+
+
+def _run(cmd: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def _sudo(password: str, *cmd: str) -> List[str]:
+    return ['sshpass', '-p', password, 'sudo', *cmd]
+
+
+def _verify_manifest(password: str, target_path: str, manifest: str) -> subprocess.CompletedProcess:
+    return _run(_sudo(password, 'sh', '-c', 'cd "$1" && sha256sum -c --quiet "$2"', '_', target_path, manifest))
+
+
+def upload_unit(local_path: str,
+                target_path: str,
+                password: str,
+                manifest_dir: str,
+                remove_local: bool = True,
+                excludes: List[str] = (),
+                compress: List[str] = ()
+                ) -> Tuple[str, bool, str, float, int]:
+    """
+    Загрузка одной директории (образец или суммарная директория):
+        файлы из compress сжимаются перед загрузкой, excludes не загружаются (профиль хранения);
+        новая цель - rsync с проверкой size+mtime, существующая - с --checksum;
+        sha256 манифест считается локально параллельно с rsync и проверяется на Ceph;
+        после проверки локальная копия сразу удаляется.
+    """
+    start       =   time.perf_counter()
+    name        =   os.path.basename(local_path.rstrip('/'))
+    is_new      =   not os.path.exists(target_path)
+    try:
+        n_compressed    =   compress_matching(local_path, compress, excludes)
+        dropped_bytes   =   _excluded_size(local_path, excludes)
+    except Exception as e:
+        return name, False, f"retention failed: {e}", time.perf_counter() - start, 0
+    rsync_cmd   =   _sudo(password, 'rsync', '-rt', '--no-links')
+    if not is_new:
+        rsync_cmd.append('--checksum')
+    rsync_cmd  +=   [_rsync_exclude(pattern) for pattern in excludes]
+    rsync_cmd  +=   [f"{local_path}/", f"{target_path}/"]
+
+    rsync       =   subprocess.Popen(rsync_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    manifest    =   os.path.join(manifest_dir, f"{name}.sha256")
+    try:
+        n_files, n_bytes = write_sha256_manifest(local_path, manifest, excludes)
+    except Exception as e:
+        # communicate, а не wait: rsync может заполнить pipe stderr и зависнуть
+        rsync.kill()
+        rsync.communicate()
+        return name, False, f"manifest failed: {e}", time.perf_counter() - start, 0
+    _, rsync_err = rsync.communicate()
+    if rsync.returncode != 0:
+        return name, False, f"rsync failed: {rsync_err.strip()}", time.perf_counter() - start, 0
+
+    verify = _verify_manifest(password, target_path, manifest)
+    if verify.returncode != 0:
+        return name, False, f"checksum mismatch: {(verify.stdout + verify.stderr).strip()[:500]}", time.perf_counter() - start, 0
+
+    if remove_local:
+        shutil.rmtree(local_path, ignore_errors=True)
+    mode    =   'new' if is_new else 'checksum'
+    message =   f"{n_files} files verified ({mode})"
+    if n_compressed:
+        message += f", {n_compressed} compressed"
+    if dropped_bytes:
+        message += f", {dropped_bytes / 1024 ** 3:.2f} GB dropped by retention profile"
+    return name, True, message, time.perf_counter() - start, n_bytes
+
+
+def upload_top_files(res_folder_local: str,
+                     ceph_result_dir: str,
+                     top_files: List[str],
+                     password: str,
+                     manifest_dir: str,
+                     seq_type: str = ''
+                     ) -> bool:
+    """Файлы верхнего уровня (логи, json): rsync -t и проверка тем же sha256 манифестом, что и директории"""
+    manifest = os.path.join(manifest_dir, 'top-level.sha256')
+    try:
+        n_files, n_bytes = write_sha256_manifest(res_folder_local, manifest, files=top_files)
+    except Exception as e:
+        log(f"❌[3.2 Move and remove] Top-level files manifest failed: {e}")
+        return False
+    result = _run(_sudo(password, 'rsync', '-t', '--no-links',
+                        *[os.path.join(res_folder_local, f) for f in sorted(top_files)], f"{ceph_result_dir}/"))
+    if result.returncode != 0:
+        log(f"❌[3.2 Move and remove] Error uploading top-level files: {result.stderr}")
+        return False
+    verify = _verify_manifest(password, ceph_result_dir, manifest)
+    if verify.returncode != 0:
+        log(f"❌[3.2 Move and remove] Top-level files checksum mismatch: {(verify.stdout + verify.stderr).strip()[:500]}")
+        return False
+    BYTES_uploaded.inc(n_bytes, seq_type=seq_type)
+    log(f"✅[3.2 Move and remove] Uploaded {n_files} top-level file(s), verified")
+    return True
+
+
+def upload_results_tree(res_folder_local: str,
+                        ceph_result_dir: str,
+                        password: str,
+                        max_workers: int = 4,
+                        remove_local: bool = True,
+                        retention: Optional[Dict[str, List[str]]] = None,
+                        drop_bam: bool = False,
+                        seq_type: str = ''
+                        ) -> bool:
+    """
+    Параллельная загрузка '{Path local results}' в '{Path ceph results}': по rsync на директорию образца,
+    файлы верхнего уровня (логи, json) загружаются последними; все файлы проверяются по sha256 на Ceph.
+    retention - профиль хранения TypeConfig ('drop', 'compress', 'bam'), шаблоны относительно директории образца.
+    """
+    excludes    =   retention_excludes(retention, drop_bam)
+    compress    =   list((retention or {}).get('compress', []))
+    dir_units, top_files = [], []
+    with os.scandir(res_folder_local) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                dir_units.append(entry.path)
+            elif entry.is_file():
+                top_files.append(entry.name)
+    log(f"🕒[3.2 Move and remove] Uploading {len(dir_units)} dir(s) with {min(max_workers, max(len(dir_units), 1))} worker(s)")
+
+    results: Dict[str, bool] = {}
+    with tempfile.TemporaryDirectory(prefix='ceph_upload_') as manifest_dir:
+        if dir_units:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(dir_units))) as executor:
+                futures = [executor.submit(upload_unit, unit, os.path.join(ceph_result_dir, os.path.basename(unit)),
+                                           password, manifest_dir, remove_local, excludes, compress)
+                           for unit in dir_units]
+                for future in as_completed(futures):
+                    name, success, message, seconds, n_bytes = future.result()
+                    results[name] = success
+                    if success:
+                        BYTES_uploaded.inc(n_bytes, seq_type=seq_type)
+                    status = '✅' if success else '❌'
+                    log(f"{status}[3.2 Move and remove] {name}: {message} ({seconds:.0f}s)")
+
+        if top_files:
+            results['top-level files'] = upload_top_files(res_folder_local, ceph_result_dir, top_files,
+                                                          password, manifest_dir, seq_type)
+
+    failed = [name for name, success in results.items() if not success]
+    if failed:
+        log(f"❌[3.2 Move and remove] Upload failed for: {failed}")
+        return False
+    return True
@@ -0,0 +1,117 @@
+import os
+import time
+import zlib
+import struct
+import shutil
+import tempfile
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from main._3_Processing._2_POSTprocessing.report.bin_packing import Item, pack
+
+CHUNK_size          =   1024 * 1024
+ZIP_STORED          =   0
+ZIP_DEFLATED        =   8
+UTF8_flag           =   0x0800
+LOCAL_header        =   struct.Struct('<4s5H3L2H')
+CENTRAL_header      =   struct.Struct('<4s6H3L5H2L')
+END_record          =   struct.Struct('<4s4H2LH')
+
+
+class CompressedMember(NamedTuple):
+    file_path: str          # исходный файл
+    arcname: str            # путь внутри архива
+    data_path: str          # файл с данными для записи (сжатый temp или исходный при STORED)
+    method: int
+    crc: int
+    raw_size: int
+    compressed_size: int
+    dos_time: int
+    dos_date: int
+
+    @property
+    def archive_size(self) -> int:
+        """Сколько член займёт в zip: данные + локальный и центральный заголовки"""
+        name_len = len(self.arcname.encode('utf-8'))
+        return self.compressed_size + LOCAL_header.size + CENTRAL_header.size + 2 * name_len
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    year = max(t.tm_year, 1980)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def compress_member(file_path: str, arcname: str, tmp_dir: str, level: int = 6) -> CompressedMember:
+    """Сжимает файл один раз (raw deflate) во временный файл и запоминает crc и реальные размеры"""
+    compressor      =   zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc, raw_size   =   0, 0
+    fd, tmp_path    =   tempfile.mkstemp(dir=tmp_dir, suffix='.deflate')
+    with os.fdopen(fd, 'wb') as out, open(file_path, 'rb') as src:
+        for chunk in iter(lambda: src.read(CHUNK_size), b''):
+            crc         =   zlib.crc32(chunk, crc)
+            raw_size    +=  len(chunk)
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+    compressed_size     =   os.path.getsize(tmp_path)
+    dos_time, dos_date  =   _dos_datetime(os.path.getmtime(file_path))
+    if compressed_size >= raw_size:
+        # png и другие уже сжатые файлы: хранить без сжатия выходит меньше
+        os.remove(tmp_path)
+        return CompressedMember(file_path, arcname, file_path, ZIP_STORED, crc, raw_size, raw_size, dos_time, dos_date)
+    return CompressedMember(file_path, arcname, tmp_path, ZIP_DEFLATED, crc, raw_size, compressed_size, dos_time, dos_date)
+
+
+def compress_members(files: List[Tuple[str, str]],
+                     tmp_dir: str,
+                     max_workers: int = 4
+                     ) -> List[CompressedMember]:
+    """Параллельное сжатие (zlib отпускает GIL), порядок результатов совпадает с files"""
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        return list(executor.map(lambda item: compress_member(item[0], item[1], tmp_dir), files))
+
+
+def write_zip(archive_path: str, members: List[CompressedMember]) -> str:
+    """Собирает zip из уже сжатых данных без повторного сжатия"""
+    central = []
+    with open(archive_path, 'wb') as out:
+        for member in members:
+            offset  =   out.tell()
+            name    =   member.arcname.replace(os.sep, '/').encode('utf-8')
+            out.write(LOCAL_header.pack(b'PK\x03\x04', 20, UTF8_flag, member.method,
+                                        member.dos_time, member.dos_date, member.crc,
+                                        member.compressed_size, member.raw_size, len(name), 0))
+            out.write(name)
+            with open(member.data_path, 'rb') as src:
+                shutil.copyfileobj(src, out, CHUNK_size)
+            central.append(CENTRAL_header.pack(b'PK\x01\x02', 20, 20, UTF8_flag, member.method,
+                                               member.dos_time, member.dos_date, member.crc,
+                                               member.compressed_size, member.raw_size,
+                                               len(name), 0, 0, 0, 0, 0o100644 << 16, offset) + name)
+        central_offset = out.tell()
+        for record in central:
+            out.write(record)
+        central_size = out.tell() - central_offset
+        out.write(END_record.pack(b'PK\x05\x06', 0, 0, len(members), len(members),
+                                  central_size, central_offset, 0))
+    return archive_path
+
+
+def member_sample(member: CompressedMember, sample_ids: Iterable[str]) -> Optional[str]:
+    """Образец, к которому относится файл суммарной директории ('<sample>-report.html', '<sample>_<plot>.png')"""
+    name = os.path.basename(member.arcname)
+    matches = [sample_id for sample_id in sample_ids if name.startswith((f"{sample_id}-", f"{sample_id}_"))]
+    return max(matches, key=len) if matches else None
+
+
+def plan_archives(members: List[CompressedMember],
+                  max_size_bytes: int,
+                  sample_ids: Iterable[str] = ()
+                  ) -> List[List[CompressedMember]]:
+    """Минимальное число архивов по реальному размеру в zip, файлы одного образца по возможности вместе"""
+    sample_ids  =   list(sample_ids)
+    items       =   [Item(member, member.archive_size, member_sample(member, sample_ids)) for member in members]
+    return pack(items, max_size_bytes, bin_overhead=END_record.size)
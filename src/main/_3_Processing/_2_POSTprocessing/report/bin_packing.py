@@ -0,0 +1,217 @@
+"""
+Упаковка вложений в письма (bin packing) по реальным сжатым размерам.
+
+Цель в порядке приоритета:
+    1. минимальное число архивов (писем);
+    2. файлы одного образца по возможности лежат в одном архиве.
+
+Модуль чистый: работает только с ключами и размерами, файловую систему не трогает.
+"""
+import math
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Sequence
+
+
+class Item(NamedTuple):
+    key: Any                        # что вернуть в результате (путь, CompressedMember, ...)
+    size: int                       # размер в байтах
+    group: Optional[Hashable] = None  # образец; None - файл без привязки
+
+
+class _Unit(NamedTuple):
+    """Неделимый блок упаковки: один файл или все файлы образца"""
+    items: tuple
+    size: int
+
+
+def lower_bound(sizes: Sequence[int], capacity: int) -> int:
+    """Нижняя оценка числа корзин: max(ceil(sum / capacity), число предметов > capacity / 2)"""
+    if not sizes:
+        return 0
+    return max(math.ceil(sum(sizes) / capacity), sum(1 for s in sizes if s > capacity / 2))
+
+
+def _units(items: Sequence[Item], capacity: int, keep_groups: bool) -> List[_Unit]:
+    units, grouped = [], {}
+    for item in items:
+        if keep_groups and item.group is not None:
+            grouped.setdefault(item.group, []).append(item)
+        else:
+            units.append(_Unit((item,), item.size))
+    for members in grouped.values():
+        total = sum(item.size for item in members)
+        if total <= capacity:
+            units.append(_Unit(tuple(members), total))
+        else:
+            # группа не влезает в одно письмо целиком - раскладывается по файлам
+            units.extend(_Unit((item,), item.size) for item in members)
+    return units
+
+
+def _first_fit_decreasing(units: List[_Unit], capacity: int) -> List[List[_Unit]]:
+    bins, loads = [], []
+    for unit in sorted(units, key=lambda u: u.size, reverse=True):
+        for i, load in enumerate(loads):
+            if load + unit.size <= capacity:
+                bins[i].append(unit)
+                loads[i] += unit.size
+                break
+        else:
+            bins.append([unit])
+            loads.append(unit.size)
+    return bins
+
+
+def _best_fit_decreasing(units: List[_Unit], capacity: int) -> List[List[_Unit]]:
+    bins, loads = [], []
+    for unit in sorted(units, key=lambda u: u.size, reverse=True):
+        best, best_left = None, None
+        for i, load in enumerate(loads):
+            left = capacity - load - unit.size
+            if left >= 0 and (best_left is None or left < best_left):
+                best, best_left = i, left
+        if best is None:
+            bins.append([unit])
+            loads.append(unit.size)
+        else:
+            bins[best].append(unit)
+            loads[best] += unit.size
+    return bins
+
+
+def _best_target(loads: List[int], size: int, capacity: int, skip: int) -> Optional[int]:
+    target, target_left = None, None
+    for dst, load in enumerate(loads):
+        left = capacity - load - size
+        if dst != skip and left >= 0 and (target_left is None or left < target_left):
+            target, target_left = dst, left
+    return target
+
+
+def _drain_bins(bins: List[List[_Unit]], capacity: int, allow_split: bool = False) -> List[List[_Unit]]:
+    """
+    Пытается опустошить наименее заполненные корзины, перекладывая блоки в остальные (best fit).
+    allow_split - блок образца, который не помещается целиком, можно разложить по файлам.
+    """
+    bins = [list(b) for b in bins]
+    changed = True
+    while changed and len(bins) > 1:
+        changed = False
+        loads = [sum(u.size for u in b) for b in bins]
+        for src in sorted(range(len(bins)), key=lambda i: loads[i]):
+            trial_loads, moves, drained = list(loads), [], True
+            for unit in sorted(bins[src], key=lambda u: u.size, reverse=True):
+                target = _best_target(trial_loads, unit.size, capacity, src)
+                if target is not None:
+                    trial_loads[target] += unit.size
+                    moves.append((unit, target))
+                    continue
+                if not allow_split or len(unit.items) == 1:
+                    drained = False
+                    break
+                for item in sorted(unit.items, key=lambda x: x.size, reverse=True):
+                    target = _best_target(trial_loads, item.size, capacity, src)
+                    if target is None:
+                        drained = False
+                        break
+                    trial_loads[target] += item.size
+                    moves.append((_Unit((item,), item.size), target))
+                if not drained:
+                    break
+            if drained:
+                for unit, target in moves:
+                    bins[target].append(unit)
+                bins.pop(src)
+                changed = True
+                break
+    return bins
+
+
+def _pack_units(units: List[_Unit], capacity: int) -> List[List[_Unit]]:
+    candidates = [_first_fit_decreasing(units, capacity), _best_fit_decreasing(units, capacity)]
+    candidates = [_drain_bins(bins, capacity) for bins in candidates]
+    return min(candidates, key=len)
+
+
+def split_groups(bins: List[List[Any]], key_group: Dict[Any, Hashable]) -> int:
+    """Сколько образцов оказалось разнесено по разным корзинам"""
+    seen: Dict[Hashable, set] = {}
+    for i, b in enumerate(bins):
+        for key in b:
+            group = key_group.get(key)
+            if group is not None:
+                seen.setdefault(group, set()).add(i)
+    return sum(1 for bins_of_group in seen.values() if len(bins_of_group) > 1)
+
+
+def pack(items: Sequence[Item],
+         capacity: int,
+         bin_overhead: int = 0
+         ) -> List[List[Any]]:
+    """
+    Раскладывает предметы по корзинам вместимостью capacity (bin_overhead - фиксированная добавка на корзину,
+    например конечная запись zip). Предмет больше вместимости получает отдельную корзину.
+    Возвращает списки key, корзины отсортированы по убыванию заполнения.
+    """
+    if not items:
+        return []
+    capacity    =   capacity - bin_overhead
+    oversized   =   [item for item in items if item.size > capacity]
+    regular     =   [item for item in items if item.size <= capacity]
+
+    bound       =   lower_bound([item.size for item in regular], capacity)
+    grouped     =   _pack_units(_units(regular, capacity, keep_groups=True), capacity)
+    if len(grouped) > bound:
+        # группы мешают достичь оценки: сначала разбиваем только образцы из освобождаемых корзин
+        grouped = _drain_bins(grouped, capacity, allow_split=True)
+    if len(grouped) > bound:
+        # меньше писем важнее целостности образцов
+        loose = _pack_units(_units(regular, capacity, keep_groups=False), capacity)
+        if len(loose) < len(grouped):
+            grouped = loose
+
+    result = [[item.key for unit in b for item in unit.items] for b in grouped]
+    loads  = [sum(item.size for unit in b for item in unit.items) for b in grouped]
+    result = [keys for _, keys in sorted(zip(loads, result), key=lambda x: x[0], reverse=True)]
+    result.extend([item.key] for item in oversized)
+    return result
+
+
+def _benchmark(n_files: int = 5000, n_samples: int = 400, capacity_mb: int = 25, seed: int = 0):
+    import random
+    import time
+
+    rng         =   random.Random(seed)
+    capacity    =   capacity_mb * 1024 * 1024
+    items       =   []
+    for i in range(n_files):
+        sample  =   f"sample{rng.randrange(n_samples)}"
+        kind    =   rng.random()
+        if kind < 0.2:
+            size = int(rng.lognormvariate(14.5, 0.6))   # html ~2 MB
+        elif kind < 0.9:
+            size = int(rng.lognormvariate(12.0, 1.0))   # png ~150 KB
+        else:
+            size = int(rng.lognormvariate(8.0, 1.0))    # csv ~3 KB
+        items.append(Item(f"{sample}/file{i}", size, sample))
+
+    key_group   =   {item.key: item.group for item in items}
+    bound       =   lower_bound([item.size for item in items], capacity)
+
+    start = time.perf_counter()
+    ffd = _first_fit_decreasing(_units(items, capacity, keep_groups=False), capacity)
+    ffd_time = time.perf_counter() - start
+    ffd_keys = [[item.key for unit in b for item in unit.items] for b in ffd]
+
+    start = time.perf_counter()
+    packed = pack(items, capacity)
+    pack_time = time.perf_counter() - start
+
+    print(f"{n_files} files, {n_samples} samples, total {sum(i.size for i in items) / 2**20:.0f} MB, "
+          f"capacity {capacity_mb} MB, lower bound {bound} bins")
+    print(f"  plain FFD : {len(ffd_keys):4d} bins, {split_groups(ffd_keys, key_group):4d} split samples, {ffd_time * 1000:8.1f} ms")
+    print(f"  pack      : {len(packed):4d} bins, {split_groups(packed, key_group):4d} split samples, {pack_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    for n_files, n_samples in ((200, 24), (2000, 200), (5000, 400), (10000, 1000)):
+        _benchmark(n_files, n_samples)
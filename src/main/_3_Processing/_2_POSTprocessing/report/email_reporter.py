@@ -1,5 +1,5 @@
 import os
-import zipfile
+import tempfile
 import pandas as pd
 from typing import List, Optional, Dict, Tuple
 import configparser
@@ -9,15 +9,171 @@ from email.mime.base import MIMEBase
 from email import encoders
 import base64
 from requests_ntlm import HttpNtlmAuth
+from main._3_Processing._2_POSTprocessing.report.archive_builder import compress_members, plan_archives, write_zip
+from main._4_Monitoring.instrumentation import span, traced
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 import requests
 
+from main._4_Monitoring.structured_log import log
+
 urllib3.disable_warnings(InsecureRequestWarning)
 
+def _xml_escape(value: str) -> str:
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+class StreamedSoapBody:
+    """
+    Тело SOAP запроса как файлоподобный объект: XML до и после вложения + base64 вложения,
+    который кодируется по частям при чтении. В памяти держится только текущий блок.
+    __len__ даёт Content-Length, seek нужен для повторной отправки после NTLM challenge.
+    """
+    ATTACHMENT_marker   =   '__ATTACHMENT_CONTENT__'
+    SOURCE_block        =   3 * 256 * 1024              # кратно 3, чтобы блоки base64 стыковались без паддинга
+
+    def __init__(self, soap_xml: str, attachment_path: Optional[str] = None):
+        prefix, _, suffix   =   soap_xml.rpartition(self.ATTACHMENT_marker)
+        self.prefix         =   prefix.encode('utf-8')
+        self.suffix         =   suffix.encode('utf-8')
+        self.attachment     =   open(attachment_path, 'rb') if attachment_path else None
+        raw_size            =   os.path.getsize(attachment_path) if attachment_path else 0
+        self.encoded_size   =   4 * ((raw_size + 2) // 3)
+        self.position       =   0
+        self._block_index   =   None
+        self._block         =   b''
+
+    def __len__(self) -> int:
+        return len(self.prefix) + self.encoded_size + len(self.suffix)
+
+    def _encoded_block(self, index: int) -> bytes:
+        if index != self._block_index:
+            self.attachment.seek(index * self.SOURCE_block)
+            self._block         =   base64.b64encode(self.attachment.read(self.SOURCE_block))
+            self._block_index   =   index
+        return self._block
+
+    def _read_encoded(self, offset: int, size: int) -> bytes:
+        encoded_block   =   self.SOURCE_block // 3 * 4
+        chunks          =   []
+        while size > 0 and offset < self.encoded_size:
+            index, inner    =   divmod(offset, encoded_block)
+            chunk           =   self._encoded_block(index)[inner:inner + size]
+            chunks.append(chunk)
+            offset          +=  len(chunk)
+            size            -=  len(chunk)
+        return b''.join(chunks)
+
+    def read(self, size: int = -1) -> bytes:
+        total = len(self)
+        if size is None or size < 0:
+            size = total - self.position
+        end, chunks = min(self.position + size, total), []
+        bounds = [(0, len(self.prefix)),
+                  (len(self.prefix), len(self.prefix) + self.encoded_size),
+                  (len(self.prefix) + self.encoded_size, total)]
+        for segment, (start, stop) in enumerate(bounds):
+            lo, hi = max(self.position, start), min(end, stop)
+            if lo >= hi:
+                continue
+            if segment == 0:
+                chunks.append(self.prefix[lo:hi])
+            elif segment == 1:
+                chunks.append(self._read_encoded(lo - start, hi - lo))
+            else:
+                chunks.append(self.suffix[lo - start:hi - start])
+        self.position = end
+        return b''.join(chunks)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self.position, 2: len(self)}[whence]
+        self.position = min(max(base + offset, 0), len(self))
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self):
+        if self.attachment:
+            self.attachment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 class EmailReporter:
+    SOAP_headers = {
+        'Content-Type': 'text/xml; charset=utf-8',
+        'SOAPAction': 'http://schemas.microsoft.com/exchange/services/2006/messages/CreateItem',
+        'User-Agent': 'Python-EWS-Client/1.0'
+    }
+
     def __init__(self, exchange_config: Dict[str, str]):
         self.exchange_config = exchange_config
+        self._session = None
+
+    def _get_session(self) -> requests.Session:
+        """Одна keep-alive сессия с NTLM: рукопожатие выполняется на коротком запросе, а не на 25 MB вложении"""
+        if self._session is None:
+            ews_url = self.exchange_config.get('ews_url', 'https://mail.cspfmba.ru/EWS/Exchange.asmx')
+            session = requests.Session()
+            session.auth = HttpNtlmAuth(self.exchange_config['sender_username'], self.exchange_config['sender_password'])
+            session.verify = False
+            session.headers.update({'User-Agent': self.SOAP_headers['User-Agent']})
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            try:
+                response = session.get(ews_url, timeout=30)
+                log(f"🔐[3.2.r Email report] EWS session opened ({response.status_code})")
+            except requests.RequestException as e:
+                log(f"⚠️[3.2.r Email report] EWS session priming failed: {e}")
+            self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _post_soap(self, soap_xml: str, attachment_path: Optional[str]) -> requests.Response:
+        session = self._get_session()
+        ews_url = self.exchange_config.get('ews_url', 'https://mail.cspfmba.ru/EWS/Exchange.asmx')
+        with StreamedSoapBody(soap_xml, attachment_path) as soap_body:
+            try:
+                return session.post(ews_url,
+                                    data    =   soap_body,
+                                    headers =   {**self.SOAP_headers, 'Content-Length': str(len(soap_body))},
+                                    timeout =   (30, 300))
+            except requests.ConnectionError:
+                # соединение закрыто сервером - следующая попытка откроет новую сессию
+                self.close()
+                raise
+
+    def _attachment_xml(self, attachment_path: Optional[str], with_content_type: bool = True) -> str:
+        if not (attachment_path and os.path.exists(attachment_path)):
+            return ""
+        content_type = '''
+                            <t:ContentType>application/zip</t:ContentType>''' if with_content_type else ''
+        return f'''
+                    <t:Attachments>
+                        <t:FileAttachment>
+                            <t:Name>{_xml_escape(os.path.basename(attachment_path))}</t:Name>
+                            <t:Content>{StreamedSoapBody.ATTACHMENT_marker}</t:Content>{content_type}
+                        </t:FileAttachment>
+                    </t:Attachments>'''
+
+    def _recipients_xml(self, recipient_emails: List[str]) -> str:
+        recipient_xml = ""
+        for email in recipient_emails:
+            recipient_xml += f'''
+                        <t:Mailbox>
+                            <t:EmailAddress>{_xml_escape(email)}</t:EmailAddress>
+                        </t:Mailbox>'''
+        return recipient_xml
     
     def send_email_soap(self, 
                        recipient_emails: List[str], 
@@ -28,44 +184,14 @@ class EmailReporter:
         """Отправка email через SOAP с NTLM аутентификацией"""
         try:
             ews_url = self.exchange_config.get('ews_url', 'https://mail.cspfmba.ru/EWS/Exchange.asmx')
-            username = self.exchange_config['sender_username']
-            password = self.exchange_config['sender_password']
-            from_email = self.exchange_config['sender_email']
-            
-            # NTLM аутентификация
-            auth = HttpNtlmAuth(username, password)
+            if attachment_path and not os.path.exists(attachment_path):
+                attachment_path = None
             
             # Экранируем специальные символы в теле письма
-            escaped_body = body.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-            escaped_subject = subject.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+            escaped_body = _xml_escape(body)
+            escaped_subject = _xml_escape(subject)
             
-            # Подготовка XML для получателей
-            recipient_xml = ""
-            for email in recipient_emails:
-                escaped_email = email.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-                recipient_xml += f'''
-                        <t:Mailbox>
-                            <t:EmailAddress>{escaped_email}</t:EmailAddress>
-                        </t:Mailbox>'''
-            
-            # Подготовка вложения
-            attachments_xml = ""
-            if attachment_path and os.path.exists(attachment_path):
-                with open(attachment_path, 'rb') as f:
-                    attachment_content = base64.b64encode(f.read()).decode('utf-8')
-                attachment_name = os.path.basename(attachment_path)
-                escaped_attachment_name = attachment_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-                
-                attachments_xml = f'''
-                    <t:Attachments>
-                        <t:FileAttachment>
-                            <t:Name>{escaped_attachment_name}</t:Name>
-                            <t:Content>{attachment_content}</t:Content>
-                            <t:ContentType>application/zip</t:ContentType>
-                        </t:FileAttachment>
-                    </t:Attachments>'''
-            
-            # Полный SOAP XML запрос
+            # Полный SOAP XML запрос, вложение подставляется потоково
             soap_xml = f'''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"
                xmlns:t="http://schemas.microsoft.com/exchange/services/2006/types"
@@ -84,89 +210,51 @@ class EmailReporter:
                     <t:Subject>{escaped_subject}</t:Subject>
                     <t:Body BodyType="HTML">{escaped_body}</t:Body>
                     <t:ToRecipients>
-                        {recipient_xml}
+                        {self._recipients_xml(recipient_emails)}
                     </t:ToRecipients>
-                    {attachments_xml}
+                    {self._attachment_xml(attachment_path)}
                 </t:Message>
             </m:Items>
         </m:CreateItem>
     </soap:Body>
 </soap:Envelope>'''
             
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://schemas.microsoft.com/exchange/services/2006/messages/CreateItem',
-                'User-Agent': 'Python-EWS-Client/1.0'
-            }
-            
             # Отправка запроса
-            print(f"🕒[3.2.r Email report] Sending SOAP request to {ews_url}")
+            log(f"🕒[3.2.r Email report] Sending SOAP request to {ews_url}")
+            response = self._post_soap(soap_xml, attachment_path)
             
-            response = requests.post(
-                ews_url,
-                data=soap_xml.encode('utf-8'),
-                headers=headers,
-                auth=auth,
-                verify=False,
-                timeout=60
-            )
-            
-            print(f"📨[3.2.r Email report] Response status: {response.status_code}")
+            log(f"📨[3.2.r Email report] Response status: {response.status_code}")
             
             if response.status_code == 200:
                 if "ResponseClass=\"Success\"" in response.text:
-                    print("✅[3.2.r Email report] Email sent successfully via SOAP")
+                    log("✅[3.2.r Email report] Email sent successfully via SOAP")
                     return True
                 else:
-                    print(f"⚠️[3.2.r Email report] Server response: {response.text[:500]}")
+                    log(f"⚠️[3.2.r Email report] Server response: {response.text[:500]}")
                     # Попробуем найти конкретную ошибку
                     import re
                     if "ResponseCode" in response.text:
                         match = re.search(r'<m:ResponseCode>(.*?)</m:ResponseCode>', response.text)
                         if match:
                             error_code = match.group(1)
-                            print(f"📝[3.2.r Email report] Error code: {error_code}")
+                            log(f"📝[3.2.r Email report] Error code: {error_code}")
                     
                     # Попробуем упрощенный запрос без сохранения в папке
-                    return self._send_simplified_email(auth, ews_url, recipient_emails, escaped_subject, escaped_body, attachment_path)
+                    return self._send_simplified_email(recipient_emails, escaped_subject, escaped_body, attachment_path)
             else:
-                print(f"❌[3.2.r Email report] HTTP error {response.status_code}: {response.text[:500]}")
+                log(f"❌[3.2.r Email report] HTTP error {response.status_code}: {response.text[:500]}")
                 return False
                 
         except Exception as e:
-            print(f"❌[3.2.r Email report] Error sending via SOAP: {e}")
+            log(f"❌[3.2.r Email report] Error sending via SOAP: {e}")
             import traceback
             traceback.print_exc()
             return False
     
-    def _send_simplified_email(self, auth, ews_url, recipient_emails, subject, body, attachment_path):
-        """Упрощенная версия отправки"""
+    def _send_simplified_email(self, recipient_emails, subject, body, attachment_path):
+        """Упрощенная версия отправки (та же сессия, вложение кодируется потоково)"""
         try:
             # Упрощенный XML без сохранения в папке sentitems
-            recipient_xml = ""
-            for email in recipient_emails:
-                escaped_email = email.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-                recipient_xml += f'''
-                        <t:Mailbox>
-                            <t:EmailAddress>{escaped_email}</t:EmailAddress>
-                        </t:Mailbox>'''
-            
-            # Подготовка вложения
-            attachments_xml = ""
-            if attachment_path and os.path.exists(attachment_path):
-                with open(attachment_path, 'rb') as f:
-                    attachment_content = base64.b64encode(f.read()).decode('utf-8')
-                attachment_name = os.path.basename(attachment_path)
-                escaped_attachment_name = attachment_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-                
-                attachments_xml = f'''
-                    <t:Attachments>
-                        <t:FileAttachment>
-                            <t:Name>{escaped_attachment_name}</t:Name>
-                            <t:Content>{attachment_content}</t:Content>
-                        </t:FileAttachment>
-                    </t:Attachments>'''
-            
             simplified_xml = f'''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"
                xmlns:t="http://schemas.microsoft.com/exchange/services/2006/types"
@@ -181,38 +269,26 @@ class EmailReporter:
                     <t:Subject>{subject}</t:Subject>
                     <t:Body BodyType="HTML">{body}</t:Body>
                     <t:ToRecipients>
-                        {recipient_xml}
+                        {self._recipients_xml(recipient_emails)}
                     </t:ToRecipients>
-                    {attachments_xml}
+                    {self._attachment_xml(attachment_path, with_content_type=False)}
                 </t:Message>
             </m:Items>
         </m:CreateItem>
     </soap:Body>
 </soap:Envelope>'''
             
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://schemas.microsoft.com/exchange/services/2006/messages/CreateItem',
-            }
-            
-            print("🔄[3.2.r Email report] Trying simplified SOAP request...")
-            response = requests.post(
-                ews_url,
-                data=simplified_xml.encode('utf-8'),
-                headers=headers,
-                auth=auth,
-                verify=False,
-                timeout=60
-            )
+            log("🔄[3.2.r Email report] Trying simplified SOAP request...")
+            response = self._post_soap(simplified_xml, attachment_path)
             
             if response.status_code == 200 and "ResponseClass=\"Success\"" in response.text:
-                print("✅[3.2.r Email report] Email sent successfully via simplified SOAP")
+                log("✅[3.2.r Email report] Email sent successfully via simplified SOAP")
                 return True
             
             return False
             
         except Exception as e:
-            print(f"❌[3.2.r Email report] Error in simplified SOAP: {e}")
+            log(f"❌[3.2.r Email report] Error in simplified SOAP: {e}")
             return False
 
     # Остальные методы класса остаются БЕЗ изменений
@@ -234,156 +310,62 @@ class EmailReporter:
                     files.append((file_path, relative_path, file_type))
         return files
     
-    def create_single_archive(self, source_dir: str, archive_name: str) -> str:
-        archive_path = os.path.join(source_dir, archive_name)
-        files = self.get_files_to_archive(source_dir)
-        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path, relative_path, _ in files:
-                zipf.write(file_path, relative_path)
-        return archive_path
-    
-    def split_files_by_category(self, 
-                                source_dir: str, 
-                                max_size_mb: int = 25,
-                                compression_ratio: float = 0.75
-                            ) -> Tuple[List[List[Tuple[str, str]]], List[List[Tuple[str, str]]]]:
-        
-        files = self.get_files_to_archive(source_dir)
-        max_raw_size_bytes = max_size_mb * 1024 * 1024 / compression_ratio
-        
-        html_files = [(fp, rp) for fp, rp, ft in files if ft == 'html']
-        other_files = [(fp, rp) for fp, rp, ft in files if ft != 'html']
-        
-        html_total_raw_size = sum(os.path.getsize(fp) for fp, _ in html_files)
-        other_total_raw_size = sum(os.path.getsize(fp) for fp, _ in other_files)
-        
-        html_compressed_size = html_total_raw_size * compression_ratio / (1024 * 1024)
-        other_compressed_size = other_total_raw_size * compression_ratio / (1024 * 1024)
-        
-        print(f"📊[3.2.r Email report] HTML files: {len(html_files)} files")
-        print(f"❗[3.2.r Email report] Raw size: {html_total_raw_size / (1024 * 1024):.1f} MB")
-        print(f"❗[3.2.r Email report] After zip: {html_compressed_size:.1f} MB")
-        print(f"📊[3.2.r Email report] More files: {len(other_files)} files")
-        print(f"❗[3.2.r Email report] Raw size: {other_total_raw_size / (1024 * 1024):.1f} MB")
-        print(f"❗[3.2.r Email report] After zip: {other_compressed_size:.1f} MB")
-        
-        # Разделяем с учетом компрессии
-        html_file_groups = self._split_file_group_with_compression(
-            html_files, max_raw_size_bytes, "HTML", compression_ratio)
-        other_file_groups = self._split_file_group_with_compression(
-            other_files, max_raw_size_bytes, "More files", compression_ratio)
-        
-        return html_file_groups, other_file_groups
-    
-    def _split_file_group_with_compression(self, 
-                                        files: List[Tuple[str, str]], 
-                                        max_raw_size_bytes: int,
-                                        group_name: str,
-                                        compression_ratio: float
-                                        ) -> List[List[Tuple[str, str]]]:
-        if not files:
-            return []
-        files_with_size = [(fp, rp, os.path.getsize(fp)) for fp, rp in files]
-        files_with_size.sort(key=lambda x: x[2], reverse=True)
-        
-        groups = []
-        group_sizes = []
-        
-        for file_path, relative_path, file_size in files_with_size:
-            placed = False
-            for i in range(len(groups)):
-                if group_sizes[i] + file_size <= max_raw_size_bytes:
-                    groups[i].append((file_path, relative_path))
-                    group_sizes[i] += file_size
-                    placed = True
-                    break
-            if not placed:
-                groups.append([(file_path, relative_path)])
-                group_sizes.append(file_size)
-        if len(groups) > 1:
-            self._optimize_groups_with_compression(groups, group_sizes, max_raw_size_bytes)
-
-        print(f"📦[3.2.r Email report] Split {group_name} by {len(groups)} archive(s):")
-        for i, group in enumerate(groups):
-            raw_size = sum(os.path.getsize(fp) for fp, _ in group)
-            compressed_size = raw_size * compression_ratio / (1024 * 1024)
-            print(f"❗[3.2.r Email report] {i+1}: {len(group)} files, "
-                f"Raw: {raw_size / (1024 * 1024):.1f} MB, "
-                f"Zip: {compressed_size:.1f} MB")
-        
-        return groups
-    
-    def _optimize_groups_with_compression(self, groups, group_sizes, max_raw_size_bytes):
-        if len(groups) < 2:
-            return
-        smallest_idx = min(range(len(group_sizes)), key=lambda i: group_sizes[i])
-        smallest_group = groups[smallest_idx]
-        smallest_size = group_sizes[smallest_idx]
-        
-        moved_files = []
-        
-        for file_path, relative_path in smallest_group.copy():
-            file_size = os.path.getsize(file_path)
-            
-            for i in range(len(groups)):
-                if i != smallest_idx and group_sizes[i] + file_size <= max_raw_size_bytes:
-                    groups[i].append((file_path, relative_path))
-                    group_sizes[i] += file_size
-                    smallest_group.remove((file_path, relative_path))
-                    smallest_size -= file_size
-                    moved_files.append((file_path, relative_path))
-                    break
-        if not smallest_group:
-            groups.pop(smallest_idx)
-            group_sizes.pop(smallest_idx)
-            print(f"🔄[3.2.r Email report] Remove zero archive after optimization.")
-    
-    def create_category_archives(self, source_dir: str, 
-                                base_archive_name: str, 
-                                html_file_groups: List[List[Tuple[str, str]]], 
-                                other_file_groups: List[List[Tuple[str, str]]]
-                                ) -> List[str]:
-        archive_paths = []
-        
-        for i, file_group in enumerate(html_file_groups, 1):
-            if len(html_file_groups) == 1:
-                archive_name = f"{base_archive_name}_reports_html.zip"
-            else:
-                archive_name = f"{base_archive_name}_reports_html_part{i}_of{len(html_file_groups)}.zip"
-            
-            archive_path = os.path.join(source_dir, archive_name)
-            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path, relative_path in file_group:
-                    zipf.write(file_path, relative_path)
-            
-            archive_paths.append(archive_path)
-            archive_size = os.path.getsize(archive_path) / (1024 * 1024)
-            raw_size = sum(os.path.getsize(fp) for fp, _ in file_group) / (1024 * 1024)
-            compression = (1 - archive_size / raw_size) * 100 if raw_size > 0 else 0
-            
-            print(f"✅[3.2.r Email report] Create HTML archive: {archive_name}")
-            print(f"✅[3.2.r Email report] Size: {archive_size:.1f} MB (compression {compression:.1f}%)")
-        
-        for i, file_group in enumerate(other_file_groups, 1):
-            if len(other_file_groups) == 1:
-                archive_name = f"{base_archive_name}_other_files.zip"
+    def _archive_name(self, base_archive_name: str, category: str, part: int, total: int) -> str:
+        if category is None:
+            return f"{base_archive_name}_reports.zip"
+        suffix = 'reports_html' if category == 'html' else 'other_files'
+        if total == 1:
+            return f"{base_archive_name}_{suffix}.zip"
+        return f"{base_archive_name}_{suffix}_part{part}_of{total}.zip"
+
+    def build_report_archives(self,
+                              source_dir: str,
+                              base_archive_name: str,
+                              max_size_mb: int = 25,
+                              max_workers: int = 4,
+                              sample_ids: List[str] = None
+                              ) -> Tuple[List[str], bool]:
+        """
+        Каждый файл сжимается один раз, архивы планируются по реальным сжатым размерам.
+        Возвращает (пути архивов, разделены ли архивы на html/остальные файлы).
+        """
+        max_size_bytes  =   max_size_mb * 1024 * 1024
+        files           =   self.get_files_to_archive(source_dir)
+        archive_paths   =   []
+        with tempfile.TemporaryDirectory(dir=source_dir, prefix='.archive_') as tmp_dir:
+            members         =   compress_members([(fp, rp) for fp, rp, _ in files], tmp_dir, max_workers=max_workers)
+            raw_size        =   sum(m.raw_size for m in members)
+            total_size      =   sum(m.archive_size for m in members)
+            log(f"📊[3.2.r Email report] {len(members)} files, raw: {raw_size / (1024 * 1024):.1f} MB, "
+                  f"zip: {total_size / (1024 * 1024):.1f} MB (limit: {max_size_mb} MB)")
+
+            sample_ids      =   sample_ids or []
+            if len(plan_archives(members, max_size_bytes)) <= 1:
+                log("✅[3.2.r Email report] Single archive is within size limit")
+                planned = [(None, members)]
+                use_category_split = False
             else:
-                archive_name = f"{base_archive_name}_other_files_part{i}_of{len(other_file_groups)}.zip"
-            
-            archive_path = os.path.join(source_dir, archive_name)
-            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path, relative_path in file_group:
-                    zipf.write(file_path, relative_path)
-            
-            archive_paths.append(archive_path)
-            archive_size = os.path.getsize(archive_path) / (1024 * 1024)
-            raw_size = sum(os.path.getsize(fp) for fp, _ in file_group) / (1024 * 1024)
-            compression = (1 - archive_size / raw_size) * 100 if raw_size > 0 else 0
-            
-            print(f"✅[3.2.r Email report] Create archive others files: {archive_name}")
-            print(f"✅[3.2.r Email report] Size: {archive_size:.1f} MB (compression {compression:.1f}%)")
-        
-        return archive_paths
+                log("⚠️[3.2.r Email report] Archive exceeds size limit, splitting HTML files separately...")
+                html_groups     =   plan_archives([m for m in members if m.arcname.endswith('.html')], max_size_bytes, sample_ids)
+                other_groups    =   plan_archives([m for m in members if not m.arcname.endswith('.html')], max_size_bytes, sample_ids)
+                planned = [('html', group) for group in html_groups] + [('other', group) for group in other_groups]
+                use_category_split = True
+
+            counts = {}
+            for category, _ in planned:
+                counts[category] = counts.get(category, 0) + 1
+            parts = {}
+            for category, group in planned:
+                parts[category]     =   parts.get(category, 0) + 1
+                archive_name        =   self._archive_name(base_archive_name, category, parts[category], counts[category])
+                archive_path        =   write_zip(os.path.join(source_dir, archive_name), group)
+                archive_paths.append(archive_path)
+                archive_size        =   os.path.getsize(archive_path) / (1024 * 1024)
+                group_raw           =   sum(m.raw_size for m in group) / (1024 * 1024)
+                compression         =   (1 - archive_size / group_raw) * 100 if group_raw > 0 else 0
+                log(f"✅[3.2.r Email report] Create archive: {archive_name}, {len(group)} files")
+                log(f"✅[3.2.r Email report] Size: {archive_size:.1f} MB (compression {compression:.1f}%)")
+        return archive_paths, use_category_split
 
     def format_statistics_table(self, df: pd.DataFrame) -> str:
         formatted_df = df.copy()
@@ -646,18 +628,23 @@ class EmailReporter:
             smtp_server = self.exchange_config.get('smtp_server', 'mail.cspfmba.ru')
             smtp_port = int(self.exchange_config.get('smtp_port', 587))
             
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(self.exchange_config['sender_email'], 
-                            self.exchange_config['sender_password'])
+            smtp_starttls = str(self.exchange_config.get('smtp_starttls', 'true')).lower() in ('1', 'true', 'yes')
+            
+            with smtplib.SMTP(smtp_server, smtp_port, timeout=60) as server:
+                if smtp_starttls:
+                    server.starttls()
+                server.ehlo()
+                if server.has_extn('auth'):
+                    server.login(self.exchange_config['sender_email'], 
+                                self.exchange_config['sender_password'])
                 server.sendmail(self.exchange_config['sender_email'], 
                                recipient_emails, msg.as_string())
             
-            print("✅[3.2.r Email report] Email sent via SMTP (fallback)")
+            log("✅[3.2.r Email report] Email sent via SMTP (fallback)")
             return True
             
         except Exception as e:
-            print(f"❌[3.2.r Email report] Error sending via SMTP: {e}")
+            log(f"❌[3.2.r Email report] Error sending via SMTP: {e}")
             return False
 
 def load_exchange_config(config_path: str, 
@@ -681,10 +668,11 @@ def load_exchange_config(config_path: str,
             'wsdl_url': config['EXCHANGE'].get('wsdl_url', 'https://mail.cspfmba.ru/EWS/Services.wsdl'),
             'smtp_server': config['EXCHANGE'].get('smtp_server', 'mail.cspfmba.ru'),
             'smtp_port': config['EXCHANGE'].get('smtp_port', '587'),
+            'smtp_starttls': config['EXCHANGE'].get('smtp_starttls', 'true'),
             'ews_url': config['EXCHANGE'].get('ews_url', 'https://mail.cspfmba.ru/EWS/Exchange.asmx')
         }
     except Exception as e:
-        print(f"❌[3.2.r Email report] Error loading configuration: {e}")
+        log(f"❌[3.2.r Email report] Error loading configuration: {e}")
         return {}
 
 def load_recipients_config(config_path: str) -> List[str]:
@@ -698,22 +686,25 @@ def load_recipients_config(config_path: str) -> List[str]:
         emails = [email.strip() for email in emails_str.split(',') if email.strip()]
         return emails
     except Exception as e:
-        print(f"❌[3.2.r Email report] Error loading recipients list: {e}")
+        log(f"❌[3.2.r Email report] Error loading recipients list: {e}")
         return []
 
+@traced('3.2.r Email report')
 def archive_and_send_report(flowcell_sample_processed: dict, 
                           sender_email:str,
                           sender_password:str,
                           config_path:str,
                           max_archive_size_mb: int = 25) -> bool:
   
+    from main._3_Processing._2_POSTprocessing.report.mail_queue import get_mail_spool, get_mail_sender, report_message_id
     all_results = []
+    mail_spool  = get_mail_spool()
     
     try:
         seqtypes_set = list({value.get('SeqType') for value in flowcell_sample_processed.values() if value.get('SeqType')})
         
         for seq_type_keys in seqtypes_set:
-            print(f"📊[3.2.r Email report] Processing SeqType: {seq_type_keys}")
+            log(f"📊[3.2.r Email report] Processing SeqType: {seq_type_keys}")
             filtered_data = {key: value for key, value in flowcell_sample_processed.items() if value.get('SeqType') == seq_type_keys}
             first_key = list(filtered_data.keys())[0]
             sum_path = filtered_data[first_key]['Path local sum stat']
@@ -721,13 +712,13 @@ def archive_and_send_report(flowcell_sample_processed: dict,
             ceph_paths = filtered_data[first_key]['Path ceph results']
             
             if not os.path.exists(sum_path):
-                print(f"❌[3.2.r Email report] Directory {sum_path} does not exist")
+                log(f"❌[3.2.r Email report] Directory {sum_path} does not exist")
                 all_results.append(False)
                 continue
 
             stats_csv_path = os.path.join(sum_path, f"{flowcell}_stat.csv")
             if not os.path.exists(stats_csv_path):
-                print(f"❌[3.2.r Email report] Statistics file not found: {stats_csv_path}")
+                log(f"❌[3.2.r Email report] Statistics file not found: {stats_csv_path}")
                 all_results.append(False)
                 continue
 
@@ -735,48 +726,33 @@ def archive_and_send_report(flowcell_sample_processed: dict,
                                                   sender_email=sender_email, 
                                                   sender_password=sender_password)
             if not exchange_config:
-                print("❌[3.2.r Email report] Failed to load configuration")
+                log("❌[3.2.r Email report] Failed to load configuration")
                 all_results.append(False)
                 continue
 
             recipient_emails = load_recipients_config(config_path=config_path)
             if not recipient_emails:
-                print("❌[3.2.r Email report] Failed to load recipients list")
+                log("❌[3.2.r Email report] Failed to load recipients list")
                 all_results.append(False)
                 continue
 
             reporter = EmailReporter(exchange_config)
-            single_archive_name = f"{flowcell}_reports.zip"
-            print(f"🕒[3.2.r Email report] Creating single archive to check size: {single_archive_name}")
-            single_archive_path = reporter.create_single_archive(sum_path, single_archive_name)
-            archive_size_mb = os.path.getsize(single_archive_path) / (1024 * 1024)
-            print(f"📊[3.2.r Email report] Total archive size: {archive_size_mb:.1f} MB (limit: {max_archive_size_mb} MB)")
-            
-            archive_paths = []
-            if archive_size_mb <= max_archive_size_mb:
-                print("✅[3.2.r Email report] Single archive is within size limit")
-                archive_paths = [single_archive_path]
-                total_parts = 1
-                use_category_split = False
-            else:
-                print("⚠️[3.2.r Email report] Archive exceeds size limit, splitting HTML files separately...")
-                os.remove(single_archive_path)
-                print("🧹[3.2.r Email report] Removed oversized single archive")
-                html_file_groups, other_file_groups = reporter.split_files_by_category(
-                                                                sum_path, max_archive_size_mb, compression_ratio=0.75)
-                archive_paths = reporter.create_category_archives(
-                    sum_path, flowcell, html_file_groups, other_file_groups
-                )
-                total_parts = len(archive_paths)
-                use_category_split = True
+            log(f"🕒[3.2.r Email report] Compressing report files...")
+            with span('3.2.r Zip', flowcell=flowcell, seq_type=seq_type_keys) as zip_span:
+                archive_paths, use_category_split = reporter.build_report_archives(
+                    sum_path, flowcell,
+                    max_size_mb =   max_archive_size_mb,
+                    sample_ids  =   [value['Sample_ID'] for value in filtered_data.values()])
+                zip_span.set(archives=len(archive_paths), archive_bytes=sum(os.path.getsize(p) for p in archive_paths))
+            total_parts = len(archive_paths)
 
-            print(f"📦[3.2.r Email report] Found {len(archive_paths)} archive(s) to send")
+            log(f"📦[3.2.r Email report] Found {len(archive_paths)} archive(s) to send")
             success_count = 0
             
             for part_number, archive_path in enumerate(archive_paths, 1):
                 part_size_mb = os.path.getsize(archive_path) / (1024 * 1024)
                 archive_name = os.path.basename(archive_path)
-                print(f"📦[3.2.r Email report] Processing archive {part_number}/{len(archive_paths)}: {archive_name} ({part_size_mb:.1f} MB)")
+                log(f"📦[3.2.r Email report] Processing archive {part_number}/{len(archive_paths)}: {archive_name} ({part_size_mb:.1f} MB)")
                 
                 archive_type = None
                 if use_category_split:
@@ -785,7 +761,7 @@ def archive_and_send_report(flowcell_sample_processed: dict,
                     elif "_other_files" in archive_name:
                         archive_type = "other"
                 
-                print("🕒[3.2.r Email report] Creating email body...")
+                log("🕒[3.2.r Email report] Creating email body...")
                 email_body = reporter.create_email_body(
                     flowcell, ceph_paths, stats_csv_path, part_number, len(archive_paths), archive_type)
                 
@@ -807,54 +783,39 @@ def archive_and_send_report(flowcell_sample_processed: dict,
                     else:
                         subject = f"Flowcell {flowcell} processing completed - Part {part_number}/{len(archive_paths)} (Additional Data)"
 
-                print(f"🕒[3.2.r Email report] Sending email {part_number}/{len(archive_paths)}...")
-                
-                # Используем только прямой SOAP метод (убрали zeep)
-                success = reporter.send_email_soap(
-                    recipient_emails=recipient_emails,
-                    subject=subject,
-                    body=email_body,
-                    attachment_path=archive_path
-                )
-                
-                # Если SOAP не сработал, пробуем SMTP fallback
-                if not success:
-                    print("⚠️[3.2.r Email report] SOAP failed, trying SMTP fallback...")
-                    success = reporter.send_email_smtp_fallback(
-                        recipient_emails=recipient_emails,
-                        subject=subject,
-                        body=email_body,
-                        attachment_path=archive_path
-                    )
-                
-                if success:
-                    success_count += 1
-                    print(f"✅[3.2.r Email report] Successfully sent archive {part_number}/{len(archive_paths)}")
-                
-                try:
-                    os.remove(archive_path)
-                    print(f"🧹[3.2.r Email report] Cleaned up temporary archive: 2.Results{archive_path.split('2.Results')[-1]}")
-                except Exception as e:
-                    print(f"⚠️[3.2.r Email report] Warning: Could not clean up archive {archive_path}: {e}")
+                # id включает sha256 архива: повторная отправка того же отчёта пропускается, новый отчёт после переобработки - нет
+                message_id = report_message_id(f"{seq_type_keys}_{os.path.splitext(archive_name)[0]}", archive_path)
+                mail_spool.enqueue(message_id      =   message_id,
+                                   recipients      =   recipient_emails,
+                                   subject         =   subject,
+                                   body            =   email_body,
+                                   attachment_path =   archive_path)
+                success_count += 1
             
             if success_count == len(archive_paths):
-                print(f"✅[3.2.r Email report] All {len(archive_paths)} email(s) for SeqType {seq_type_keys} sent successfully!")
+                log(f"✅[3.2.r Email report] All {len(archive_paths)} email(s) for SeqType {seq_type_keys} queued for sending")
                 all_results.append(True)
             else:
-                print(f"⚠️[3.2.r Email report] Only {success_count} out of {len(archive_paths)} email(s) for SeqType {seq_type_keys} were sent successfully")
+                log(f"⚠️[3.2.r Email report] Only {success_count} out of {len(archive_paths)} email(s) for SeqType {seq_type_keys} were queued")
                 all_results.append(False)
         
+        mail_sender = get_mail_sender()
+        if mail_sender is not None:
+            mail_sender.wakeup()
+        else:
+            log(f"⚠️[3.2.r Email report] Mail sender is not running, {len(mail_spool.pending())} message(s) wait in {mail_spool.spool_dir}")
+
         if all_results:
             overall_success = all(all_results)
-            print(f"📊[3.2.r Email report] Overall result: {'SUCCESS' if overall_success else 'FAILURE'}")
-            print(f"📊[3.2.r Email report] Individual results: {all_results}")
+            log(f"📊[3.2.r Email report] Overall result: {'SUCCESS' if overall_success else 'FAILURE'}")
+            log(f"📊[3.2.r Email report] Individual results: {all_results}")
             return overall_success
         else:
-            print("❌[3.2.r Email report] No SeqTypes processed")
+            log("❌[3.2.r Email report] No SeqTypes processed")
             return False
 
     except Exception as e:
-        print(f"❌[3.2.r Email report] Unexpected error: {e}")
+        log(f"❌[3.2.r Email report] Unexpected error: {e}")
         import traceback
         traceback.print_exc()
         return False
\ No newline at end of file
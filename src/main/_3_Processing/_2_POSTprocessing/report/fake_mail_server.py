@@ -0,0 +1,157 @@
+"""
+Локальные заглушки EWS (SOAP over HTTP) и SMTP для проверки очереди писем без Exchange.
+
+    python -m main._3_Processing._2_POSTprocessing.report.fake_mail_server --out /tmp/fake_mail --fail-first 2
+
+email_config.ini для проверки:
+    ews_url         = http://127.0.0.1:8025/EWS/Exchange.asmx
+    smtp_server     = 127.0.0.1
+    smtp_port       = 2525
+    smtp_starttls   = false
+"""
+import os
+import time
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EWS_success = '''<?xml version="1.0" encoding="utf-8"?>
+<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">
+  <s:Body>
+    <m:CreateItemResponse xmlns:m="http://schemas.microsoft.com/exchange/services/2006/messages">
+      <m:ResponseMessages>
+        <m:CreateItemResponseMessage ResponseClass="Success">
+          <m:ResponseCode>NoError</m:ResponseCode>
+        </m:CreateItemResponseMessage>
+      </m:ResponseMessages>
+    </m:CreateItemResponse>
+  </s:Body>
+</s:Envelope>'''
+
+
+class _Counter:
+    def __init__(self, fail_first: int):
+        self.lock       =   threading.Lock()
+        self.fail_first =   fail_first
+        self.received   =   0
+
+    def next(self) -> int:
+        with self.lock:
+            self.received += 1
+            return self.received
+
+
+def _save(out_dir: str, prefix: str, number: int, data: bytes) -> str:
+    path = os.path.join(out_dir, f"{prefix}_{number:04d}_{int(time.time())}.txt")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def make_ews_handler(out_dir: str, counter: _Counter):
+    class FakeEWSHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length  =   int(self.headers.get('Content-Length', 0))
+            data    =   self.rfile.read(length)
+            number  =   counter.next()
+            if number <= counter.fail_first:
+                payload = b'Service Unavailable'
+                self.send_response(503)
+            else:
+                path    =   _save(out_dir, 'ews', number, data)
+                payload =   EWS_success.encode('utf-8')
+                print(f"📨[Fake EWS] #{number}: {len(data) / 1024:.1f} KB -> {path}")
+                self.send_response(200)
+            self.send_header('Content-Type', 'text/xml; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeEWSHandler
+
+
+def make_smtp_handler(out_dir: str, counter: _Counter):
+    class FakeSMTPHandler(socketserver.StreamRequestHandler):
+        """Минимальный SMTP: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT (без STARTTLS и AUTH)"""
+
+        def reply(self, line: str):
+            self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+        def handle(self):
+            self.reply('220 fake-smtp ready')
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode('utf-8', 'replace').strip().upper()
+                if command.startswith(('EHLO', 'HELO')):
+                    self.reply('250 fake-smtp')
+                elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                    self.reply('250 OK')
+                elif command == 'DATA':
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    chunks = []
+                    for data_line in iter(self.rfile.readline, b''):
+                        if data_line in (b'.\r\n', b'.\n'):
+                            break
+                        chunks.append(data_line)
+                    number = counter.next()
+                    if number <= counter.fail_first:
+                        self.reply('451 Temporary failure')
+                        continue
+                    path = _save(out_dir, 'smtp', number, b''.join(chunks))
+                    print(f"📨[Fake SMTP] #{number}: {sum(map(len, chunks)) / 1024:.1f} KB -> {path}")
+                    self.reply('250 Queued')
+                elif command == 'QUIT':
+                    self.reply('221 Bye')
+                    return
+                else:
+                    self.reply('502 Command not implemented')
+
+    return FakeSMTPHandler
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads      = True
+
+
+def start_fake_servers(out_dir: str,
+                       http_port: int   =   8025,
+                       smtp_port: int   =   2525,
+                       fail_first: int  =   0,
+                       host: str        =   '127.0.0.1'):
+    """Запускает обе заглушки в фоновых потоках, возвращает (http_server, smtp_server)"""
+    os.makedirs(out_dir, exist_ok=True)
+    http_server = ThreadingHTTPServer((host, http_port), make_ews_handler(out_dir, _Counter(fail_first)))
+    smtp_server = _ThreadingTCPServer((host, smtp_port), make_smtp_handler(out_dir, _Counter(fail_first)))
+    for server in (http_server, smtp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"✅[Fake mail] EWS: http://{host}:{http_port}/EWS/Exchange.asmx, SMTP: {host}:{smtp_port}, out: {out_dir}")
+    return http_server, smtp_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake EWS/SMTP servers for testing the mail queue')
+    parser.add_argument('--out',        default='/tmp/fake_mail')
+    parser.add_argument('--http-port',  type=int, default=8025)
+    parser.add_argument('--smtp-port',  type=int, default=2525)
+    parser.add_argument('--fail-first', type=int, default=0, help='reject the first N messages to test retries')
+    args = parser.parse_args()
+    http_server, smtp_server = start_fake_servers(args.out, args.http_port, args.smtp_port, args.fail_first)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        http_server.shutdown()
+        smtp_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import os
+import json
+import hashlib
+import time
+import shutil
+import threading
+import traceback
+from typing import Dict, Any, List, Optional
+
+from main._3_Processing._2_POSTprocessing.report.email_reporter import EmailReporter, load_exchange_config
+from main._4_Monitoring.structured_log import log
+
+MESSAGE_file        =   'message.json'
+DIGEST_chars        =   12
+BODY_file           =   'body.html'
+
+
+
+def report_message_id(prefix: str, attachment_path: Optional[str] = None) -> str:
+    """
+    Id письма: префикс + sha256 вложения. Повторная сборка того же отчёта даёт тот же id (архив
+    детерминирован), отчёт переобработанного флоуселла - новый, и он не отбрасывается как дубликат.
+    """
+    if not attachment_path or not os.path.exists(attachment_path):
+        return prefix
+    digest = hashlib.sha256()
+    with open(attachment_path, 'rb') as f:
+        for block in iter(lambda: f.read(8 * 1024 ** 2), b''):
+            digest.update(block)
+    return f"{prefix}_{digest.hexdigest()[:DIGEST_chars]}"
+
+
+class MailSpool:
+    """
+    Очередь писем на диске:
+        pending/<message_id>/message.json + body.html + вложение
+        sent/<message_id>.json, failed/<message_id>/
+    Пароли в спул не пишутся.
+    """
+
+    def __init__(self, spool_dir: str, max_attempts: int = 8, base_delay: int = 60, max_delay: int = 3600):
+        self.spool_dir      =   spool_dir
+        self.max_attempts   =   max_attempts
+        self.base_delay     =   base_delay
+        self.max_delay      =   max_delay
+        self._lock          =   threading.Lock()
+        for sub_dir in ('tmp', 'pending', 'sent', 'failed'):
+            os.makedirs(os.path.join(spool_dir, sub_dir), exist_ok=True)
+
+    def _path(self, state: str, message_id: str = '') -> str:
+        return os.path.join(self.spool_dir, state, message_id)
+
+    def is_known(self, message_id: str) -> bool:
+        return (os.path.exists(self._path('pending', message_id))
+                or os.path.exists(self._path('sent', f"{message_id}.json")))
+
+    def enqueue(self,
+                message_id: str,
+                recipients: List[str],
+                subject: str,
+                body: str,
+                attachment_path: Optional[str] = None
+                ) -> bool:
+        """Кладёт письмо в очередь (вложение переносится в спул). False - письмо уже в очереди или отправлено"""
+        with self._lock:
+            if self.is_known(message_id):
+                log(f"ℹ️[3.2.r Email queue] Message {message_id} already queued or sent, skip")
+                if attachment_path and os.path.exists(attachment_path):
+                    os.remove(attachment_path)
+                return False
+            tmp_dir = self._path('tmp', message_id)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            attachment_name = None
+            if attachment_path and os.path.exists(attachment_path):
+                attachment_name = os.path.basename(attachment_path)
+                shutil.move(attachment_path, os.path.join(tmp_dir, attachment_name))
+            with open(os.path.join(tmp_dir, BODY_file), 'w', encoding='utf-8') as f:
+                f.write(body)
+            message = {
+                'message_id'    :   message_id,
+                'recipients'    :   recipients,
+                'subject'       :   subject,
+                'attachment'    :   attachment_name,
+                'attempts'      :   0,
+                'next_attempt'  :   0,
+                'created'       :   time.strftime('%Y-%m-%d %H:%M:%S'),
+                'last_error'    :   None,
+            }
+            with open(os.path.join(tmp_dir, MESSAGE_file), 'w', encoding='utf-8') as f:
+                json.dump(message, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_dir, self._path('pending', message_id))
+        log(f"📨[3.2.r Email queue] Queued: {subject}")
+        return True
+
+    def _read(self, message_id: str) -> Dict[str, Any]:
+        with open(os.path.join(self._path('pending', message_id), MESSAGE_file), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, message: Dict[str, Any]):
+        path        =   os.path.join(self._path('pending', message['message_id']), MESSAGE_file)
+        tmp_path    =   f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(message, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        messages = []
+        for message_id in sorted(os.listdir(self._path('pending'))):
+            try:
+                messages.append(self._read(message_id))
+            except Exception as e:
+                log(f"⚠️[3.2.r Email queue] Broken message {message_id}: {e}")
+        return messages
+
+    def due(self, now: float = None) -> List[Dict[str, Any]]:
+        now = now or time.time()
+        return [message for message in self.pending() if message['next_attempt'] <= now]
+
+    def load_body(self, message: Dict[str, Any]) -> str:
+        with open(os.path.join(self._path('pending', message['message_id']), BODY_file), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def attachment_path(self, message: Dict[str, Any]) -> Optional[str]:
+        if not message.get('attachment'):
+            return None
+        return os.path.join(self._path('pending', message['message_id']), message['attachment'])
+
+    def mark_sent(self, message: Dict[str, Any]):
+        with self._lock:
+            record = dict(message, sent=time.strftime('%Y-%m-%d %H:%M:%S'))
+            with open(self._path('sent', f"{message['message_id']}.json"), 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=2, ensure_ascii=False)
+            shutil.rmtree(self._path('pending', message['message_id']), ignore_errors=True)
+
+    def mark_failed(self, message: Dict[str, Any], error: str) -> bool:
+        """Увеличивает счётчик попыток (экспоненциальная задержка). True - попытки исчерпаны"""
+        with self._lock:
+            message['attempts']     +=  1
+            message['last_error']   =   error
+            delay                   =   min(self.base_delay * 2 ** (message['attempts'] - 1), self.max_delay)
+            message['next_attempt'] =   time.time() + delay
+            if message['attempts'] >= self.max_attempts:
+                self._write(message)
+                failed_dir = self._path('failed', message['message_id'])
+                shutil.rmtree(failed_dir, ignore_errors=True)
+                os.replace(self._path('pending', message['message_id']), failed_dir)
+                return True
+            self._write(message)
+            return False
+
+
+class MailSender(threading.Thread):
+    """Фоновая отправка писем из спула одним EmailReporter (одна HTTP сессия на все письма)"""
+
+    def __init__(self, spool: MailSpool, exchange_config: Dict[str, str], poll_interval: int = 30):
+        super().__init__(name='mail-sender', daemon=True)
+        self.spool          =   spool
+        self.reporter       =   EmailReporter(exchange_config)
+        self.poll_interval  =   poll_interval
+        self._stop_event    =   threading.Event()
+        self._wakeup        =   threading.Event()
+        self._idle          =   threading.Event()
+
+    def wakeup(self):
+        self._idle.clear()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def deliver(self, message: Dict[str, Any]) -> bool:
+        body            =   self.spool.load_body(message)
+        attachment_path =   self.spool.attachment_path(message)
+        success = self.reporter.send_email_soap(recipient_emails   =   message['recipients'],
+                                                subject            =   message['subject'],
+                                                body               =   body,
+                                                attachment_path    =   attachment_path)
+        if not success:
+            log("⚠️[3.2.r Email queue] SOAP failed, trying SMTP fallback...")
+            success = self.reporter.send_email_smtp_fallback(recipient_emails   =   message['recipients'],
+                                                             subject            =   message['subject'],
+                                                             body               =   body,
+                                                             attachment_path    =   attachment_path)
+        return success
+
+    def process_due(self) -> int:
+        sent = 0
+        for message in self.spool.due():
+            if self._stop_event.is_set():
+                break
+            try:
+                success, error = self.deliver(message), 'delivery failed'
+            except Exception as e:
+                success, error = False, str(e)
+                traceback.print_exc()
+            if success:
+                self.spool.mark_sent(message)
+                sent += 1
+                log(f"✅[3.2.r Email queue] Sent: {message['subject']}")
+            elif self.spool.mark_failed(message, error):
+                log(f"❌[3.2.r Email queue] Giving up after {message['attempts']} attempts: {message['subject']}")
+            else:
+                retry_in = message['next_attempt'] - time.time()
+                log(f"⚠️[3.2.r Email queue] Attempt {message['attempts']} failed, retry in {retry_in:.0f}s: {message['subject']}")
+        return sent
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.process_due()
+            except Exception as e:
+                log(f"❌[3.2.r Email queue] Sender error: {e}")
+            if not self.spool.pending():
+                self._idle.set()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        self.reporter.close()
+
+    def drain(self, timeout: float = 3600) -> bool:
+        """Ждёт, пока очередь опустеет (письма отправлены или попытки исчерпаны)"""
+        deadline = time.time() + timeout
+        self.wakeup()
+        while time.time() < deadline:
+            if not self.spool.pending():
+                return True
+            self._idle.wait(min(self.poll_interval, max(deadline - time.time(), 0)))
+        left = len(self.spool.pending())
+        log(f"⚠️[3.2.r Email queue] {left} message(s) still pending after {timeout:.0f}s")
+        return left == 0
+
+
+_MAIL_spool: Optional[MailSpool] = None
+_MAIL_sender: Optional[MailSender] = None
+
+
+def get_mail_spool(spool_dir: str = None) -> MailSpool:
+    global _MAIL_spool
+    if _MAIL_spool is None:
+        from main._1_Config.main_config import WORKDIR, Paths
+        _MAIL_spool = MailSpool(spool_dir or f"{WORKDIR}/{Paths.MAIL_spool.value}")
+    return _MAIL_spool
+
+
+def get_mail_sender() -> Optional[MailSender]:
+    return _MAIL_sender
+
+
+def start_mail_sender(sender_email: str,
+                      sender_password: str,
+                      config_path: str,
+                      spool_dir: str = None
+                      ) -> Optional[MailSender]:
+    """Запускает фоновую отправку; учётные данные живут только в памяти процесса"""
+    global _MAIL_sender
+    if _MAIL_sender is not None and _MAIL_sender.is_alive():
+        return _MAIL_sender
+    exchange_config = load_exchange_config(config_path      =   config_path,
+                                           sender_email     =   sender_email,
+                                           sender_password  =   sender_password)
+    if not exchange_config:
+        log("❌[3.2.r Email queue] Failed to load configuration, mail sender not started")
+        return None
+    spool = get_mail_spool(spool_dir)
+    _MAIL_sender = MailSender(spool, exchange_config)
+    _MAIL_sender.start()
+    log(f"✅[3.2.r Email queue] Mail sender started, {len(spool.pending())} message(s) pending in {spool.spool_dir}")
+    return _MAIL_sender
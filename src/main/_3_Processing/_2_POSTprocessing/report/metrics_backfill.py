@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import threading
+from glob import glob
+from typing import Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from main._1_Config.main_config import TypeConfig, PrefixName
+from main._3_Processing._2_POSTprocessing.report.stat import METRIC_SCHEMA, metric_seq_type, read_metrics_csv, normalize_metrics
+from main._3_Processing._2_POSTprocessing.report.metrics_store import MetricsStore
+from main._4_Monitoring.structured_log import log
+
+# prefix -> organism ('h' -> 'human')
+ORGANISM_by_prefix  =   {prefix: organism for organism, prefix in PrefixName.organ_dict.value.items()}
+
+
+class _Throttled:
+    """Ограничивает число одновременных обращений к CephFS (stat/scandir/open) для всех потоков"""
+
+    def __init__(self, max_io: int):
+        self.semaphore = threading.BoundedSemaphore(max_io)
+
+    def scandir_dirs(self, path: str) -> List[Tuple[str, str]]:
+        with self.semaphore:
+            try:
+                with os.scandir(path) as entries:
+                    return sorted((entry.name, entry.path) for entry in entries if entry.is_dir(follow_symlinks=False))
+            except (FileNotFoundError, PermissionError):
+                return []
+
+    def mtime(self, path: str) -> float:
+        with self.semaphore:
+            return os.stat(path).st_mtime
+
+    def glob(self, pattern: str) -> List[str]:
+        with self.semaphore:
+            return sorted(glob(pattern))
+
+    def read_json(self, path: str) -> Dict[str, Any]:
+        with self.semaphore:
+            with open(path, 'r') as f:
+                return json.load(f)
+
+    def read_metrics(self, path: str, seq_type: str):
+        with self.semaphore:
+            return read_metrics_csv(path, seq_type)
+
+
+def _split_sample_dir(sample_dir: str) -> Tuple[str, str]:
+    """'962000685201_h' -> ('962000685201', 'human')"""
+    sample_id, _, prefix = sample_dir.rpartition('_')
+    if sample_id and prefix in ORGANISM_by_prefix:
+        return sample_id, ORGANISM_by_prefix[prefix]
+    return sample_dir, None
+
+
+def _crawl_flowcell(io: _Throttled,
+                    seq_type: str,
+                    tool_version: str,
+                    flowcell: str,
+                    flowcell_dir: str,
+                    stat_pattern: str
+                    ) -> Tuple[str, float, List[Tuple], int]:
+    mtime   =   io.mtime(flowcell_dir)
+    info    =   {}
+    for json_path in io.glob(f"{flowcell_dir}/flowcell_sample_processed*.json"):
+        try:
+            info.update(io.read_json(json_path))
+        except Exception as e:
+            log(f"⚠️[3.2.r Metrics backfill] Can't read {json_path}: {e}")
+
+    rows, samples = [], 0
+    for sample_dir, sample_path in io.scandir_dirs(flowcell_dir):
+        if '.bak' in sample_dir or sample_dir.endswith('-sum'):
+            continue
+        stat_paths = io.glob(f"{sample_path}/*{stat_pattern}")
+        if not stat_paths:
+            continue
+        sample_id, organism = _split_sample_dir(sample_dir)
+        sample_info         = info.get(f"{flowcell}:{sample_id}", {})
+        sample_processed    = {
+            'Flowcell'      :   flowcell,
+            'Sample_ID'     :   sample_id,
+            'SeqType'       :   seq_type,
+            'VDJ type'      :   sample_info.get('VDJ type'),
+            'Tool version'  :   tool_version,
+            'Organism'      :   sample_info.get('Organism', organism),
+        }
+        schema_type = metric_seq_type(sample_processed)
+        try:
+            typed = normalize_metrics(io.read_metrics(stat_paths[0], schema_type), schema_type)
+        except Exception as e:
+            log(f"⚠️[3.2.r Metrics backfill] Can't parse {stat_paths[0]}: {e}")
+            continue
+        rows.extend(MetricsStore.sample_rows(sample_processed, metrics=typed, source=stat_paths[0]))
+        samples += 1
+    return flowcell_dir, mtime, rows, samples
+
+
+def backfill_ceph_metrics(store: MetricsStore,
+                          seq_types: List[str]  =   None,
+                          max_workers: int      =   8,
+                          max_io: int           =   4,
+                          force: bool           =   False
+                          ) -> int:
+    """
+    Обходит '{ceph}/{tool version}/{flowcell}/{sample}' для каждого SeqType (шаблон 'stat' из TypeConfig)
+    и загружает метрики в хранилище. Флоуселлы, чей mtime не изменился с прошлого обхода, пропускаются.
+    """
+    seq_types   =   seq_types or [seq_type for seq_type in METRIC_SCHEMA if seq_type in TypeConfig.__members__]
+    io          =   _Throttled(max_io)
+    known       =   {} if force else store.crawl_mtimes()
+    start       =   time.perf_counter()
+
+    tasks = []
+    for seq_type in seq_types:
+        params = TypeConfig[seq_type]._get_params()
+        for tool_version, tool_dir in io.scandir_dirs(params['ceph']):
+            for flowcell, flowcell_dir in io.scandir_dirs(tool_dir):
+                if '.bak' in flowcell:
+                    continue
+                tasks.append((seq_type, tool_version, flowcell, flowcell_dir, params['stat']))
+    log(f"🔎[3.2.r Metrics backfill] {len(tasks)} flowcell dir(s) found, checking mtimes")
+
+    total_rows, total_samples, skipped, done = 0, 0, 0, 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for seq_type, tool_version, flowcell, flowcell_dir, stat_pattern in tasks:
+            if flowcell_dir in known and io.mtime(flowcell_dir) <= known[flowcell_dir]:
+                skipped += 1
+                continue
+            futures.append(executor.submit(_crawl_flowcell, io, seq_type, tool_version,
+                                           flowcell, flowcell_dir, stat_pattern))
+        for future in as_completed(futures):
+            done += 1
+            try:
+                flowcell_dir, mtime, rows, samples = future.result()
+            except Exception as e:
+                log(f"❌[3.2.r Metrics backfill] {e}")
+                continue
+            total_rows      +=  store.add_rows(rows)
+            total_samples   +=  samples
+            store.set_crawl_state(flowcell_dir, mtime, samples)
+            if done % 50 == 0 or done == len(futures):
+                log(f"🕒[3.2.r Metrics backfill] {done}/{len(futures)} flowcells, {total_samples} samples")
+
+    log(f"✅[3.2.r Metrics backfill] {total_samples} samples ({total_rows} values) indexed, "
+          f"{skipped} unchanged flowcell(s) skipped in {time.perf_counter() - start:.0f}s")
+    return total_samples
@@ -0,0 +1,270 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from main._1_Config.main_config import WORKDIR, Paths
+
+GROUP_columns   =   ['seq_type', 'tool_version', 'organism', 'month']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    flowcell        TEXT NOT NULL,
+    sample_id       TEXT NOT NULL,
+    seq_type        TEXT NOT NULL,
+    vdj_type        TEXT NOT NULL DEFAULT '',
+    tool_version    TEXT,
+    organism        TEXT,
+    month           TEXT,
+    metric          TEXT NOT NULL,
+    value           REAL,
+    source          TEXT,
+    loaded_at       TEXT,
+    PRIMARY KEY (flowcell, sample_id, seq_type, vdj_type, metric)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_metrics_tool     ON metrics (metric, tool_version, month);
+CREATE INDEX IF NOT EXISTS idx_metrics_organism ON metrics (metric, organism, month);
+CREATE INDEX IF NOT EXISTS idx_metrics_seqtype  ON metrics (metric, seq_type, month);
+CREATE TABLE IF NOT EXISTS crawl_state (
+    path            TEXT PRIMARY KEY,
+    mtime           REAL NOT NULL,
+    samples         INTEGER,
+    crawled_at      TEXT
+);
+"""
+
+
+def default_store_path(work_dir: str = WORKDIR) -> str:
+    return os.path.join(work_dir, Paths.METRICS_store.value)
+
+
+def flowcell_month(flowcell: str) -> Optional[str]:
+    """'240315_...' -> '2024-03' (дата из имени флоуселла)"""
+    if re.match(r'^\d{6}_', flowcell or ''):
+        try:
+            return datetime.strptime(flowcell[:6], '%y%m%d').strftime('%Y-%m')
+        except ValueError:
+            return None
+    return None
+
+
+class MetricsStore:
+    """
+    Хранилище QC метрик всех флоуселлов (sqlite, длинный формат: одна строка = одна метрика образца).
+    Агрегации по инструменту, организму и месяцу выполняются по индексам.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path    =   db_path or default_store_path()
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn       =   sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def sample_rows(sample_processed: Dict[str, Any],
+                    metrics: Dict[str, Any] = None,
+                    source: str = 'pipeline'
+                    ) -> List[Tuple]:
+        """'Sample metrics' образца -> строки таблицы metrics (нечисловые значения пропускаются)"""
+        metrics     =   sample_processed.get('Sample metrics', {}) if metrics is None else metrics
+        loaded_at   =   time.strftime('%Y-%m-%d %H:%M:%S')
+        flowcell    =   sample_processed['Flowcell']
+        rows = []
+        for metric, value in metrics.items():
+            if value is not None and not isinstance(value, (int, float)):
+                continue
+            rows.append((
+                flowcell,
+                sample_processed['Sample_ID'],
+                sample_processed['SeqType'],
+                sample_processed.get('VDJ type') or '',
+                sample_processed.get('Tool version'),
+                sample_processed.get('Organism'),
+                flowcell_month(flowcell),
+                metric,
+                value,
+                source,
+                loaded_at,
+            ))
+        return rows
+
+    def add_rows(self, rows: Iterable[Tuple]) -> int:
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def add_sample(self, sample_processed: Dict[str, Any], source: str = 'pipeline') -> int:
+        return self.add_rows(self.sample_rows(sample_processed, source=source))
+
+    def crawl_mtimes(self) -> Dict[str, float]:
+        return dict(self.conn.execute('SELECT path, mtime FROM crawl_state'))
+
+    def set_crawl_state(self, path: str, mtime: float, samples: int):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO crawl_state VALUES (?, ?, ?, ?)',
+                              (path, mtime, samples, time.strftime('%Y-%m-%d %H:%M:%S')))
+
+    def list_metrics(self, seq_type: str = None) -> List[str]:
+        if seq_type:
+            cursor = self.conn.execute('SELECT DISTINCT metric FROM metrics WHERE seq_type = ? ORDER BY metric', (seq_type,))
+        else:
+            cursor = self.conn.execute('SELECT DISTINCT metric FROM metrics ORDER BY metric')
+        return [row[0] for row in cursor]
+
+    def aggregate(self,
+                  metric: str,
+                  group_by: List[str]   =   None,
+                  seq_type: str         =   None,
+                  organism: str         =   None,
+                  tool_version: str     =   None,
+                  since: str            =   None,
+                  until: str            =   None
+                  ) -> pd.DataFrame:
+        """
+        Среднее/медиана/min/max метрики по группам ('seq_type', 'tool_version', 'organism', 'month').
+        since/until - месяцы в формате 'YYYY-MM' включительно.
+        """
+        group_by = group_by or ['tool_version', 'organism', 'month']
+        unknown = [col for col in group_by if col not in GROUP_columns]
+        if unknown:
+            raise ValueError(f"Unsupported group columns: {unknown}")
+
+        where, params = ['metric = ?', 'value IS NOT NULL'], [metric]
+        for column, value in (('seq_type', seq_type), ('organism', organism), ('tool_version', tool_version)):
+            if value:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if since:
+            where.append('month >= ?')
+            params.append(since)
+        if until:
+            where.append('month <= ?')
+            params.append(until)
+
+        columns = ', '.join(group_by)
+        query = f"""
+            SELECT {columns}, COUNT(*) AS samples, AVG(value) AS mean, MIN(value) AS min, MAX(value) AS max
+            FROM metrics
+            WHERE {' AND '.join(where)}
+            GROUP BY {columns}
+            ORDER BY {columns}
+        """
+        df = pd.read_sql_query(query, self.conn, params=params)
+        if not df.empty:
+            medians = (pd.read_sql_query(f"SELECT {columns}, value FROM metrics WHERE {' AND '.join(where)}",
+                                         self.conn, params=params)
+                       .groupby(group_by, dropna=False)['value'].median()
+                       .rename('median').reset_index())
+            df = df.merge(medians, on=group_by, how='left')
+        return df
+
+    def samples(self, metric: str, flowcell: str = None, seq_type: str = None) -> pd.DataFrame:
+        where, params = ['metric = ?'], [metric]
+        if flowcell:
+            where.append('flowcell = ?')
+            params.append(flowcell)
+        if seq_type:
+            where.append('seq_type = ?')
+            params.append(seq_type)
+        return pd.read_sql_query(
+            f"SELECT flowcell, sample_id, seq_type, vdj_type, tool_version, organism, month, value "
+            f"FROM metrics WHERE {' AND '.join(where)} ORDER BY month, flowcell, sample_id",
+            self.conn, params=params)
+
+
+def store_flowcell_metrics(flowcell_sample_processed: Dict[str, Dict[str, Any]],
+                           db_path: str = None) -> int:
+    """Добавляет типизированные метрики обработанных образцов флоуселла в хранилище"""
+    try:
+        rows = []
+        for value in flowcell_sample_processed.values():
+            if value.get('Sample metrics'):
+                rows.extend(MetricsStore.sample_rows(value))
+        with MetricsStore(db_path) as store:
+            count = store.add_rows(rows)
+        print(f"✅[3.1.3 Create Summary Dir] {count} metric values saved to {os.path.basename(store.db_path)}")
+        return count
+    except Exception as e:
+        print(f"⚠️[3.1.3 Create Summary Dir] Failed to update metrics store: {e}")
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the cross-flowcell QC metrics store')
+    parser.add_argument('--db', default=None, help=f'path to the store (default: {Paths.METRICS_store.value})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('metrics', help='list stored metric names')
+    list_parser.add_argument('--seqtype', default=None)
+
+    query_parser = subparsers.add_parser('query', help='aggregate a metric by tool/organism/month')
+    query_parser.add_argument('metric')
+    query_parser.add_argument('--by',       nargs='+', default=['tool_version', 'organism', 'month'], choices=GROUP_columns)
+    query_parser.add_argument('--seqtype',  default=None)
+    query_parser.add_argument('--organism', default=None)
+    query_parser.add_argument('--tool',     default=None)
+    query_parser.add_argument('--since',    default=None, help='YYYY-MM')
+    query_parser.add_argument('--until',    default=None, help='YYYY-MM')
+    query_parser.add_argument('--csv',      default=None, help='save result to csv')
+
+    backfill_parser = subparsers.add_parser('backfill', help='index metrics of results already stored in Ceph')
+    backfill_parser.add_argument('--seqtypes',  nargs='+', default=None)
+    backfill_parser.add_argument('--workers',   type=int, default=8)
+    backfill_parser.add_argument('--max-io',    type=int, default=4, help='max concurrent stat/open calls on CephFS')
+    backfill_parser.add_argument('--force',     action='store_true', help='ignore saved directory mtimes')
+
+    args = parser.parse_args()
+    with MetricsStore(args.db) as store:
+        if args.command == 'backfill':
+            from main._3_Processing._2_POSTprocessing.report.metrics_backfill import backfill_ceph_metrics
+            backfill_ceph_metrics(store         =   store,
+                                  seq_types     =   args.seqtypes,
+                                  max_workers   =   args.workers,
+                                  max_io        =   args.max_io,
+                                  force         =   args.force)
+            return
+        if args.command == 'metrics':
+            print('\n'.join(store.list_metrics(args.seqtype)))
+            return
+        start = time.perf_counter()
+        df = store.aggregate(metric       =   args.metric,
+                             group_by     =   args.by,
+                             seq_type     =   args.seqtype,
+                             organism     =   args.organism,
+                             tool_version =   args.tool,
+                             since        =   args.since,
+                             until        =   args.until)
+        elapsed = (time.perf_counter() - start) * 1000
+    if df.empty:
+        print(f"⚠️ No values for metric '{args.metric}'")
+        sys.exit(1)
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print(f"📊 {len(df)} group(s), {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,319 +1,252 @@
-from    typing import   Dict, List
+from    typing import   Dict, List, Tuple, Any, Optional
+import  numpy  as       np
 import  pandas as       pd
 import  os
 
+from main._4_Monitoring.process_sampler import resource_columns
+from main._4_Monitoring.structured_log import log
 
-def collect_and_save_statistics_sample(sample_processed: dict, 
-                                stat_full_path: str
-                                ) -> dict:
-    COLUMN_MAPPINGS: Dict[str, List[str]] = {
-        'SC_TENX_RNA': [
-            'estimated number of cells', 'mean reads per cell', 'median genes per cell',
-            'number of reads', 'reads mapped confidently to genome', 'total genes detected',
-            'median umi counts per cell'
-        ],
-        'SC_TENX_ATAC': [
-            'estimated number of cells', 'mean raw read pairs per cell',
-            'median high-quality fragments per cell',
-            'fraction of high-quality fragments overlapping peaks',
-            'sequenced read pairs', 'number of peaks'
-        ],
-        'SC_TENX_Visium_FFPE': [
-            'number of spots under tissue', 'mean reads per spot',
-            'median genes per spot', 'number of reads',
-            'reads mapped confidently to probe set', 'genes detected', 'median umi counts per spot'
-        ],
-        'SC_SeekGene_RNA': [
-            'estimated_number_of_cells', 'mean_reads_per_cell',
-            'median_genes_per_cell', 'number_of_reads',
-            'reads_mapped_confidently_to_genome', 'total_genes_detected', 'median_umi_counts_per_cell'
-        ],
-        'SC_SeekGene_FullRNA': [
-            'estimated_number_of_cells', 'mean_reads_per_cell',
-            'median_genes_per_cell', 'number_of_reads',
-            'reads_mapped_confidently_to_genome', 'total_genes_detected', 'median_umi_counts_per_cell'
-        ],
-        'SC_SeekGene_VDJ': [
-            'estimated number of cells', 'mean read pairs per cell',
-            'number of cells with productive v-j spanning pair', 'number of read pairs',
-            'reads mapped to any v(d)j gene', 'reads mapped to tra', 'reads mapped to trb',
-            'median tra umis per cell', 'median trb umis per cell', 'q30 bases in umi'
-        ],
-        'SC_TENX_Multiome': [
-            'estimated number of cells',
-            'gex fraction of transcriptomic reads in cells', 'gex mean raw reads per cell', 'gex median genes per cell',
-            'gex median umi counts per cell', 'gex reads mapped confidently to genome', 'gex total genes detected',
-            'atac mean raw read pairs per cell', 'atac median high-quality fragments per cell',
-            'atac fraction of high-quality fragments overlapping peaks', 'atac sequenced read pairs', 'atac number of peaks'
-        ],
-        'SC_SeekGene_Multiome': [
-            'estimated_number_of_cells',
-            'gex_fraction_of_reads_in_cells', 'gex_mean_raw_reads_per_cell', 'gex_median_genes_per_cell',
-            'gex_median_umi_counts_per_cell', 'gex_reads_mapped_confidently_to_genome', 'gex_total_genes_detected',
-            'atac_mean_raw_read_pairs_per_cell', 'atac_median_high-quality_fragments_per_cell',
-            'atac_fraction_of_genome_in_peaks', 'atac_sequenced_read_pairs', 'atac_number_of_peaks'
-        ],
-        'SC_TENX_CellPlex' : [
-            'cells','number of reads in cells','median genes per cell',
-            'total genes detected','median umi counts per cell',
-            'confidently mapped to genome'
-        ]
-    }
+INT, FLOAT, PERCENT, TEXT   =   'int', 'float', 'percent', 'text'
 
-    FORMAT_RULES = {
-        'SC_TENX_RNA': {
-            'int_columns': [
-                'estimated number of cells',
-                'mean reads per cell',
-                'median genes per cell',
-                'number of reads',
-                'total genes detected',
-                'median umi counts per cell'
-            ],
-            'percent_columns': ['reads mapped confidently to genome']
-        },
-        'SC_TENX_ATAC': {
-            'int_columns': [
-                'estimated number of cells',
-                'median high-quality fragments per cell',
-                'sequenced read pairs',
-                'number of peaks'
-            ],
-            'float_columns': ['mean raw read pairs per cell'],
-            'percent_columns': ['fraction of high-quality fragments overlapping peaks']
-        },
-        'SC_TENX_Visium_FFPE': {
-            'int_columns': [
-                'number of spots under tissue',
-                'mean reads per spot',
-                'median genes per spot',
-                'number of reads',
-                'genes detected',
-                'median umi counts per spot'
-            ],
-            'percent_columns': ['reads mapped confidently to probe set']
-        },
-        'SC_SeekGene_RNA': {
-            'int_columns': [
-                'estimated_number_of_cells',
-                'mean_reads_per_cell',
-                'median_genes_per_cell',
-                'number_of_reads',
-                'total_genes_detected',
-                'median_umi_counts_per_cell'
-            ],
-            'percent_columns': ['reads_mapped_confidently_to_genome']
-        },
-        'SC_SeekGene_FullRNA': {
-            'int_columns': [
-                'estimated_number_of_cells',
-                'mean_reads_per_cell',
-                'median_genes_per_cell',
-                'number_of_reads',
-                'total_genes_detected',
-                'median_umi_counts_per_cell'
-            ],
-            'percent_columns': ['reads_mapped_confidently_to_genome']
-        },
-        'SC_SeekGene_VDJ': {
-            'int_columns': [
-                'estimated number of cells',
-                'mean read pairs per cell',
-                'number of read pairs',
-                'median tra umis per cell',
-                'median trb umis per cell',
-                'number of cells with productive v-j spanning pair'
-            ],
-            'percent_columns': [
-                'reads mapped to any v(d)j gene',
-                'reads mapped to tra',
-                'reads mapped to trb',
-                'q30 bases in umi'
-            ]
-        },
-        'SC_TENX_Multiome': {
-            'int_columns': [
-                'estimated number of cells',
-                'gex median genes per cell',
-                'gex median umi counts per cell',
-                'gex total genes detected',
-                'atac median high-quality fragments per cell',
-                'atac sequenced read pairs',
-                'atac number of peaks'
-            ],
-            'float_columns': [
-                'gex mean raw reads per cell',
-                'atac mean raw read pairs per cell'
-            ],
-            'percent_columns': [
-                'gex fraction of transcriptomic reads in cells',
-                'gex reads mapped confidently to genome',
-                'atac fraction of high-quality fragments overlapping peaks'
-            ]
-        },
-        'SC_SeekGene_Multiome': {
-            'int_columns': [
-                'estimated_number_of_cells',
-                'gex_mean_raw_reads_per_cell',
-                'gex_median_genes_per_cell',
-                'gex_median_umi_counts_per_cell',
-                'gex_total_genes_detected',
-                'atac_mean_raw_read_pairs_per_cell',
-                'atac_median_high-quality_fragments_per_cell',
-                'atac_sequenced_read_pairs',
-                'atac_number_of_peaks'
-            ],
-            'percent_columns': [
-                'gex_fraction_of_reads_in_cells',
-                'gex_reads_mapped_confidently_to_genome',
-                'atac_fraction_of_genome_in_peaks'
-            ]
-        },
-        'SC_TENX_CellPlex': {
-            'int_columns': [
-                'cells',
-                'number of reads in cells',
-                'median genes per cell',
-                'total genes detected',
-                'median umi counts per cell'
-            ],
-            'percent_columns': ['confidently mapped to genome']
+# SeqType : [(column in metrics csv (lower case), type)]
+METRIC_SCHEMA_SPEC: Dict[str, List[Tuple[str, str]]] = {
+    'SC_TENX_RNA': [
+        ('estimated number of cells',                   INT),
+        ('mean reads per cell',                         INT),
+        ('median genes per cell',                       INT),
+        ('number of reads',                             INT),
+        ('reads mapped confidently to genome',          PERCENT),
+        ('total genes detected',                        INT),
+        ('median umi counts per cell',                  INT),
+    ],
+    'SC_TENX_ATAC': [
+        ('estimated number of cells',                   INT),
+        ('mean raw read pairs per cell',                FLOAT),
+        ('median high-quality fragments per cell',      INT),
+        ('fraction of high-quality fragments overlapping peaks', PERCENT),
+        ('sequenced read pairs',                        INT),
+        ('number of peaks',                             INT),
+    ],
+    'SC_TENX_Visium_FFPE': [
+        ('number of spots under tissue',                INT),
+        ('mean reads per spot',                         INT),
+        ('median genes per spot',                       INT),
+        ('number of reads',                             INT),
+        ('reads mapped confidently to probe set',       PERCENT),
+        ('genes detected',                              INT),
+        ('median umi counts per spot',                  INT),
+    ],
+    'SC_SeekGene_RNA': [
+        ('estimated_number_of_cells',                   INT),
+        ('mean_reads_per_cell',                         INT),
+        ('median_genes_per_cell',                       INT),
+        ('number_of_reads',                             INT),
+        ('reads_mapped_confidently_to_genome',          PERCENT),
+        ('total_genes_detected',                        INT),
+        ('median_umi_counts_per_cell',                  INT),
+    ],
+    'SC_SeekGene_FullRNA': [
+        ('estimated_number_of_cells',                   INT),
+        ('mean_reads_per_cell',                         INT),
+        ('median_genes_per_cell',                       INT),
+        ('number_of_reads',                             INT),
+        ('reads_mapped_confidently_to_genome',          PERCENT),
+        ('total_genes_detected',                        INT),
+        ('median_umi_counts_per_cell',                  INT),
+    ],
+    'SC_SeekGene_VDJ': [
+        ('estimated number of cells',                   INT),
+        ('mean read pairs per cell',                    INT),
+        ('number of cells with productive v-j spanning pair', INT),
+        ('number of read pairs',                        INT),
+        ('reads mapped to any v(d)j gene',              PERCENT),
+        ('reads mapped to tra',                         PERCENT),
+        ('reads mapped to trb',                         PERCENT),
+        ('median tra umis per cell',                    INT),
+        ('median trb umis per cell',                    INT),
+        ('q30 bases in umi',                            PERCENT),
+    ],
+    'SC_TENX_Multiome': [
+        ('estimated number of cells',                   INT),
+        ('gex fraction of transcriptomic reads in cells', PERCENT),
+        ('gex mean raw reads per cell',                 FLOAT),
+        ('gex median genes per cell',                   INT),
+        ('gex median umi counts per cell',              INT),
+        ('gex reads mapped confidently to genome',      PERCENT),
+        ('gex total genes detected',                    INT),
+        ('atac mean raw read pairs per cell',           FLOAT),
+        ('atac median high-quality fragments per cell', INT),
+        ('atac fraction of high-quality fragments overlapping peaks', PERCENT),
+        ('atac sequenced read pairs',                   INT),
+        ('atac number of peaks',                        INT),
+    ],
+    'SC_SeekGene_Multiome': [
+        ('estimated_number_of_cells',                   INT),
+        ('gex_fraction_of_reads_in_cells',              PERCENT),
+        ('gex_mean_raw_reads_per_cell',                 INT),
+        ('gex_median_genes_per_cell',                   INT),
+        ('gex_median_umi_counts_per_cell',              INT),
+        ('gex_reads_mapped_confidently_to_genome',      PERCENT),
+        ('gex_total_genes_detected',                    INT),
+        ('atac_mean_raw_read_pairs_per_cell',           INT),
+        ('atac_median_high-quality_fragments_per_cell', INT),
+        ('atac_fraction_of_genome_in_peaks',            PERCENT),
+        ('atac_sequenced_read_pairs',                   INT),
+        ('atac_number_of_peaks',                        INT),
+    ],
+    'SC_TENX_CellPlex': [
+        ('cells',                                       INT),
+        ('number of reads in cells',                    INT),
+        ('median genes per cell',                       INT),
+        ('total genes detected',                        INT),
+        ('median umi counts per cell',                  INT),
+        ('confidently mapped to genome',                PERCENT),
+    ],
 }
+
+# Kept for callers that only need the column lists
+COLUMN_MAPPINGS: Dict[str, List[str]] = {seq_type: [col for col, _ in spec] for seq_type, spec in METRIC_SCHEMA_SPEC.items()}
+
+
+def _compile_metric_schema(spec: Dict[str, List[Tuple[str, str]]]) -> Dict[str, Dict[str, Any]]:
+    schema = {}
+    for seq_type, columns in spec.items():
+        schema[seq_type] = {
+            'columns'   :   [col for col, _ in columns],
+            'names'     :   [col.replace('_', ' ') for col, _ in columns],
+            'kinds'     :   np.array([kind for _, kind in columns]),
+        }
+    return schema
+
+METRIC_SCHEMA   =   _compile_metric_schema(METRIC_SCHEMA_SPEC)
+
+
+def metric_seq_type(sample_processed: dict) -> str:
+    """Схема метрик для образца: 5' VDJ обрабатывается как SeekGene scRNA"""
+    seq_type = sample_processed['SeqType']
+    if seq_type == 'SC_SeekGene_VDJ' and sample_processed.get('VDJ type') == '5':
+        return 'SC_SeekGene_RNA'
+    return seq_type
+
+
+def read_metrics_csv(stat_full_path: str, seq_type: str) -> pd.DataFrame:
+    df_stat = pd.read_csv(stat_full_path, dtype=str)
+    if seq_type == 'SC_TENX_CellPlex':
+        df_stat = df_stat[df_stat['Category'] == 'Cells'][['Metric Name', 'Metric Value']]
+        df_stat = df_stat.set_index('Metric Name').T.reset_index(drop=True)
+        df_stat.columns.name = None
+    df_stat.columns = [x.lower() for x in df_stat.columns]
+    return df_stat
+
+
+def normalize_metrics(df_stat: pd.DataFrame, seq_type: str) -> Dict[str, Any]:
+    """
+    Первая строка csv метрик -> {имя метрики: int | float | None}.
+    Проценты приводятся к шкале 0-100.
+    """
+    schema = METRIC_SCHEMA.get(seq_type)
+    if schema is None:
+        return {}
+    if df_stat.empty:
+        return {name: None for name in schema['names']}
+
+    raw         =   df_stat.reindex(columns=schema['columns']).iloc[0]
+    text        =   raw.astype(str).str.replace(',', '', regex=False).str.strip()
+    missing     =   raw.isna().to_numpy() | text.str.lower().isin(['nan', 'na', 'n/a', '']).to_numpy() \
+                    | text.str.startswith('-').to_numpy()
+    has_percent =   text.str.contains('%', regex=False).to_numpy()
+    numbers     =   pd.to_numeric(text.str.replace('%', '', regex=False), errors='coerce').to_numpy(dtype=float)
+    numbers[missing] = np.nan
+
+    kinds       =   schema['kinds']
+    percent     =   (kinds == PERCENT) & ~has_percent
+    numbers     =   np.where(percent & (numbers < 1),   numbers * 100, numbers)
+    numbers     =   np.where(percent & (numbers > 100), numbers / 100, numbers)
+
+    typed = {}
+    for name, kind, value, raw_text, is_missing in zip(schema['names'], kinds, numbers, text, missing):
+        if kind == TEXT:
+            typed[name] = None if is_missing else raw_text
+        elif np.isnan(value):
+            typed[name] = None
+        elif kind == INT and float(value).is_integer():
+            typed[name] = int(value)
+        else:
+            typed[name] = float(value)
+    return typed
+
+
+def render_metrics(typed: Dict[str, Any], seq_type: str) -> Dict[str, str]:
+    """Типизированные метрики -> строки для таблицы статистики и письма"""
+    schema = METRIC_SCHEMA.get(seq_type)
+    if schema is None:
+        return {}
+    rendered = {}
+    for name, kind in zip(schema['names'], schema['kinds']):
+        value = typed.get(name)
+        if value is None:
+            rendered[name] = 'N/A'
+        elif kind == PERCENT:
+            rendered[name] = f"{value:.2f}%"
+        elif kind == FLOAT:
+            rendered[name] = f"{value:.2f}"
+        else:
+            rendered[name] = str(value)
+    return rendered
+
+
+def save_sample_metrics_row(sample_processed: dict, typed: Dict[str, Any]) -> Optional[str]:
+    """Типизированная строка метрик образца: '<sum dir>/metrics/<Sample_ID>.parquet'"""
+    sum_stat_dir = sample_processed.get('Path local sum stat')
+    if not sum_stat_dir:
+        return None
+    row = {
+        'Flowcell'      :   sample_processed['Flowcell'],
+        'Sample_ID'     :   sample_processed['Sample_ID'],
+        'SeqType'       :   sample_processed['SeqType'],
+        'VDJ type'      :   sample_processed.get('VDJ type'),
+        'Tool version'  :   sample_processed.get('Tool version'),
+        'Organism'      :   sample_processed.get('Organism'),
+        'Reference name':   sample_processed.get('Reference name'),
     }
+    row.update(typed)
+    metrics_dir = os.path.join(sum_stat_dir, 'metrics')
+    os.makedirs(metrics_dir, exist_ok=True)
+    df_row = pd.DataFrame([row])
+    try:
+        path = os.path.join(metrics_dir, f"{sample_processed['Sample_ID']}.parquet")
+        df_row.to_parquet(path, index=False)
+    except ImportError:
+        # no pyarrow/fastparquet in the environment
+        path = os.path.join(metrics_dir, f"{sample_processed['Sample_ID']}.json")
+        df_row.to_json(path, orient='records')
+    return path
 
+
+def collect_and_save_statistics_sample(sample_processed: dict,
+                                stat_full_path: str
+                                ) -> dict:
     sample_id   = sample_processed['Sample_ID']
-    seq_type    = sample_processed['SeqType']
-    if seq_type == 'SC_SeekGene_VDJ' and sample_processed['VDJ type'] == '5':
-        seq_type    =   'SC_SeekGene_RNA'
-    
-    
-    sample_stat = {}
+    seq_type    = metric_seq_type(sample_processed)
+    schema      = METRIC_SCHEMA.get(seq_type, {'names': []})
+
     try:
-        print(stat_full_path)
         if not stat_full_path or not os.path.exists(stat_full_path):
-            print(f"⚠️[3.2.r Statistic summary] No statistics file for sample: {sample_id}")
-            for col in COLUMN_MAPPINGS.get(seq_type, []):
-                sample_stat[col.replace('_', ' ')] = 'N/A'
+            log(f"⚠️[3.2.r Statistic summary] No statistics file for sample: {sample_id}")
+            typed = {name: None for name in schema['names']}
         else:
-            df_stat         =   pd.read_csv(stat_full_path)
-            
-            if seq_type == 'SC_TENX_CellPlex':
-                df_stat = df_stat[df_stat['Category'] == 'Cells'][['Metric Name', 'Metric Value']]
-                df_stat = df_stat.set_index('Metric Name').T.reset_index(drop=True)
-                df_stat.columns.name = None
-
-            df_stat.columns =   [x.lower() for x in df_stat.columns]
-            
-            if not df_stat.empty:
-                
-                columns = COLUMN_MAPPINGS.get(seq_type, [])
-                for col in columns:
-                    if col in df_stat.columns:
-                        value = df_stat[col].iloc[0]
-                        if pd.isna(value):
-                            sample_stat[col.replace('_', ' ')] = 'N/A'
-                            continue
-                        
-                        def clean_numeric_value(val):
-                            if isinstance(val, str):
-                                val = val.replace(',', '').strip()
-                                if val.startswith('-') or val.lower() in ['nan', 'na', 'n/a']:
-                                    return 'N/A'
-                                if val.endswith('.0'):
-                                    val = val[:-2]
-                                if '%' in val:
-                                    return val
-                            elif isinstance(val, (int, float)):
-                                if isinstance(val, float) and val.is_integer():
-                                    val = int(val)
-                                return str(val)
-                            return str(val)
-                        
-                        formatted_value = value
-                        format_rules = FORMAT_RULES.get(seq_type, {})
-                        
-                        if col in format_rules.get('percent_columns', []):
-                            try:
-                                cleaned_value = clean_numeric_value(value)
-                                if cleaned_value == 'N/A':
-                                    formatted_value = 'N/A'
-                                elif isinstance(cleaned_value, str) and '%' in cleaned_value:
-                                    formatted_value = cleaned_value
-                                else:
-                                    num_str = str(cleaned_value).replace(',', '').replace('%', '').strip()
-                                    num_value = float(num_str)
-                                    if num_value < 0:
-                                        formatted_value = 'N/A'
-                                    elif num_value < 1:
-                                        formatted_value = f"{num_value * 100:.2f}%"
-                                    elif num_value <= 100:
-                                        formatted_value = f"{num_value:.2f}%"
-                                    else:
-                                        formatted_value = f"{num_value / 100:.2f}%"
-                            except (ValueError, TypeError):
-                                formatted_value = 'N/A'
-                                
-                        elif col in format_rules.get('int_columns', []):
-                            try:
-                                cleaned_value = clean_numeric_value(value)
-                                if cleaned_value == 'N/A':
-                                    formatted_value = 'N/A'
-                                else:
-                                    num_str = str(cleaned_value).replace(',', '').strip()
-                                    if '.' in num_str:
-                                        num_parts = num_str.split('.')
-                                        decimal_part = num_parts[1].rstrip('0')
-                                        if decimal_part == '':
-                                            formatted_value = num_parts[0]
-                                        else:
-                                            num_value = float(num_str)
-                                            if num_value.is_integer():
-                                                formatted_value = str(int(num_value))
-                                            else:
-                                                formatted_value = num_str
-                                    else:
-                                        try:
-                                            num_value = float(num_str)
-                                            if num_value.is_integer():
-                                                formatted_value = str(int(num_value))
-                                            else:
-                                                formatted_value = num_str
-                                        except:
-                                            formatted_value = num_str
-                            except (ValueError, TypeError) as e:
-                                print(f"Debug: Error processing int column {col}: {e}, value: {value}")
-                                formatted_value = 'N/A'
-                                
-                        elif col in format_rules.get('float_columns', []):
-                            try:
-                                cleaned_value = clean_numeric_value(value)
-                                if cleaned_value == 'N/A':
-                                    formatted_value = 'N/A'
-                                else:
-                                    num_str = str(cleaned_value).replace(',', '').strip()
-                                    formatted_value = f"{float(num_str):.2f}"
-                            except (ValueError, TypeError):
-                                formatted_value = 'N/A'
-                        else:
-                            cleaned_value = clean_numeric_value(value)
-                            if cleaned_value == 'N/A':
-                                formatted_value = 'N/A'
-                            else:
-                                formatted_value = cleaned_value
-                        
-                        sample_stat[col.replace('_', ' ')] = formatted_value
-                    else:
-                        sample_stat[col.replace('_', ' ')] = 'N/A'
-            else:
-                print(f"⚠️[3.2.r Statistic summary] Statistics file is empty for sample: {sample_id}")
-                for col in COLUMN_MAPPINGS.get(seq_type, []):
-                    sample_stat[col.replace('_', ' ')] = 'N/A'
-        sample_processed['Sample stat'] = sample_stat
-        print(f"✅[3.2.r Statistic summary] Statistics collected and formatted for sample: {sample_id}")
+            df_stat = read_metrics_csv(stat_full_path, seq_type)
+            if df_stat.empty:
+                log(f"⚠️[3.2.r Statistic summary] Statistics file is empty for sample: {sample_id}")
+            typed = normalize_metrics(df_stat, seq_type)
+        sample_processed['Sample metrics']  = typed
+        sample_processed['Sample stat']     = render_metrics(typed, seq_type)
+        save_sample_metrics_row(sample_processed, typed)
+        log(f"✅[3.2.r Statistic summary] Statistics collected and formatted for sample: {sample_id}")
     except Exception as e:
-        print(f"❌[3.2.r Statistic summary] Error processing statistics for {sample_id}: {e}")
+        log(f"❌[3.2.r Statistic summary] Error processing statistics for {sample_id}: {e}")
         sample_processed['Sample stat'] = {'error': str(e)}
-    
+
     return sample_processed
 
 
@@ -323,31 +256,10 @@ def create_flowcell_statistics_table(flowcell_sample_processed: dict) -> pd.Data
         sample_id   = value.get('Sample_ID', key)
         seq_type    = value.get('SeqType', '')
         vdj_type    = value.get('VDJ type', '')
-
         sample_stat = value.get('Sample stat', {})
-        
-        if not sample_stat:
-            row_data = {'Sample_ID': sample_id}
-            all_rows.append(row_data)
-            continue
-        
-        cleaned_stat = {}
-        for stat_key, stat_value in sample_stat.items():
-            if isinstance(stat_value, (int, float)):
-                if isinstance(stat_value, float) and stat_value.is_integer():
-                    cleaned_stat[stat_key] = str(int(stat_value))
-                else:
-                    cleaned_stat[stat_key] = str(stat_value)
-            elif isinstance(stat_value, str):
-                if stat_value.endswith('.0'):
-                    cleaned_stat[stat_key] = stat_value[:-2]
-                else:
-                    cleaned_stat[stat_key] = stat_value
-            else:
-                cleaned_stat[stat_key] = stat_value
-        
+
+        row_data = {'Sample_ID': sample_id}
         if seq_type == 'SC_SeekGene_VDJ':
-            prefix = ""
             if vdj_type == '5':
                 prefix = "RNA: "
             elif vdj_type == 'TR':
@@ -356,39 +268,13 @@ def create_flowcell_statistics_table(flowcell_sample_processed: dict) -> pd.Data
                 prefix = "VDJ IG: "
             else:
                 prefix = "VDJ: "
-            
-            row_data = {'Sample_ID': sample_id}
-            for stat_key, stat_value in cleaned_stat.items():
-                if stat_key != 'Sample_ID':
-                    new_key = f"{prefix}{stat_key}"
-                    if isinstance(stat_value, str) and stat_value.endswith('.0'):
-                        stat_value = stat_value[:-2]
-                    row_data[new_key] = stat_value
+            row_data.update({f"{prefix}{stat_key}": stat_value for stat_key, stat_value in sample_stat.items()})
         else:
-            row_data = cleaned_stat.copy()
-            row_data['Sample_ID'] = sample_id
-        
+            row_data.update(sample_stat)
+        row_data.update(resource_columns(value.get('Resource usage')))
         all_rows.append(row_data)
-    
+
     if not all_rows:
         return pd.DataFrame()
-    
-    df = pd.DataFrame(all_rows)
-    if 'Sample_ID' in df.columns:
-        cols = ['Sample_ID'] + [col for col in df.columns if col != 'Sample_ID']
-        df = df[cols]
-    for col in df.columns:
-        if col != 'Sample_ID':
-            df[col] = df[col].apply(
-                lambda x: str(x)[:-2] if isinstance(x, str) and str(x).endswith('.0') 
-                else (str(int(x)) if isinstance(x, float) and not pd.isna(x) and x.is_integer() 
-                     else x)
-            )
-            df[col] = df[col].apply(
-                lambda x: str(int(x)) if hasattr(x, 'is_integer') and hasattr(x, '__class__') 
-                and x.__class__.__name__ in ['float64', 'float32', 'float'] 
-                and not pd.isna(x) and x.is_integer() 
-                else x
-            )
-    
-    return df
\ No newline at end of file
+
+    return pd.DataFrame(all_rows)
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Any, Optional
+
+from main._4_Monitoring.structured_log import log
+
+# Parameters which change the preprocessed AnnData (QC, HVG, PCA, UMAP); 'resolution' is not used by preprocess_adata
+PREPROCESS_PARAMS   =   ['min_genes', 'min_cells', 'max_genes', 'max_cells', 'n_top_genes', 'n_pcs']
+MTX_FILES           =   ['matrix.mtx.gz', 'barcodes.tsv.gz', 'features.tsv.gz']
+
+# Decisions of plan_annotation
+PLAN_SKIP           =   'skip'      # nothing changed
+PLAN_PLOT           =   'plot'      # only PNG is missing, render from plot cache
+PLAN_PREDICT        =   'predict'   # model changed, reuse preprocessed AnnData
+PLAN_FULL           =   'full'      # input or preprocessing parameters changed
+
+
+def manifest_path(output_file: str) -> str:
+    """'..._annotated_scParadise.h5ad' -> '..._annotated_scParadise_manifest.json'"""
+    return output_file.replace('.h5ad', '_manifest.json')
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        log(f"⚠️[3.2.sc Annotation] Broken annotation manifest {path}: {e}")
+        return None
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> str:
+    manifest['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _input_files(input_path: str) -> list:
+    if os.path.isdir(input_path):
+        return [os.path.join(input_path, f) for f in MTX_FILES]
+    return [input_path]
+
+
+def input_signature(input_path: str) -> Dict[str, list]:
+    """Размер и mtime входных файлов, чтобы не пересчитывать хэш без необходимости"""
+    signature = {}
+    for file_path in _input_files(input_path):
+        stat = os.stat(file_path)
+        signature[os.path.basename(file_path)] = [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+def matrix_hash(input_path: str,
+                previous: Optional[Dict[str, Any]] = None,
+                chunk_size: int = 8 * 1024 * 1024
+                ) -> str:
+    """sha256 матрицы (h5 файл или директория с mtx); берётся из манифеста, если файлы не менялись"""
+    signature = input_signature(input_path)
+    if previous and previous.get('input_signature') == signature and previous.get('input_hash'):
+        return previous['input_hash']
+    digest = hashlib.sha256()
+    for file_path in _input_files(input_path):
+        digest.update(os.path.basename(file_path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(input_path: str,
+                   input_hash: str,
+                   model: str,
+                   model_version: str,
+                   params: Dict[str, Any],
+                   annotated_h5ad: str,
+                   plot_cache: str,
+                   png: str
+                   ) -> Dict[str, Any]:
+    return {
+        'input'             :   input_path,
+        'input_hash'        :   input_hash,
+        'input_signature'   :   input_signature(input_path),
+        'model'             :   model,
+        'model_version'     :   model_version,
+        'params'            :   {key: params.get(key) for key in PREPROCESS_PARAMS},
+        'annotated_h5ad'    :   annotated_h5ad,
+        'plot_cache'        :   plot_cache,
+        'png'               :   png,
+    }
+
+
+def plan_annotation(manifest: Optional[Dict[str, Any]],
+                    input_hash: str,
+                    model: str,
+                    model_version: str,
+                    params: Dict[str, Any]
+                    ) -> str:
+    if not manifest:
+        return PLAN_FULL
+    if manifest.get('input_hash') != input_hash:
+        return PLAN_FULL
+    stored_params = manifest.get('params') or {}
+    # keys outside PREPROCESS_PARAMS (e.g. 'resolution' in older manifests) do not force a full re-run
+    if {key: stored_params.get(key) for key in PREPROCESS_PARAMS} != {key: params.get(key) for key in PREPROCESS_PARAMS}:
+        return PLAN_FULL
+    annotated_h5ad = manifest.get('annotated_h5ad')
+    if not annotated_h5ad or not os.path.exists(annotated_h5ad):
+        return PLAN_FULL
+    if manifest.get('model') != model or manifest.get('model_version') != model_version:
+        return PLAN_PREDICT
+    png = manifest.get('png')
+    if png and os.path.exists(png):
+        return PLAN_SKIP
+    plot_cache = manifest.get('plot_cache')
+    if plot_cache and os.path.exists(plot_cache):
+        return PLAN_PLOT
+    return PLAN_PREDICT
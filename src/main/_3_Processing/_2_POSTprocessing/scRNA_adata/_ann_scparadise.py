@@ -3,17 +3,96 @@ import warnings
 from glob import glob
 warnings.simplefilter('ignore')
 import scparadise
-import matplotlib.pyplot as plt
 import sys
 import os
 import traceback
-from glob import glob
-import logging
 from io import StringIO
-import logging
+from glob import glob
 from typing import Dict, Any, Tuple
 from main._3_Processing._2_POSTprocessing.scRNA_adata.create_adata_SG import create_anndata_from_mtx
+from main._3_Processing._2_POSTprocessing.scRNA_adata._plot_annotation import save_plot_cache, plot_cache_path, \
+                                                                            pending_plot_caches, render_annotation_plot
+from main._3_Processing._2_POSTprocessing.scRNA_adata._ann_manifest import manifest_path, load_manifest, save_manifest, \
+                                                                         matrix_hash, build_manifest, plan_annotation, \
+                                                                         PLAN_SKIP, PLAN_PLOT, PLAN_PREDICT, PLAN_FULL
 from main._1_Config.main_config import  WORKDIR
+from main._4_Monitoring.structured_log import get_logger, log_context, capture_logs, log
+
+
+DEFAULT_ANNOTATION_PARAMS   =   {
+    'min_genes'     :   200,
+    'min_cells'     :   3,
+    'max_genes'     :   5000,
+    'max_cells'     :   20000,
+    'n_top_genes'   :   3000,
+    'n_pcs'         :   20,
+    'resolution'    :   1.0,
+}
+
+
+def resolve_scparadise_model(species: str,
+                             tissue_type: str,
+                             model_name: str = None
+                             ) -> Tuple[str, str]:
+    """Возвращает (модель, версия модели) для вида/ткани или для явно заданной модели"""
+    df  =   scparadise.scadam.available_models()
+    if model_name:
+        df_model    =   df[df['Tissue/Model name'] == model_name]
+    else:
+        df_temp_org     =   df[df['Tissue/Model name'].str.contains(f'{species}_', case=False)]
+        df_temp_tiss    =   df_temp_org[(df_temp_org['Tissue/Model name'].str.contains(tissue_type.split(';')[0], case=False))]
+        df_model        =   df_temp_tiss[(df_temp_tiss['Suspension'].str.contains(tissue_type.split(';')[1], case=False))]
+    if len(df_model) == 0:
+        return None, None
+    MODEL           =   df_model.iloc[0]['Tissue/Model name']
+    version_columns =   [x for x in df_model.columns if 'version' in x.lower()]
+    if version_columns:
+        model_version = str(df_model.iloc[0][version_columns[0]])
+    else:
+        model_version = f"scparadise-{getattr(scparadise, '__version__', 'unknown')}"
+    return MODEL, model_version
+
+
+def preprocess_adata(adata,
+                     min_genes   =   200,
+                     min_cells   =   3,
+                     max_genes   =   5000,
+                     max_cells   =   20000,
+                     n_top_genes =   3000,
+                     n_pcs       =   20,
+                     **kwargs):
+    adata.var["mt"]     =   adata.var_names.str.startswith("MT-")
+    adata.var["ribo"]   =   adata.var_names.str.startswith(("RPS", "RPL"))
+    adata.var["hb"]     =   adata.var_names.str.contains("^HB[^(P)]")
+    sc.pp.calculate_qc_metrics(adata, 
+                               qc_vars  =   ["mt", "ribo", "hb"], 
+                               inplace  =   True, 
+                               log1p    =   True)
+    sc.pp.filter_cells(adata, 
+                       min_genes    =   min_genes)
+    sc.pp.filter_genes(adata, 
+                       min_cells    =   min_cells)
+    sc.pp.scrublet(adata)
+    adata   =   adata[adata.obs['predicted_doublet'] == False]
+    sc.pp.filter_cells(adata, 
+                       max_genes    =   max_genes)
+    sc.pp.filter_cells(adata, 
+                       max_counts   =   max_cells)
+    adata   =   adata[adata.obs['pct_counts_mt'] < 15]
+    sc.pp.normalize_total(adata,
+                          target_sum=   1e4)
+    sc.pp.log1p(adata)
+    adata.raw   =   adata
+    sc.pp.highly_variable_genes(adata, 
+                                n_top_genes =   n_top_genes)
+    sc.tl.pca(adata)
+
+    min_pcs	=	min(n_pcs, len(adata.obs)-1)
+    sc.pp.neighbors(adata, 
+                    n_neighbors =   10, 
+                    n_pcs       =   min_pcs)
+    sc.tl.umap(adata)
+    return adata
 
 
 def annotate_single_sample_scparadise(
@@ -31,55 +110,40 @@ def annotate_single_sample_scparadise(
     resolution  =   1.0,
     use_gpu     =   False,
     work_run    =   WORKDIR,
+    render_plot =   False,
+    model_name  =   None,
+    source_h5ad =   None,
 ):
-    logging.basicConfig(level=logging.INFO)
-    logger  =   logging.getLogger(__name__)
+    """
+    source_h5ad - уже предобработанный (аннотированный ранее) AnnData: выполняется только предсказание
+    """
+    logger  =   get_logger(__name__)
     
     try:
-        logger.info(f"🧬[3.2.sc Annotation] Loading data from {input_file}")
-        if input_file.endswith('.h5ad'):
-            adata   =   sc.read_h5ad(input_file)
+        if source_h5ad:
+            logger.info(f"🧬[3.2.sc Annotation] Loading preprocessed data from {source_h5ad}")
+            adata   =   sc.read_h5ad(source_h5ad)
+            adata.obs   =   adata.obs[[x for x in adata.obs.columns if not x.startswith(('pred_', 'prob_'))]]
+            logger.info(f"🧬[3.2.sc Annotation] Loaded {adata.n_obs} cells, skip preprocessing")
         else:
-            adata   =   sc.read_10x_h5(input_file)
-        logger.info(f"🧬[3.2.sc Annotation] Loaded {adata.n_obs} cells and {adata.n_vars} genes")
-        logger.info("🧬[3.2.sc Annotation] Preprocessing data...")
-        adata.var["mt"]     =   adata.var_names.str.startswith("MT-")
-        adata.var["ribo"]   =   adata.var_names.str.startswith(("RPS", "RPL"))
-        adata.var["hb"]     =   adata.var_names.str.contains("^HB[^(P)]")
-        sc.pp.calculate_qc_metrics(adata, 
-                                   qc_vars  =   ["mt", "ribo", "hb"], 
-                                   inplace  =   True, 
-                                   log1p    =   True)
-        sc.pp.filter_cells(adata, 
-                           min_genes    =   min_genes)
-        sc.pp.filter_genes(adata, 
-                           min_cells    =   min_cells)
-        sc.pp.scrublet(adata)
-        adata   =   adata[adata.obs['predicted_doublet'] == False]
-        sc.pp.filter_cells(adata, 
-                           max_genes    =   max_genes)
-        sc.pp.filter_cells(adata, 
-                           max_counts   =   max_cells)
-        adata   =   adata[adata.obs['pct_counts_mt'] < 15]
-        sc.pp.normalize_total(adata,
-                              target_sum=   1e4)
-        sc.pp.log1p(adata)
-        adata.raw   =   adata
-        sc.pp.highly_variable_genes(adata, 
-                                    n_top_genes =   n_top_genes)
-        sc.tl.pca(adata)
-
-        min_pcs	=	min(n_pcs, len(adata.obs)-1)
-        sc.pp.neighbors(adata, 
-                        n_neighbors =   10, 
-                        n_pcs       =   min_pcs)
-        sc.tl.umap(adata)    
-        df              =   scparadise.scadam.available_models()
-        df_temp_org     =   df[df['Tissue/Model name'].str.contains(f'{species}_', case=False)]
-        df_temp_tiss    =   df_temp_org[(df_temp_org['Tissue/Model name'].str.contains(tissue_type.split(';')[0], case=False))]
-        df_temp_susp    =   df_temp_tiss[(df_temp_tiss['Suspension'].str.contains(tissue_type.split(';')[1], case=False))]
-        if len(df_temp_susp) != 0 :
-            MODEL   =   df_temp_susp.iloc[0]['Tissue/Model name']
+            logger.info(f"🧬[3.2.sc Annotation] Loading data from {input_file}")
+            if input_file.endswith('.h5ad'):
+                adata   =   sc.read_h5ad(input_file)
+            else:
+                adata   =   sc.read_10x_h5(input_file)
+            logger.info(f"🧬[3.2.sc Annotation] Loaded {adata.n_obs} cells and {adata.n_vars} genes")
+            logger.info("🧬[3.2.sc Annotation] Preprocessing data...")
+            adata   =   preprocess_adata(adata,
+                                         min_genes   =   min_genes,
+                                         min_cells   =   min_cells,
+                                         max_genes   =   max_genes,
+                                         max_cells   =   max_cells,
+                                         n_top_genes =   n_top_genes,
+                                         n_pcs       =   n_pcs)
+        MODEL   =   model_name
+        if MODEL is None:
+            MODEL, _    =   resolve_scparadise_model(species, tissue_type)
+        if MODEL is not None:
             if len(glob(f'{work_run}/1.Data/Models/{MODEL}_scAdam')) == 0:
                 scparadise.scadam.download_model(MODEL, 
                                                  save_path  =   f'{work_run}/1.Data/Models')
@@ -105,48 +169,48 @@ def annotate_single_sample_scparadise(
             for cell_type, count in cell_types.items():
                 logger.info(f"[3.2.sc Annotation] {cell_type}: {count} cells")
 
-            sc.pl.embedding(adata,
-                    color=[
-                        'pred_celltype_l1',
-                        'prob_celltype_l1',
-                        'pred_celltype_l2',
-                        'prob_celltype_l2',
-                        'pred_celltype_l3',
-                        'prob_celltype_l3'
-                    ],
-                    basis               =   'X_umap',
-                    frameon             =   False,
-                    add_outline         =   True,
-                    legend_loc          =   'on data',#,
-                    legend_fontsize     =   7,
-                    legend_fontoutline  =   1,
-                    show                =   False,
-                    ncols               =   2,
-                    wspace              =   0,
-                    hspace              =   0.1)
-            plt.savefig(output_file.replace('.h5ad', f'_{MODEL}.png'),
-                bbox_inches='tight',
-                dpi=300)
-            plt.close()
+            cache_path  =   save_plot_cache(adata,
+                                            cache_path  =   plot_cache_path(output_file.replace('.h5ad', f'_{MODEL}.png')),
+                                            model       =   MODEL)
+            logger.info(f"🧬[3.2.sc Annotation] Saved plot cache to {cache_path}")
+            if render_plot:
+                render_annotation_plot(cache_path)
         
             return adata
         else: 
-            print("❌[3.2.sc Annotation] Error find Model")
+            log("❌[3.2.sc Annotation] Error find Model")
             return None
         
     except Exception as e:
         logger.error(f"❌[3.2.sc Annotation] Error during annotation: {str(e)}")
         raise
 
+
+def _remove_outdated_outputs(manifest: dict, keep: list):
+    """Удаляет h5ad/кэш/PNG предыдущей модели, чтобы в отчёт не попали старые картинки"""
+    for key in ['annotated_h5ad', 'plot_cache', 'png']:
+        path = manifest.get(key)
+        if path and path not in keep and os.path.exists(path):
+            os.remove(path)
+
 def process_annotation(sample_processed:dict, 
-                       work_dir:str =   WORKDIR
+                       work_dir:str     =   WORKDIR,
+                       model_name:str   =   None,
+                       force:bool       =   False,
+                       params:dict      =   None
     ) -> Tuple[str, bool, str]:
+    """
+    Решение о пересчёте принимается по манифесту (хэш матрицы, модель и её версия, параметры):
+    skip | plot (только PNG) | predict (только предсказание) | full
+    """
     sample_id   =   sample_processed['Sample_ID']
+    params      =   {**DEFAULT_ANNOTATION_PARAMS, **(params or {})}
     
     try:
         if sample_processed['Reference name'] in ['GRCh38']:#, 'MM10']:
             flowcell        =   sample_processed['Flowcell']
             input_file      =   None
+            input_path      =   None
             temp_h5ad_path  =   None
 
             data_ann_path   =   sample_processed['Path local annotation png'].rsplit('/', maxsplit=1)[0] # /mnt/raid0/ofateev/projects/SC_auto/2.Results/SG/scRNA/240411_A01022_0750_AHNFHFDRXY/962000685201_h/step3/filtered_feature_bc_matrix
@@ -160,16 +224,29 @@ def process_annotation(sample_processed:dict,
             if sample_processed['SeqType'] == 'SC_SeekGene_VDJ' and sample_processed['VDJ type'] == '5':
                 img_results =   glob(sample_processed['Path local annotation png'])
             
-            if img_results:
+            # '.../filtered_feature_bc_matrix_annotated_scParadise.h5ad'
+            output_file     =   f"{data_ann_path}/filtered_feature_bc_matrix_annotated_scParadise.h5ad"
+            manifest_file   =   manifest_path(output_file)
+            manifest        =   load_manifest(manifest_file)
+
+            # Results of runs made before manifests existed
+            if img_results and manifest is None and model_name is None and not force:
                 message     =   f"Found PNG file: {img_results[0]}"
                 return sample_id, True, message
             
-            # Processing if not exist
+            # Annotation done earlier, only plot is missing
+            plot_caches =   pending_plot_caches(sample_processed['Path local annotation png'])
+            if plot_caches and manifest is None and model_name is None and not force:
+                png_path    =   render_annotation_plot(plot_caches[0])
+                message     =   f"🎨[3.2.sc Annotation] Re-rendered PNG from plot cache: {png_path}"
+                return sample_id, True, message
+            
             if sample_processed['SeqType'] == 'SC_TENX_RNA':
                 result_pattern  =   f"{data_ann_path}/filtered_feature_bc_matrix.h5"
                 result_files    =   glob(result_pattern)
                 if result_files:
-                    input_file  =   result_files[0]
+                    input_path  =   result_files[0]
+                    input_file  =   input_path
                     message     =   f"📁[3.2.sc Annotation] Found 10x h5 file: {input_file}"
                 else:
                     message     =   f"⚠️[3.2.sc Annotation] No 10x h5 file found for {sample_id}"
@@ -194,47 +271,75 @@ def process_annotation(sample_processed:dict,
                         missing_files.append(f)
                 if missing_files:
                     message     =   f"⚠️[3.2.sc Annotation] Missing files in {mtx_dir}: {missing_files}"
-                    print(f"❌[3.2.sc Annotation] Debug: Files in {mtx_dir}: {os.listdir(mtx_dir)}")
+                    log(f"❌[3.2.sc Annotation] Debug: Files in {mtx_dir}: {os.listdir(mtx_dir)}")
                     return sample_id, False, message
-                temp_h5ad_path  =   os.path.join(mtx_dir, 'temp_adata.h5ad')
-                message         =   f"🔨[3.2.sc Annotation] Creating AnnData from MTX files in {mtx_dir}"
+                input_path      =   mtx_dir
+                message         =   f"📁[3.2.sc Annotation] Found MTX files in {mtx_dir}"
+                
+            if not input_path:
+                message     =   f"⚠️[3.2.sc Annotation] No input file found for {sample_id}"
+                return sample_id, False, message
+
+            input_hash              =   matrix_hash(input_path, previous=manifest)
+            MODEL, model_version    =   resolve_scparadise_model(species    =   sample_processed['Organism'].lower(),
+                                                                 tissue_type=   sample_processed['Tissue'],
+                                                                 model_name =   model_name)
+            if MODEL is None:
+                return sample_id, False, f"❌[3.2.sc Annotation] Error find Model for {sample_id}"
+            plan    =   PLAN_FULL if force else plan_annotation(manifest      =   manifest,
+                                                               input_hash    =   input_hash,
+                                                               model         =   MODEL,
+                                                               model_version =   model_version,
+                                                               params        =   params)
+            message +=  f"\n🧬[3.2.sc Annotation] Plan for {sample_id}: {plan} (model {MODEL}, {model_version})"
+            if plan == PLAN_SKIP:
+                return sample_id, True, message + f"\n✅[3.2.sc Annotation] Annotation is up to date: {manifest['png']}"
+            if plan == PLAN_PLOT:
+                png_path    =   render_annotation_plot(manifest['plot_cache'], manifest['png'])
+                return sample_id, True, message + f"\n🎨[3.2.sc Annotation] Re-rendered PNG from plot cache: {png_path}"
+
+            source_h5ad =   manifest['annotated_h5ad'] if plan == PLAN_PREDICT else None
+            if plan == PLAN_FULL and input_path != input_file:
+                temp_h5ad_path  =   os.path.join(input_path, 'temp_adata.h5ad')
+                message         +=  f"\n🔨[3.2.sc Annotation] Creating AnnData from MTX files in {input_path}"
                 try:
-                    adata       =   create_anndata_from_mtx(mtx_dir, temp_h5ad_path)
+                    adata       =   create_anndata_from_mtx(input_path, temp_h5ad_path)
                     input_file  =   temp_h5ad_path
                     message += f"\n✅[3.2.sc Annotation] Created AnnData with {adata.n_obs} cells and {adata.n_vars} genes"
                 except Exception as e:
                     message += f"\n❌[3.2.sc Annotation] Failed to create AnnData: {str(e)}"
                     return sample_id, False, message
-                
-            if not input_file:
-                message     =   f"⚠️[3.2.sc Annotation] No input file found for {sample_id}"
-                return sample_id, False, message
-            
-            if input_file.endswith('.h5ad'):
-                output_file     =   input_file.replace('.h5ad', '_annotated_scParadise.h5ad')
-                if 'temp_adata' in  output_file:
-                    output_file =   output_file.replace('temp_adata', 'filtered_feature_bc_matrix')
-            elif input_file.endswith('.h5'):
-                output_file = input_file.replace('.h5', '_annotated_scParadise.h5ad')
-            else:
-                output_file = input_file + '_annotated_scParadise.h5ad'
 
-            message             +=  f"\n🧬[3.2.sc Annotation] Annotating {sample_id} with scParadise from {input_file} to {output_file}"
-            log_buffer          =   StringIO()
-            log_handler         =   logging.StreamHandler(log_buffer)
-            log_handler.setLevel(logging.INFO)
-            original_handlers   =   logging.getLogger().handlers[:]
+            message             +=  f"\n🧬[3.2.sc Annotation] Annotating {sample_id} with scParadise from {source_h5ad or input_file} to {output_file}"
             try:
-                logging.getLogger().addHandler(log_handler)
-                annotate_single_sample_scparadise(
-                    input_file      =   input_file,
-                    output_file     =   output_file,
-                    species         =   sample_processed['Organism'].lower(),
-                    tissue_type     =   sample_processed['Tissue'],
-                    batch_key       =   None,
-                    use_gpu         =   False,
-                    work_run        =   work_dir
-                )
+                # записи scParadise уходят в общий лог с полями образца и копируются в сообщение
+                with log_context(flowcell=flowcell, sample=sample_id, stage='3.2.sc Annotation'), \
+                     capture_logs(sample=sample_id) as log_buffer:
+                    annotate_single_sample_scparadise(
+                        input_file      =   input_file,
+                        output_file     =   output_file,
+                        species         =   sample_processed['Organism'].lower(),
+                        tissue_type     =   sample_processed['Tissue'],
+                        batch_key       =   None,
+                        use_gpu         =   False,
+                        work_run        =   work_dir,
+                        model_name      =   MODEL,
+                        source_h5ad     =   source_h5ad,
+                        **params
+                    )
+                annotated_h5ad  =   output_file.replace('.h5ad', f'_{MODEL}.h5ad')
+                png_path        =   output_file.replace('.h5ad', f'_{MODEL}.png')
+                new_manifest    =   build_manifest(input_path       =   input_path,
+                                                   input_hash       =   input_hash,
+                                                   model            =   MODEL,
+                                                   model_version    =   model_version,
+                                                   params           =   params,
+                                                   annotated_h5ad   =   annotated_h5ad,
+                                                   plot_cache       =   plot_cache_path(png_path),
+                                                   png              =   png_path)
+                if manifest:
+                    _remove_outdated_outputs(manifest, keep=[annotated_h5ad, plot_cache_path(png_path), png_path])
+                save_manifest(manifest_file, new_manifest)
                 captured_logs = log_buffer.getvalue()
                 if captured_logs:
                     message += f"\n{captured_logs}"
@@ -245,9 +350,6 @@ def process_annotation(sample_processed:dict,
                 error_msg = f"❌[3.2.sc Annotation] Error during annotation: {str(e)}"
                 message += f"\n{error_msg}"
                 return sample_id, False, message
-            finally:
-                logging.getLogger().handlers = original_handlers
-                log_handler.close()     
         else: 
             return sample_id, False, f"Skipping annotation for organism: {sample_processed['Organism']}"
     except Exception as e:
@@ -0,0 +1,167 @@
+import os
+import numpy as np
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main._4_Monitoring.structured_log import log, pool_options, worker_init
+
+ANNOTATION_PLOT_KEYS    =   [
+                                'pred_celltype_l1',
+                                'prob_celltype_l1',
+                                'pred_celltype_l2',
+                                'prob_celltype_l2',
+                                'pred_celltype_l3',
+                                'prob_celltype_l3'
+                            ]
+PLOT_CACHE_POSTFIX      =   '_plotcache.npz'
+
+
+def plot_cache_path(png_path: str) -> str:
+    """'..._scParadise_Human_PBMC.png' -> '..._scParadise_Human_PBMC_plotcache.npz'"""
+    return png_path[:-len('.png')] + PLOT_CACHE_POSTFIX if png_path.endswith('.png') else png_path + PLOT_CACHE_POSTFIX
+
+
+def plot_png_path(cache_path: str) -> str:
+    return cache_path[:-len(PLOT_CACHE_POSTFIX)] + '.png'
+
+
+def save_plot_cache(adata,
+                    cache_path: str,
+                    model: str = '',
+                    basis: str = 'X_umap'
+                    ) -> str:
+    """Сохраняет только то, что нужно для отрисовки: координаты UMAP и предсказанные метки"""
+    arrays: Dict[str, np.ndarray] = {
+        'umap'  :   np.asarray(adata.obsm[basis][:, :2], dtype=np.float32),
+        'model' :   np.array(model),
+    }
+    for key in ANNOTATION_PLOT_KEYS:
+        if key not in adata.obs.columns:
+            continue
+        values = adata.obs[key]
+        if key.startswith('prob_'):
+            arrays[key] = values.to_numpy(dtype=np.float32)
+        else:
+            categorical = values.astype('category')
+            arrays[f'{key}__codes']         =   categorical.cat.codes.to_numpy(dtype=np.int16)
+            arrays[f'{key}__categories']    =   np.array([str(x) for x in categorical.cat.categories])
+    np.savez_compressed(cache_path, **arrays)
+    return cache_path
+
+
+def _category_colors(n: int) -> List:
+    import matplotlib.pyplot as plt
+    if n <= 10:
+        base = plt.get_cmap('tab10').colors
+    elif n <= 20:
+        base = plt.get_cmap('tab20').colors
+    else:
+        base = plt.get_cmap('tab20').colors + plt.get_cmap('tab20b').colors + plt.get_cmap('tab20c').colors
+    return [base[i % len(base)] for i in range(n)]
+
+
+def render_annotation_plot(cache_path: str,
+                           png_path: str = None,
+                           dpi: int = 300
+                           ) -> str:
+    """Рисует 6-панельный UMAP (как sc.pl.embedding c add_outline и legend_loc='on data') из кэша"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patheffects as patheffects
+
+    png_path    =   png_path or plot_png_path(cache_path)
+    with np.load(cache_path, allow_pickle=False) as cache:
+        data = {key: cache[key] for key in cache.files}
+    umap        =   data['umap']
+    keys        =   [k for k in ANNOTATION_PLOT_KEYS if k in data or f'{k}__codes' in data]
+    n_cells     =   max(len(umap), 1)
+    size        =   120000 / n_cells
+    ncols       =   2
+    nrows       =   int(np.ceil(len(keys) / ncols))
+
+    fig, axes   =   plt.subplots(nrows, ncols,
+                                 figsize    =   (4 * ncols + 2, 4 * nrows),
+                                 squeeze    =   False,
+                                 gridspec_kw=   {'wspace': 0, 'hspace': 0.1})
+    outline     =   [patheffects.withStroke(linewidth=1, foreground='w')]
+    for ax, key in zip(axes.flat, keys):
+        ax.scatter(umap[:, 0], umap[:, 1], s=size * 1.6, c='black', linewidths=0, rasterized=True)
+        ax.scatter(umap[:, 0], umap[:, 1], s=size * 1.3, c='white', linewidths=0, rasterized=True)
+        if key.startswith('prob_'):
+            points = ax.scatter(umap[:, 0], umap[:, 1], s=size, c=data[key], cmap='viridis',
+                                linewidths=0, rasterized=True)
+            fig.colorbar(points, ax=ax, fraction=0.05, pad=0.01)
+        else:
+            codes       =   data[f'{key}__codes']
+            categories  =   data[f'{key}__categories']
+            colors      =   np.array(_category_colors(len(categories)))
+            valid       =   codes >= 0
+            ax.scatter(umap[valid, 0], umap[valid, 1], s=size, c=colors[codes[valid]],
+                       linewidths=0, rasterized=True)
+            for code, label in enumerate(categories):
+                mask = codes == code
+                if not mask.any():
+                    continue
+                x, y = np.median(umap[mask], axis=0)
+                ax.text(x, y, label, fontsize=7, ha='center', va='center',
+                        weight='bold', path_effects=outline)
+        ax.set_title(key)
+        ax.set_axis_off()
+    for ax in list(axes.flat)[len(keys):]:
+        ax.set_axis_off()
+    fig.savefig(png_path,
+                bbox_inches =   'tight',
+                dpi         =   dpi)
+    plt.close(fig)
+    return png_path
+
+
+def _init_render_worker(*log_args):
+    """Agg без дисплея; log_args - initargs из pool_options(), записи воркера идут в общую очередь"""
+    import matplotlib
+    matplotlib.use('Agg')
+    if log_args:
+        worker_init(*log_args)
+
+
+def _render_task(cache_path: str, dpi: int) -> Tuple[str, bool, str]:
+    try:
+        png_path = render_annotation_plot(cache_path, dpi=dpi)
+        return cache_path, True, png_path
+    except Exception as e:
+        return cache_path, False, str(e)
+
+
+def pending_plot_caches(annotation_png_pattern: Optional[str]) -> List[str]:
+    """Кэши, для которых PNG ещё не отрисован (шаблон 'Path local annotation png')"""
+    if not annotation_png_pattern:
+        return []
+    if annotation_png_pattern.endswith('*png'):
+        cache_pattern = f"{annotation_png_pattern[:-len('png')]}{PLOT_CACHE_POSTFIX.lstrip('_')}"
+    else:
+        cache_pattern = plot_cache_path(annotation_png_pattern)
+    return [x for x in glob(cache_pattern) if not os.path.exists(plot_png_path(x))]
+
+
+def render_annotation_plots(cache_paths: List[str],
+                            max_workers: int = 4,
+                            dpi: int = 300
+                            ) -> Dict[str, bool]:
+    results: Dict[str, bool] = {}
+    if not cache_paths:
+        return results
+    log(f"🎨[3.2.sc Plot] Rendering {len(cache_paths)} annotation plot(s) with {min(max_workers, len(cache_paths))} worker(s)")
+    with ProcessPoolExecutor(max_workers  =   min(max_workers, len(cache_paths)),
+                             initializer  =   _init_render_worker,
+                             initargs     =   pool_options().get('initargs', ())) as executor:
+        futures = [executor.submit(_render_task, cache_path, dpi) for cache_path in cache_paths]
+        for future in as_completed(futures):
+            cache_path, success, message = future.result()
+            results[cache_path] = success
+            if success:
+                log(f"✅[3.2.sc Plot] Saved {'2.Results' + message.split('/2.Results')[-1]}")
+            else:
+                log(f"❌[3.2.sc Plot] Failed to render {cache_path}: {message}")
+    return results
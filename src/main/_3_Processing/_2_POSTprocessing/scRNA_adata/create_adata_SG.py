@@ -4,6 +4,8 @@ from scipy import io
 import scipy.sparse as sp
 import pandas as pd
 
+from main._4_Monitoring.structured_log import log
+
 def create_anndata_from_mtx(mtx_dir: str, output_h5ad: str = None) -> ad.AnnData:
     """
     Create AnnData object from 10x Genomics format files.
@@ -51,6 +53,6 @@ def create_anndata_from_mtx(mtx_dir: str, output_h5ad: str = None) -> ad.AnnData
     
     if output_h5ad:
         adata.write(output_h5ad)
-        print(f"🧬[3.2.sc Annotation] Saved AnnData to {'2.Results' + output_h5ad.split('/2.Results')[-1]}")
+        log(f"🧬[3.2.sc Annotation] Saved AnnData to {'2.Results' + output_h5ad.split('/2.Results')[-1]}")
     
     return adata
\ No newline at end of file
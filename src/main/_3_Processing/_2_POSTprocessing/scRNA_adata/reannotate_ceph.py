@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from glob import glob
+from typing import Dict, Any, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from main._1_Config.main_config import WORKDIR, TypeConfig, RefsName, PrefixName
+from main._3_Processing._2_POSTprocessing.scRNA_adata._ann_scparadise import process_annotation, resolve_scparadise_model
+from main._3_Processing._2_POSTprocessing.scRNA_adata._plot_annotation import pending_plot_caches, render_annotation_plots
+from main._4_Monitoring.structured_log import log, pool_options, setup_logging
+
+REANNOTATION_dir        =   f"{WORKDIR}/2.Results/Reannotation"
+CHECKPOINT_name         =   'reannotation_checkpoint.json'
+
+# SeqType : relative path to the annotation input inside '{ceph}/{tool version}/{flowcell}/{sample}_{prefix}'
+ANNOTATION_inputs       =   {
+    'SC_TENX_RNA'       :   'outs/filtered_feature_bc_matrix.h5',
+    'SC_SeekGene_RNA'   :   'step3/filtered_feature_bc_matrix/matrix.mtx.gz',
+    'SC_SeekGene_VDJ'   :   'step3/filtered_feature_bc_matrix/matrix.mtx.gz',
+}
+MTX_files               =   ['matrix.mtx.gz', 'barcodes.tsv.gz', 'features.tsv.gz']
+
+
+def _load_processed_info(flowcell_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Описание образцов из 'flowcell_sample_processed_*.json', сохранённых move_and_remove"""
+    info = {}
+    for json_path in sorted(glob(f"{flowcell_dir}/flowcell_sample_processed*.json")):
+        try:
+            with open(json_path, 'r') as f:
+                info.update(json.load(f))
+        except Exception as e:
+            log(f"⚠️[3.2.sc Reannotation] Can't read {json_path}: {e}")
+    return info
+
+
+def scan_ceph_annotation_inputs(seq_types: List[str]    =   None,
+                                organism: str           =   'human',
+                                flowcells: List[str]    =   None
+                                ) -> List[Dict[str, Any]]:
+    """
+    Обходит ceph-деревья TypeConfig и собирает список матриц для аннотации.
+    Каждый элемент совместим по ключам с 'flowcell_sample_processed' для process_annotation.
+    """
+    reference   =   RefsName.organ_dict.value[organism]
+    prefix      =   PrefixName.organ_dict.value[organism]
+    seq_types   =   seq_types or list(ANNOTATION_inputs.keys())
+    work_list   =   []
+    for seq_type in seq_types:
+        ceph_root   =   TypeConfig[seq_type]._get_params()['ceph']
+        pattern     =   f"{ceph_root}/*/*/*_{prefix}/{ANNOTATION_inputs[seq_type]}"
+        log(f"🔎[3.2.sc Reannotation] Scanning {pattern}")
+        info_cache: Dict[str, Dict[str, Any]] = {}
+        for matrix_path in sorted(glob(pattern)):
+            rel_parts   =   os.path.relpath(matrix_path, ceph_root).split(os.sep)
+            tool_version, flowcell, sample_dir = rel_parts[0], rel_parts[1], rel_parts[2]
+            if '.bak' in sample_dir or (flowcells and flowcell not in flowcells):
+                continue
+            sample_id       =   sample_dir[:-len(f"_{prefix}")]
+            flowcell_dir    =   f"{ceph_root}/{tool_version}/{flowcell}"
+            if flowcell_dir not in info_cache:
+                info_cache[flowcell_dir] = _load_processed_info(flowcell_dir)
+            sample_info     =   info_cache[flowcell_dir].get(f"{flowcell}:{sample_id}", {})
+            if seq_type == 'SC_SeekGene_VDJ' and sample_info.get('VDJ type') != '5':
+                continue
+            work_list.append({
+                'Sample_ID'         :   sample_id,
+                'Flowcell'          :   flowcell,
+                'SeqType'           :   seq_type,
+                'Organism'          :   organism,
+                'Reference name'    :   reference,
+                'Tissue'            :   sample_info.get('Tissue'),
+                'VDJ type'          :   sample_info.get('VDJ type'),
+                'Tool version'      :   tool_version,
+                'Matrix path'       :   matrix_path,
+                'Path ceph sample'  :   f"{flowcell_dir}/{sample_dir}",
+                'Relative path'     :   os.path.join(seq_type, tool_version, flowcell, sample_dir,
+                                                     os.path.dirname(ANNOTATION_inputs[seq_type])),
+            })
+    log(f"✅[3.2.sc Reannotation] Found {len(work_list)} matrices for annotation")
+    return work_list
+
+
+def _stage_work_item(item: Dict[str, Any], output_root: str) -> Dict[str, Any]:
+    """
+    Создаёт отдельную директорию с симлинками на исходную матрицу:
+    аннотация пишет результаты туда и не трогает основные результаты в ceph.
+    """
+    out_dir     =   os.path.join(output_root, item['Relative path'])
+    os.makedirs(out_dir, exist_ok=True)
+    src_dir     =   os.path.dirname(item['Matrix path'])
+    file_names  =   MTX_files if item['Matrix path'].endswith('.mtx.gz') else [os.path.basename(item['Matrix path'])]
+    for file_name in file_names:
+        link_path = os.path.join(out_dir, file_name)
+        if not os.path.lexists(link_path):
+            os.symlink(os.path.join(src_dir, file_name), link_path)
+    sample_processed = dict(item)
+    sample_processed['Path local annotation png'] = f"{out_dir}/filtered_feature_bc_matrix_annotated_scParadise_*png"
+    return sample_processed
+
+
+def _reannotate_task(sample_processed: Dict[str, Any],
+                     work_dir: str,
+                     model_name: Optional[str],
+                     force: bool
+                     ) -> Tuple[str, bool, str, float]:
+    key     =   f"{sample_processed['Flowcell']}:{sample_processed['Sample_ID']}"
+    start   =   time.perf_counter()
+    try:
+        _, success, message = process_annotation(sample_processed   =   sample_processed,
+                                                 work_dir           =   work_dir,
+                                                 model_name         =   model_name,
+                                                 force              =   force)
+    except Exception as e:
+        success, message = False, f"❌[3.2.sc Reannotation] {key}: {e}"
+    return key, success, message, time.perf_counter() - start
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Dict[str, Any]]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def publish_reannotation(sample_processed: Dict[str, Any],
+                         password: str,
+                         subdir: str = 'scParadise_reannotation') -> bool:
+    """Копирует результаты в отдельную поддиректорию образца в ceph (основные файлы не перезаписываются)"""
+    out_dir     =   sample_processed['Path local annotation png'].rsplit('/', maxsplit=1)[0]
+    target_dir  =   f"{sample_processed['Path ceph sample']}/{subdir}"
+    load_com    =   ['sshpass', '-p', password,
+                     'sudo', 'rsync', '-r', '--no-links',
+                     '--include', '*_annotated_scParadise*', '--exclude', '*',
+                     f"{out_dir}/", f"{target_dir}/"]
+    result = subprocess.run(['sshpass', '-p', password, 'sudo', 'mkdir', '-p', target_dir],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode == 0:
+        result = subprocess.run(load_com, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        log(f"❌[3.2.sc Reannotation] Publish failed for {target_dir}: {result.stderr}")
+        return False
+    return True
+
+
+def reannotate_ceph_results(work_list: List[Dict[str, Any]],
+                            output_root: str        =   REANNOTATION_dir,
+                            model_name: str         =   None,
+                            max_workers: int        =   4,
+                            force: bool             =   False,
+                            work_dir: str           =   WORKDIR,
+                            password: str           =   None
+                            ) -> Dict[str, Dict[str, Any]]:
+    os.makedirs(output_root, exist_ok=True)
+    checkpoint_path =   os.path.join(output_root, CHECKPOINT_name)
+    checkpoint      =   load_checkpoint(checkpoint_path)
+
+    # модель и версия, которыми будет аннотирован образец: новая модель для ткани - повод пересчитать
+    models: Dict[Tuple[str, str], Tuple[Optional[str], Optional[str]]] = {}
+    resolved: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    pending = []
+    for item in work_list:
+        key     =   f"{item['Flowcell']}:{item['Sample_ID']}"
+        if not item.get('Tissue'):
+            log(f"⚠️[3.2.sc Reannotation] No tissue description for {key}, skip")
+            continue
+        species =   item['Organism'].lower()
+        if (species, item['Tissue']) not in models:
+            try:
+                models[(species, item['Tissue'])] = resolve_scparadise_model(species, item['Tissue'], model_name)
+            except Exception as e:
+                log(f"⚠️[3.2.sc Reannotation] Can't resolve model for {item['Tissue']}: {e}")
+                models[(species, item['Tissue'])] = (None, None)
+        resolved[key]   =   models[(species, item['Tissue'])]
+        done            =   checkpoint.get(key, {})
+        if (not force and done.get('success')
+                and (done.get('model'), done.get('model_version')) == resolved[key]):
+            continue
+        pending.append(_stage_work_item(item, output_root))
+    log(f"🧬[3.2.sc Reannotation] {len(pending)} sample(s) to annotate, {len(work_list) - len(pending)} skipped")
+
+    by_key          =   {f"{x['Flowcell']}:{x['Sample_ID']}": x for x in pending}
+    completed       =   0
+
+    def finish(key: str, success: bool, message: str, seconds: float):
+        """PNG из кэшей, публикация и запись в checkpoint сразу после аннотации образца"""
+        nonlocal completed
+        completed += 1
+        if success:
+            # образец без PNG не публикуется и не считается готовым
+            plot_results = render_annotation_plots(cache_paths  =   pending_plot_caches(by_key[key]['Path local annotation png']),
+                                                   max_workers  =   1)
+            for cache_path in [x for x, rendered in plot_results.items() if not rendered]:
+                success = False
+                message = f"{message}\n❌[3.2.sc Reannotation] {key}: plot not rendered from {cache_path}"
+        if success and password:
+            success = publish_reannotation(by_key[key], password)
+        model, model_version = resolved[key]
+        checkpoint[key] = {
+            'success'       :   success,
+            'model'         :   model,
+            'model_version' :   model_version,
+            'seconds'       :   round(seconds, 1),
+            'finished'      :   time.strftime('%Y-%m-%d %H:%M:%S'),
+            'message'       :   message.strip().splitlines()[-1] if message else '',
+        }
+        save_checkpoint(checkpoint_path, checkpoint)
+        status = '✅' if success else '❌'
+        log(f"{status}[3.2.sc Reannotation {completed}/{len(pending)}] {key} ({seconds:.0f}s)")
+        if not success:
+            log(message)
+
+    # Bounded queue: not more than 2 tasks per worker are submitted at once
+    max_in_flight   =   max_workers * 2
+    queue           =   iter(pending)
+    with ProcessPoolExecutor(max_workers=max_workers, **pool_options()) as executor:
+        in_flight: Dict[Any, str] = {}
+        while True:
+            while len(in_flight) < max_in_flight:
+                sample_processed = next(queue, None)
+                if sample_processed is None:
+                    break
+                key = f"{sample_processed['Flowcell']}:{sample_processed['Sample_ID']}"
+                try:
+                    future = executor.submit(_reannotate_task, sample_processed, work_dir, model_name, force)
+                except BrokenProcessPool:
+                    # воркер убит (OOM): оставшиеся образцы не записываются в checkpoint и возьмутся при следующем запуске
+                    log(f"❌[3.2.sc Reannotation] Worker pool is broken, {key} and the rest of the queue are left for the next run")
+                    queue = iter(())
+                    break
+                in_flight[future] = key
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    key, success, message, seconds = future.result()
+                except Exception as e:
+                    success, message, seconds = False, f"❌[3.2.sc Reannotation] {key}: worker failed: {e!r}", 0.0
+                finish(key, success, message, seconds)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run scParadise annotation for results stored in Ceph')
+    parser.add_argument('--model',      default=None,   help='scParadise model name (default: best model for tissue)')
+    parser.add_argument('--seqtypes',   nargs='+',      default=list(ANNOTATION_inputs.keys()), choices=list(ANNOTATION_inputs.keys()))
+    parser.add_argument('--flowcells',  nargs='+',      default=None)
+    parser.add_argument('--output',     default=REANNOTATION_dir)
+    parser.add_argument('--workers',    type=int,       default=4)
+    parser.add_argument('--limit',      type=int,       default=None)
+    parser.add_argument('--force',      action='store_true')
+    parser.add_argument('--publish',    action='store_true', help='copy results to <sample>/scParadise_reannotation in Ceph')
+    args = parser.parse_args()
+    setup_logging()         # воркеры аннотации и отрисовки пишут в общий JSONL через очередь
+
+    password = None
+    if args.publish:
+        from main._3_Processing._0_PREprocessing.start_steps import get_credentials
+        _, password = get_credentials()
+
+    work_list = scan_ceph_annotation_inputs(seq_types=args.seqtypes, flowcells=args.flowcells)
+    if args.limit:
+        work_list = work_list[:args.limit]
+    checkpoint = reannotate_ceph_results(work_list      =   work_list,
+                                         output_root    =   args.output,
+                                         model_name     =   args.model,
+                                         max_workers    =   args.workers,
+                                         force          =   args.force,
+                                         password       =   password)
+    failed = [key for key, value in checkpoint.items() if not value.get('success')]
+    log(f"📊[3.2.sc Reannotation] Done: {len(checkpoint) - len(failed)} successful, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,10 @@ from main._3_Processing._1_MAINprocessing._2_FLOWCELL_processing 				import 	pro
 from main._3_Processing._1_MAINprocessing._3_Create_Sumdir						import 	check_and_move_reports
 from main._3_Processing._2_POSTprocessing.report.email_reporter					import 	archive_and_send_report
 from main._3_Processing._2_POSTprocessing.move_and_remove						import 	move_and_remove
+from main._4_Monitoring.instrumentation											import 	traced
+from main._3_Processing._0_PREprocessing._4_process_flowcell.disk_planner		import 	admit_flowcell, DiskPlanner
+from main._3_Processing._0_PREprocessing._4_process_flowcell.reference_registry	import 	admit_references
+from main._4_Monitoring.structured_log											import 	log
 
 def print_upload_dict(flowcell_sample_processed:dict):
 	table_data = []
@@ -33,10 +37,11 @@ def print_upload_dict(flowcell_sample_processed:dict):
 			'Processed\nstatus'	: 	'✅' if data.get('Processed status', False) else '❌',
 			'Annotation\nstatus': 	'✅' if data.get('Annotation status', False) else '⚠️'
 		})
-	print(tabulate(	table_data, 
+	log(tabulate(	table_data, 
 					headers		=	'keys',
 					tablefmt	=	'psql'))
 
+@traced('3 Processing')
 def full_process_flowcell(
 						info_sheet:pd.DataFrame, 
 						flowcell_name:str, 
@@ -60,22 +65,23 @@ def full_process_flowcell(
 						email_config:str                
 					):
 	
+	disk_needs	=	None
 	try:
 		"""
 		Check if Flowcell in skip list  
 		"""
 		if flowcell_name in skip_flowcells:
-			print(f"\033[92m❌[3 Processing] Flowcell {flowcell_name} in skip_flowcells list, skipping\033[0m")
+			log(f"\033[92m❌[3 Processing] Flowcell {flowcell_name} in skip_flowcells list, skipping\033[0m")
 			return False
 		if flowcell_name in processed_flowcells:
-			print(f"\033[92m✅[3 Processing] Flowcell {flowcell_name} in processed list, skipping\033[0m")
+			log(f"\033[92m✅[3 Processing] Flowcell {flowcell_name} in processed list, skipping\033[0m")
 			return True
 		df_flowcell_temp    =   info_sheet[info_sheet['Flowcell'] == flowcell_name]
 		"""
 		Check if Flowcell in info_sheet
 		"""
 		if df_flowcell_temp.empty:
-			print(f"\033[91m❌[3 Processing] Flowcell {flowcell_name} not found in info_sheet\033[0m")
+			log(f"\033[91m❌[3 Processing] Flowcell {flowcell_name} not found in info_sheet\033[0m")
 			return False
 
 		"""
@@ -260,8 +266,23 @@ def full_process_flowcell(
 			"""
 			Start processa
 			"""
-			print("\033[91m" + "=" * 53 + "\033[0m")
-			print(f"\033[92m🕐[3 Processing] Processing specified flowcell: {flowcell_name}\033[0m")
+			log("\033[91m" + "=" * 53 + "\033[0m")
+			log(f"\033[92m🕐[3 Processing] Processing specified flowcell: {flowcell_name}\033[0m")
+			"""
+			Check references (missing or damaged - sync from Ceph; unavailable - flowcell is deferred without skip list)
+			"""
+			if not admit_references(flowcell_sample_processed	=	_flowcell_sample_processed):
+				log(f"\033[93m⚠️[3 Processing] References unavailable for {flowcell_name}, deferred\033[0m")
+				return None
+			"""
+			Reserve space in WORKDIR (None - not enough space, flowcell is deferred without skip list)
+			"""
+			disk_needs	=	admit_flowcell(flowcell_sample_processed	=	_flowcell_sample_processed,
+										   fastq_load					=	FASTQ_load,
+										   fastq_save					=	FASTQ_save)
+			if disk_needs is None:
+				log(f"\033[93m⚠️[3 Processing] Not enough disk space for {flowcell_name}, deferred\033[0m")
+				return None
 			"""
 			Load flowcell data (sample by sample - fastq) (flowcell - bcl)
 			"""
@@ -283,6 +304,8 @@ def full_process_flowcell(
 									max_len1                    =   Fastp_params['max_len1'],
 									fastq_parallel_workers      =   8,
 									filter_parallel_samples     =   8)
+			if disk_needs:
+				DiskPlanner.from_config().consume_loaded(disk_needs)
 			all_false = not any(results.values())
 			if all_false == True:
 				add_to_skip_flowcells(	path_to_file=	processed_skip,
@@ -367,17 +390,18 @@ def full_process_flowcell(
 					move_and_remove_status	=	move_and_remove(flowcell_sample_processed	=	_flowcell_sample_processed,
 												 				password					=	password)
 				if move_and_remove_status 	== True:
-					print(f"\033[92m🕐[3 Processing] All samples processed in flowcell: {flowcell_name}\033[0m")
+					log(f"\033[92m🕐[3 Processing] All samples processed in flowcell: {flowcell_name}\033[0m")
 					add_to_processed_flowcells(	path_to_file=	processed_skip,
 								 				flowcell	=	flowcell_name, 
 												reason		=	f"All samples {flowcell_name} processed")
 					return True
+				return False
 			else:
 				return False
 
 		else:
-			print("\033[91m" + "=" * 53 + "\033[0m")
-			print(f"\033[92m🕐[3 Processing] All samples processed in flowcell: {flowcell_name}\033[0m")
+			log("\033[91m" + "=" * 53 + "\033[0m")
+			log(f"\033[92m🕐[3 Processing] All samples processed in flowcell: {flowcell_name}\033[0m")
 			add_to_processed_flowcells(	path_to_file=	processed_skip,
 							 			flowcell	=	flowcell_name, 
 										reason		=	f"All samples {flowcell_name} processed")
@@ -385,9 +409,12 @@ def full_process_flowcell(
 
 	except Exception as e:
 		error_msg = f"3 ERROR processing flowcell {flowcell_name}: {str(e)}"
-		print(f"\033[91m{error_msg}\033[0m")
-		print(f"Traceback: {traceback.format_exc()}")
+		log(f"\033[91m{error_msg}\033[0m")
+		log(f"Traceback: {traceback.format_exc()}")
 		add_to_skip_flowcells(	path_to_file=	processed_skip,
 							 	flowcell	=	flowcell_name, 
 								reason		=	f"Processing error: {str(e)}")
 		return False
+	finally:
+		if disk_needs:
+			DiskPlanner.from_config().release([need.key for need in disk_needs])
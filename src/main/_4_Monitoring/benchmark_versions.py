@@ -0,0 +1,302 @@
+"""
+Сравнение версий инструментов на фиксированной панели образцов (решение об обновлении cellranger/seeksoultools).
+
+    sc-benchmark panel <ceph>/flowcell_sample_processed_SC_SeekGene_RNA_count-1.json --samples 4 -o panel.json
+    sc-benchmark run panel.json --tools seeksoultools.1.2.2 seeksoultools.1.3.0 --cores 16 --memory 100 --repeats 2
+    sc-benchmark report
+
+Каждый образец панели запускается каждой версией ('Tool version' и 'Path install tool' подменяются,
+'{SOFT_local_dir}/<version>') с одинаковыми ресурсами: образцы идут по одному, процесс и инструменты
+привязаны к одним и тем же cores CPU, индекс референса перед каждым запуском прогрет в page cache.
+Результаты - '{WORKDIR}/2.Results/Benchmark/<version>/r<repeat>/<flowcell>', запуски - runs.jsonl
+(прерванный бенчмарк продолжается с места остановки), отчёт - comparison.csv, summary.csv, report.html.
+Время, CPU, пик RSS и IO - ProcessTreeSampler (пик RSS требует psutil), QC метрики - схема stat.METRIC_SCHEMA.
+FASTQ панели должны лежать локально ('Path data' образца или --fastq-dir/<flowcell>).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from glob import glob
+from typing import Any, Dict, List, Optional, Tuple
+
+from main._1_Config.main_config import WORKDIR, Paths
+from main._4_Monitoring.structured_log import log
+
+RESOURCE_metrics    =   ['wall_s', 'cpu_s', 'rss_peak_gb', 'read_gb', 'write_gb']
+LOCAL_keys          =   ['Path local results', 'Path local sum stat', 'Path result stat prefix',
+                         'Path result html prefix', 'Path log']
+
+
+def default_out_dir() -> str:
+    return f"{WORKDIR}/{Paths.BENCHMARK_save.value}"
+
+
+def load_panel(paths: List[str],
+               seq_type: str = None,
+               sample_ids: List[str] = None,
+               samples: int = None) -> Dict[str, Dict[str, Any]]:
+    """Образцы из flowcell_sample_processed*.json (результаты в Ceph) или из сохранённой панели"""
+    panel: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        with open(path, 'r') as f:
+            panel.update(json.load(f))
+    if seq_type:
+        panel = {key: value for key, value in panel.items() if value['SeqType'] == seq_type}
+    if sample_ids:
+        panel = {key: value for key, value in panel.items() if value['Sample_ID'] in sample_ids}
+    if samples:
+        panel = dict(list(panel.items())[:samples])
+    return panel
+
+
+def bench_sample(sample_processed: Dict[str, Any], tool: str, out_dir: str, repeat: int,
+                 fastq_dir: str = None) -> Dict[str, Any]:
+    """Копия образца для запуска версией tool в отдельной директории бенчмарка"""
+    bench       =   {key: value for key, value in sample_processed.items() if key not in ('Sample metrics', 'Sample stat')}
+    old_root    =   sample_processed['Path local results']
+    new_root    =   os.path.join(out_dir, tool, f"r{repeat}", sample_processed['Flowcell'])
+    for key in LOCAL_keys:
+        if bench.get(key):
+            bench[key] = bench[key].replace(old_root, new_root, 1)
+    bench['Tool version']       =   tool
+    bench['Path install tool']  =   os.path.join(Paths.SOFT_local_dir.value, tool)
+    if fastq_dir:
+        bench['Path data']      =   os.path.join(fastq_dir, sample_processed['Flowcell'])
+    os.makedirs(new_root, exist_ok=True)
+    return bench
+
+
+def missing_fastq(panel: Dict[str, Dict[str, Any]], fastq_dir: str = None) -> List[str]:
+    """Образцы панели без локальных FASTQ ('<Path data>/<Sample_ID>_S*.fastq.gz', раскладка FASTQ_load)"""
+    from main._4_Monitoring.process_sampler import sample_fastq_bytes
+    missing = []
+    for key, value in panel.items():
+        data = os.path.join(fastq_dir, value['Flowcell']) if fastq_dir else value['Path data']
+        if not sample_fastq_bytes(dict(value, **{'Path data': data})):
+            missing.append(key)
+    return missing
+
+
+def sample_metrics(sample_processed: Dict[str, Any]) -> Dict[str, Any]:
+    """QC метрики запуска по схеме отчёта ({} - файл метрик не найден)"""
+    from main._3_Processing._2_POSTprocessing.report.stat import metric_seq_type, read_metrics_csv, normalize_metrics
+    stat_files = glob(sample_processed['Path result stat prefix'])
+    if not stat_files:
+        return {}
+    seq_type = metric_seq_type(sample_processed)
+    return normalize_metrics(read_metrics_csv(stat_files[0], seq_type), seq_type)
+
+
+def pin_cpus(cores: int) -> Optional[List[int]]:
+    """Привязка к первым cores доступным CPU; инструменты наследуют привязку"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    cpus = sorted(os.sched_getaffinity(0))[:cores]
+    os.sched_setaffinity(0, cpus)
+    return cpus
+
+
+def runs_path(out_dir: str) -> str:
+    return os.path.join(out_dir, 'runs.jsonl')
+
+
+def load_runs(out_dir: str) -> List[Dict[str, Any]]:
+    records = []
+    if os.path.exists(runs_path(out_dir)):
+        with open(runs_path(out_dir), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+def run_benchmark(panel: Dict[str, Dict[str, Any]],
+                  tools: List[str],
+                  out_dir: str,
+                  cores: int      =   16,
+                  memory: int     =   100,
+                  repeats: int    =   1,
+                  fastq_dir: str  =   None) -> List[Dict[str, Any]]:
+    """Все образцы панели всеми версиями; версии чередуются внутри образца, чтобы дрейф нагрузки сервера делился поровну"""
+    from main._3_Processing._1_MAINprocessing._2_FLOWCELL_processing import process_sample
+    from main._3_Processing._0_PREprocessing._4_process_flowcell.reference_cache import ReferenceCache
+    from main._4_Monitoring.process_sampler import ProcessTreeSampler, series_path
+    from main._4_Monitoring.tool_log_follower import release_pipestance
+
+    missing = [tool for tool in tools if not os.path.isdir(os.path.join(Paths.SOFT_local_dir.value, tool))]
+    if missing:
+        raise FileNotFoundError(f"Tools not installed in {Paths.SOFT_local_dir.value}: {missing}")
+    without_fastq = missing_fastq(panel, fastq_dir)
+    for key in without_fastq:
+        log(f"❌[Benchmark] {key}: no FASTQ in {os.path.join(fastq_dir, panel[key]['Flowcell']) if fastq_dir else panel[key]['Path data']}")
+    if len(without_fastq) == len(panel):
+        raise FileNotFoundError("No FASTQ for any panel sample (load the flowcells or pass --fastq-dir)")
+    os.makedirs(out_dir, exist_ok=True)
+    done        =   {(r['key'], r['tool'], r['repeat']) for r in load_runs(out_dir) if r['status'] == 'success'}
+    cpus        =   pin_cpus(cores)
+    ref_cache   =   ReferenceCache.from_config()
+    sampler     =   ProcessTreeSampler()
+    sampler.start()
+    if not sampler.enabled:
+        log("⚠️[Benchmark] psutil is not installed: only wall time and QC metrics are recorded")
+    log(f"🕐[Benchmark] {len(panel)} samples x {len(tools)} tools x {repeats} repeats, "
+        f"{cores} cores (CPU {cpus if cpus else 'not pinned'}), {memory} GB RAM")
+    records = []
+    try:
+        for repeat in range(1, repeats + 1):
+            for key, sample_processed in panel.items():
+                order = tools if repeat % 2 else list(reversed(tools))
+                for tool in order:
+                    if (key, tool, repeat) in done or key in without_fastq:
+                        continue
+                    bench = bench_sample(sample_processed, tool, out_dir, repeat, fastq_dir)
+                    record = {'key': key, 'flowcell': bench['Flowcell'], 'sample': bench['Sample_ID'],
+                              'seq_type': bench['SeqType'], 'tool': tool, 'repeat': repeat,
+                              'cores': cores, 'memory_gb': memory, 'started': time.strftime('%Y-%m-%d %H:%M:%S')}
+                    warming = ref_cache.warm_async(bench['Path to refs'])
+                    if warming is not None:
+                        warming.result()
+                    release_pipestance(bench)       # после прерванного запуска
+                    log(f"🕒[Benchmark] {key}: {tool} (repeat {repeat})")
+                    start = time.time()
+                    proc, log_file, _ = process_sample(sample_processed=bench, core=cores, memory=memory)
+                    if proc is None:
+                        if log_file is not None:
+                            log_file.close()
+                        log(f"❌[Benchmark] {key}: {tool} did not start (results already exist or command failed)")
+                        continue
+                    sampler.watch(key, proc.pid, series_path(bench))
+                    returncode      =   proc.wait()
+                    log_file.close()
+                    summary         =   sampler.finish(key, save=False) or {}
+                    record.update({metric: summary.get(metric) for metric in RESOURCE_metrics})
+                    record['wall_s']    =   round(time.time() - start, 1)
+                    record['status']    =   'success' if returncode == 0 else 'failed'
+                    record['returncode']=   returncode
+                    record['metrics']   =   sample_metrics(bench) if returncode == 0 else {}
+                    with open(runs_path(out_dir), 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                    records.append(record)
+                    log(f"{'✅' if returncode == 0 else '❌'}[Benchmark] {key}: {tool} {record['status']} "
+                        f"in {record['wall_s'] / 3600:.2f} h, peak RSS {record.get('rss_peak_gb')} GB")
+    finally:
+        sampler.stop()
+        ref_cache.shutdown()
+    return records
+
+
+def comparison(records: List[Dict[str, Any]], baseline: str = None) -> Tuple[Any, Any]:
+    """
+    detail  - строка на (тип, образец, метрика): среднее по повторам для каждой версии и Δ% к baseline;
+    summary - медиана Δ% по образцам для каждой (тип, метрика).
+    """
+    import pandas as pd
+    rows = []
+    for record in records:
+        if record['status'] != 'success':
+            continue
+        values = {metric: record.get(metric) for metric in RESOURCE_metrics}
+        values.update(record.get('metrics') or {})
+        for metric, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                rows.append((record['seq_type'], record['key'], metric, record['tool'], float(value)))
+    if not rows:
+        return pd.DataFrame(), pd.DataFrame()
+    df          =   pd.DataFrame(rows, columns=['seq_type', 'sample', 'metric', 'tool', 'value'])
+    tools       =   list(dict.fromkeys(df['tool']))
+    baseline    =   baseline or tools[0]
+    detail      =   df.pivot_table(index=['seq_type', 'sample', 'metric'], columns='tool', values='value', aggfunc='mean')
+    detail      =   detail.reindex(columns=[tool for tool in tools if tool in detail.columns])
+    delta_columns = []
+    for tool in detail.columns:
+        if tool == baseline or baseline not in detail.columns:
+            continue
+        column = f"Δ% {tool} vs {baseline}"
+        detail[column] = (detail[tool] - detail[baseline]) / detail[baseline].where(detail[baseline] != 0) * 100
+        delta_columns.append(column)
+    detail      =   detail.reset_index()
+    detail.columns.name = None
+    if delta_columns:
+        summary = detail.groupby(['seq_type', 'metric'])[delta_columns].median()
+        summary['samples'] = detail.groupby(['seq_type', 'metric'])['sample'].nunique()
+        summary = summary.reset_index()
+    else:
+        summary = pd.DataFrame()
+    return detail, summary
+
+
+def write_report(out_dir: str, baseline: str = None) -> Optional[str]:
+    records = load_runs(out_dir)
+    detail, summary = comparison(records, baseline)
+    if detail.empty:
+        log(f"⚠️[Benchmark] No successful runs in {runs_path(out_dir)}")
+        return None
+    failed = [f"{r['key']} {r['tool']} r{r['repeat']}" for r in records if r['status'] != 'success']
+    detail.to_csv(os.path.join(out_dir, 'comparison.csv'), index=False)
+    summary.to_csv(os.path.join(out_dir, 'summary.csv'), index=False)
+    html_path = os.path.join(out_dir, 'report.html')
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write("<html><head><meta charset='utf-8'><title>Tool version benchmark</title></head><body>\n")
+        f.write(f"<h2>Tool version benchmark ({time.strftime('%Y-%m-%d %H:%M')})</h2>\n")
+        f.write(f"<p>Runs: {len(records)}, failed: {len(failed)} {', '.join(failed)}</p>\n")
+        if not summary.empty:
+            f.write("<h3>Median Δ% per metric</h3>\n")
+            f.write(summary.to_html(index=False, float_format=lambda x: f"{x:.2f}", na_rep=''))
+        f.write("<h3>Per sample</h3>\n")
+        f.write(detail.to_html(index=False, float_format=lambda x: f"{x:.2f}", na_rep=''))
+        f.write("\n</body></html>\n")
+    if not summary.empty:
+        print(summary.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    log(f"✅[Benchmark] Report saved: {html_path}")
+    return html_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tool versions on a fixed panel of samples')
+    parser.add_argument('--out', default=None, help=f'benchmark directory (default: {Paths.BENCHMARK_save.value})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    panel_parser = subparsers.add_parser('panel', help='build a panel from flowcell_sample_processed*.json')
+    panel_parser.add_argument('jsons',      nargs='+')
+    panel_parser.add_argument('--seqtype',  default=None)
+    panel_parser.add_argument('--sample-ids', nargs='+', default=None)
+    panel_parser.add_argument('--samples',  type=int, default=None, help='first N samples')
+    panel_parser.add_argument('-o', '--output', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run every panel sample with every tool version')
+    run_parser.add_argument('panel')
+    run_parser.add_argument('--tools',      nargs='+', required=True, help='versions in SOFT_local_dir, first is the baseline')
+    run_parser.add_argument('--cores',      type=int, default=16)
+    run_parser.add_argument('--memory',     type=int, default=100, help='GB')
+    run_parser.add_argument('--repeats',    type=int, default=1)
+    run_parser.add_argument('--fastq-dir',  default=None, help='FASTQ root with <flowcell> directories (default: Path data)')
+
+    report_parser = subparsers.add_parser('report', help='comparison report from runs.jsonl')
+    report_parser.add_argument('--baseline', default=None)
+
+    args    = parser.parse_args()
+    out_dir = args.out or default_out_dir()
+    if args.command == 'panel':
+        panel = load_panel(args.jsons, args.seqtype, args.sample_ids, args.samples)
+        with open(args.output, 'w') as f:
+            json.dump(panel, f, indent=2)
+        print(f"✅ {len(panel)} samples saved to {args.output}")
+        return
+    if args.command == 'run':
+        if len(args.tools) < 2:
+            parser.error('at least two tool versions are required')
+        panel = load_panel([args.panel])
+        if not panel:
+            print(f"⚠️ Panel {args.panel} is empty")
+            sys.exit(1)
+        run_benchmark(panel, args.tools, out_dir, args.cores, args.memory, args.repeats, args.fastq_dir)
+        write_report(out_dir, baseline=args.tools[0])
+        return
+    if write_report(out_dir, args.baseline) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
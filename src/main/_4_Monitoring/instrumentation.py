@@ -0,0 +1,218 @@
+"""
+Спаны этапов пайплайна: время (wall/CPU), пик RSS и байты ввода-вывода в JSONL.
+
+    with span('3.2 Ceph sync', flowcell=flowcell_name, seq_type=seq_type):
+        ...
+
+    @traced('3.1.1 Load flowcell')
+    def load_flowcell(flowcell_sample_processed, ...):
+
+Одна строка на завершённый спан в '{WORKDIR}/1.Data/Monitoring/spans.jsonl'. Вложенность
+сохраняется через parent (стек спанов свой у каждого потока).
+"""
+import os
+import json
+import time
+import uuid
+import resource
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from main._4_Monitoring.structured_log import log
+
+_LOCK           =   threading.Lock()
+_LOCAL          =   threading.local()
+_SPANS_path: Optional[str] = None
+_LISTENERS: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def spans_path() -> str:
+    global _SPANS_path
+    if _SPANS_path is None:
+        from main._1_Config.main_config import WORKDIR, Paths
+        _SPANS_path = f"{WORKDIR}/{Paths.MONITORING_spans.value}"
+    return _SPANS_path
+
+
+def set_spans_path(path: str):
+    global _SPANS_path
+    _SPANS_path = path
+
+
+def _proc_io() -> Dict[str, int]:
+    """/proc/self/io: read_bytes/write_bytes - диск, rchar/wchar - все read/write (включая сеть и кэш)"""
+    counters = {}
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                counters[key.strip()] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+def _snapshot() -> Dict[str, Any]:
+    usage_self      =   resource.getrusage(resource.RUSAGE_SELF)
+    usage_children  =   resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'wall'          :   time.perf_counter(),
+        'cpu_user'      :   usage_self.ru_utime,
+        'cpu_sys'       :   usage_self.ru_stime,
+        'children_cpu'  :   usage_children.ru_utime + usage_children.ru_stime,
+        'io'            :   _proc_io(),
+    }
+
+
+def add_span_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Вызывается для каждого завершённого спана (например, метрики Prometheus)"""
+    if listener not in _LISTENERS:
+        _LISTENERS.append(listener)
+
+
+def write_span(record: Dict[str, Any]):
+    for listener in list(_LISTENERS):
+        try:
+            listener(record)
+        except Exception as e:
+            log(f"⚠️[Monitoring] Span listener failed: {e}")
+    path = spans_path()
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    try:
+        with _LOCK:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError as e:
+        log(f"⚠️[Monitoring] Failed to write span {record.get('stage')}: {e}")
+
+
+class Span:
+    def __init__(self, stage: str, parent: Optional[str], fields: Dict[str, Any]):
+        self.stage      =   stage
+        self.span_id    =   uuid.uuid4().hex[:16]
+        self.parent     =   parent
+        self.fields     =   dict(fields)
+        self.status     =   'ok'
+
+    def set(self, **fields):
+        """Дополнительные поля спана (число файлов, размер, ...)"""
+        self.fields.update(fields)
+
+
+def _stack() -> list:
+    if not hasattr(_LOCAL, 'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def current_span() -> Optional[Span]:
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def span(stage: str, **fields) -> Iterator[Span]:
+    """
+    Спан этапа. CPU считается для процесса целиком (self) и для завершившихся дочерних процессов
+    (rsync, bcl2fastq, cellranger после wait). Пик RSS - максимум процесса на момент закрытия спана.
+    """
+    parent  =   current_span()
+    current =   Span(stage, parent.span_id if parent else None, fields)
+    if parent:
+        for key in ('flowcell', 'sample', 'seq_type'):
+            if key in parent.fields and key not in current.fields:
+                current.fields[key] = parent.fields[key]
+    start_time  =   time.time()
+    start       =   _snapshot()
+    _stack().append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = 'error'
+        current.fields.setdefault('error', f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _stack().pop()
+        end     =   _snapshot()
+        usage_self      =   resource.getrusage(resource.RUSAGE_SELF)
+        usage_children  =   resource.getrusage(resource.RUSAGE_CHILDREN)
+        record  =   {
+            'span_id'           :   current.span_id,
+            'parent'            :   current.parent,
+            'stage'             :   stage,
+            'status'            :   current.status,
+            'start'             :   time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time)),
+            'wall_s'            :   round(end['wall'] - start['wall'], 3),
+            'cpu_user_s'        :   round(end['cpu_user'] - start['cpu_user'], 3),
+            'cpu_sys_s'         :   round(end['cpu_sys'] - start['cpu_sys'], 3),
+            'children_cpu_s'    :   round(end['children_cpu'] - start['children_cpu'], 3),
+            'peak_rss_mb'       :   round(usage_self.ru_maxrss / 1024, 1),
+            'children_peak_rss_mb': round(usage_children.ru_maxrss / 1024, 1),
+            'read_bytes'        :   end['io'].get('read_bytes', 0) - start['io'].get('read_bytes', 0),
+            'write_bytes'       :   end['io'].get('write_bytes', 0) - start['io'].get('write_bytes', 0),
+            'rchar'             :   end['io'].get('rchar', 0) - start['io'].get('rchar', 0),
+            'wchar'             :   end['io'].get('wchar', 0) - start['io'].get('wchar', 0),
+            'pid'               :   os.getpid(),
+            'thread'            :   threading.current_thread().name,
+        }
+        record.update(current.fields)
+        write_span(record)
+
+
+def record_span(stage: str, start_time: float, end_time: float, status: str = 'ok', **fields):
+    """Спан, измеренный снаружи (например, время работы дочернего процесса от запуска до завершения)"""
+    parent = current_span()
+    record = {
+        'span_id'   :   uuid.uuid4().hex[:16],
+        'parent'    :   parent.span_id if parent else None,
+        'stage'     :   stage,
+        'status'    :   status,
+        'start'     :   time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time)),
+        'wall_s'    :   round(end_time - start_time, 3),
+        'pid'       :   os.getpid(),
+    }
+    record.update(fields)
+    write_span(record)
+
+
+def flowcell_fields(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """flowcell/seq_type из аргументов этапа (flowcell_name или flowcell_sample_processed)"""
+    if kwargs.get('flowcell_name'):
+        return {'flowcell': kwargs['flowcell_name']}
+    samples = kwargs.get('flowcell_sample_processed') or {}
+    flowcells = sorted({value.get('Flowcell') for value in samples.values() if isinstance(value, dict)} - {None})
+    seq_types = sorted({value.get('SeqType') for value in samples.values() if isinstance(value, dict)} - {None})
+    fields = {'samples': len(samples)}
+    if flowcells:
+        fields['flowcell'] = ','.join(flowcells)
+    if seq_types:
+        fields['seq_type'] = ','.join(seq_types)
+    return fields
+
+
+def _result_failed(result: Any) -> bool:
+    # этапы возвращают False или (..., False) при ошибке
+    if result is False:
+        return True
+    return isinstance(result, tuple) and len(result) > 0 and result[-1] is False
+
+
+def traced(stage: str, fields: Callable[[Dict[str, Any]], Dict[str, Any]] = flowcell_fields):
+    """Декоратор этапа: спан на каждый вызов, поля берутся из именованных аргументов"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                span_fields = fields(kwargs) if fields else {}
+            except Exception:
+                span_fields = {}
+            with span(stage, **span_fields) as current:
+                result = func(*args, **kwargs)
+                if _result_failed(result):
+                    current.status = 'failed'
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,259 @@
+"""
+Метрики sc-processing в текстовом формате Prometheus (stdlib http.server в фоновом потоке).
+
+    python -m main._4_Monitoring.metrics_server --port 9109 --demo
+    curl -s http://127.0.0.1:9109/metrics
+
+В пайплайне сервер поднимается из run.main, если задан порт (METRICS_port в main_config
+или переменная окружения SC_METRICS_PORT). Длительности и ошибки этапов приходят из спанов instrumentation.
+"""
+import os
+import math
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from main._4_Monitoring.structured_log import log
+
+CONTENT_type        =   'text/plain; version=0.0.4; charset=utf-8'
+DURATION_buckets    =   (1, 5, 15, 60, 300, 900, 1800, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 16 * 3600, 24 * 3600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name           =   name
+        self.documentation  =   documentation
+        self.labelnames     =   tuple(labelnames)
+        self._lock          =   threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name}: counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_to_current_time(self, **labels):
+        self.set(time.time(), **labels)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = '+Inf' if math.isinf(bound) else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.expose() for metric in metrics) + '\n'
+
+
+REGISTRY                =   Registry()
+
+SAMPLES_queued          =   REGISTRY.register(Gauge('sc_samples_queued', 'Samples of the current flowcell waiting to be launched'))
+SAMPLES_running         =   REGISTRY.register(Gauge('sc_samples_running', 'Tool processes (cellranger, seeksoultools, ...) currently running'))
+STAGE_duration          =   REGISTRY.register(Histogram('sc_stage_duration_seconds', 'Pipeline stage duration', ['stage']))
+STAGE_failures          =   REGISTRY.register(Counter('sc_stage_failures_total', 'Pipeline stages finished with an error or failed status', ['stage']))
+BYTES_transferred       =   REGISTRY.register(Counter('sc_transferred_bytes_total', 'Bytes copied into the local workdir', ['kind']))
+BYTES_uploaded          =   REGISTRY.register(Counter('sc_ceph_uploaded_bytes_total', 'Bytes uploaded and verified on Ceph', ['seq_type']))
+SAMPLES_stalled         =   REGISTRY.register(Counter('sc_samples_stalled_total', 'Tool runs stopped after the log and CPU went idle', ['action']))
+FLOWCELLS_processed     =   REGISTRY.register(Counter('sc_flowcells_processed_total', 'Flowcells finished by the daemon', ['result']))
+LAST_success            =   REGISTRY.register(Gauge('sc_last_successful_flowcell_timestamp_seconds', 'Unix time of the last successfully processed flowcell'))
+DISK_free               =   REGISTRY.register(Gauge('sc_workdir_free_bytes', 'Free space on the WORKDIR filesystem'))
+DISK_reserved           =   REGISTRY.register(Gauge('sc_workdir_reserved_bytes', 'Space reserved by admitted flowcells on WORKDIR'))
+DAEMON_start            =   REGISTRY.register(Gauge('sc_daemon_start_timestamp_seconds', 'Unix time the daemon was started'))
+
+
+def observe_span(record: Dict[str, object]):
+    """Слушатель спанов instrumentation: длительность этапа и ошибки"""
+    stage = str(record.get('stage', 'unknown'))
+    STAGE_duration.observe(float(record.get('wall_s', 0.0)), stage=stage)
+    if record.get('status') not in (None, 'ok'):
+        STAGE_failures.inc(stage=stage)
+
+
+def flowcell_finished(success: Optional[bool]):
+    """None - флоуселл отложен (например, не хватило места на диске)"""
+    FLOWCELLS_processed.inc(result='deferred' if success is None else 'success' if success else 'failure')
+    if success:
+        LAST_success.set_to_current_time()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        payload = self.registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+
+
+def metrics_port(default: Optional[int] = None) -> Optional[int]:
+    """Порт из SC_METRICS_PORT (0 или пусто - выключено) или из конфигурации"""
+    value = os.environ.get('SC_METRICS_PORT')
+    if value is not None:
+        return int(value) if value.strip() not in ('', '0') else None
+    return default
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """Запускает /metrics в фоновом потоке и подключает слушатель спанов; повторный вызов возвращает тот же сервер"""
+    global _SERVER
+    if _SERVER is not None:
+        return _SERVER
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        log(f"⚠️[Monitoring] Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    from main._4_Monitoring.instrumentation import add_span_listener
+    add_span_listener(observe_span)
+    DAEMON_start.set_to_current_time()
+    _SERVER = server
+    log(f"✅[Monitoring] Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sc-processing metrics endpoint (local check)')
+    parser.add_argument('--port', type=int, default=9109)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--demo', action='store_true', help='fill metrics with demo values')
+    args = parser.parse_args()
+    if start_metrics_server(args.port, args.host) is None:
+        return
+    if args.demo:
+        from main._4_Monitoring.instrumentation import span, set_spans_path
+        set_spans_path(os.path.join('/tmp', 'sc_metrics_demo_spans.jsonl'))
+        SAMPLES_queued.set(3)
+        SAMPLES_running.set(2)
+        BYTES_transferred.inc(5 * 1024 ** 3, kind='fastq')
+        BYTES_uploaded.inc(2 * 1024 ** 3, seq_type='SC_TENX_RNA')
+        with span('3.2.r Zip'):
+            time.sleep(0.2)
+        with span('3.2 Ceph sync') as demo_span:
+            demo_span.status = 'failed'
+        flowcell_finished(True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Опрос дерева процессов запущенных инструментов (cellranger, spaceranger, seeksoultools).
+
+Один фоновый поток опрашивает все наблюдаемые процессы раз в interval секунд:
+    - временной ряд образца пишется в CSV рядом с 'Path log' ('<sample>_<prefix>.resources.csv');
+    - по завершении считается сводка (пик/среднее) и добавляется в '{WORKDIR}/1.Data/Monitoring/tool_profiles.jsonl'.
+
+CPU и IO завершившихся дочерних процессов не теряются: для каждого pid хранится последнее значение счётчиков.
+"""
+import os
+import re
+import csv
+import json
+import time
+import threading
+from typing import Any, Dict, Optional
+
+from main._4_Monitoring.structured_log import log
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SERIES_columns  =   ['time', 'elapsed_s', 'cpu_percent', 'rss_mb', 'read_bytes', 'write_bytes', 'threads', 'processes']
+_PROFILES_lock  =   threading.Lock()
+
+
+def profiles_path() -> str:
+    from main._1_Config.main_config import WORKDIR, Paths
+    return f"{WORKDIR}/{Paths.MONITORING_profiles.value}"
+
+
+def series_path(sample_processed: Dict[str, Any]) -> str:
+    return re.sub(r'\.log$', '', sample_processed['Path log']) + '.resources.csv'
+
+
+def sample_fastq_bytes(sample_processed: Dict[str, Any]) -> int:
+    """Размер входных FASTQ образца (Multiome - по обеим частям флоуселла, CellPlex - по всем библиотекам)"""
+    from main._3_Processing._0_PREprocessing._4_process_flowcell.disk_planner import fastq_size
+    sample_ids  =   [sample_processed['Sample_ID']]
+    if sample_processed.get('CellPlex_ID'):
+        sample_ids = sample_processed['CellPlex_ID'].split('|')
+    # 'Path data' - '{FASTQ_save}/{Flowcell}', для Multiome FASTQ лежат в директориях частей флоуселла
+    return fastq_size(os.path.dirname(sample_processed['Path data'].rstrip('/')), sample_processed['Flowcell'], sample_ids)
+
+
+class _Watched:
+    def __init__(self, pid: int, series_file: Optional[str], meta: Dict[str, Any]):
+        self.pid            =   pid
+        self.meta           =   meta
+        self.started        =   time.time()
+        self.cpu_by_pid     =   {}      # pid -> user+system, сек
+        self.io_by_pid      =   {}      # pid -> (read_bytes, write_bytes)
+        self.last_cpu       =   0.0
+        self.last_time      =   time.perf_counter()
+        self.cpu_percent    =   None    # последний замер, % одного ядра
+        self.ticks          =   0
+        self.cpu_sum        =   0.0
+        self.rss_sum        =   0.0
+        self.peak_cpu       =   0.0
+        self.peak_rss       =   0.0
+        self.peak_threads   =   0
+        self.peak_processes =   0
+        self.series_file    =   series_file
+        self._writer        =   None
+        self._handle        =   None
+        if series_file:
+            try:
+                self._handle = open(series_file, 'w', newline='')
+                self._writer = csv.writer(self._handle)
+                self._writer.writerow(SERIES_columns)
+            except OSError as e:
+                log(f"⚠️[Monitoring] Can't write resource series {series_file}: {e}")
+
+    def sample(self):
+        try:
+            root = psutil.Process(self.pid)
+            tree = [root] + root.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return
+        rss, threads, alive = 0, 0, 0
+        for proc in tree:
+            try:
+                with proc.oneshot():
+                    cpu                         =   proc.cpu_times()
+                    self.cpu_by_pid[proc.pid]   =   cpu.user + cpu.system
+                    rss                        +=   proc.memory_info().rss
+                    threads                    +=   proc.num_threads()
+                    try:
+                        io = proc.io_counters()
+                        self.io_by_pid[proc.pid] = (io.read_bytes, io.write_bytes)
+                    except (psutil.AccessDenied, AttributeError):
+                        pass
+                alive += 1
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        now             =   time.perf_counter()
+        cpu_total       =   sum(self.cpu_by_pid.values())
+        cpu_percent     =   max(cpu_total - self.last_cpu, 0.0) / max(now - self.last_time, 1e-6) * 100
+        self.last_cpu, self.last_time = cpu_total, now
+        self.cpu_percent    =   cpu_percent
+
+        rss_mb              =   rss / 1024 ** 2
+        self.ticks         +=   1
+        self.cpu_sum       +=   cpu_percent
+        self.rss_sum       +=   rss_mb
+        self.peak_cpu       =   max(self.peak_cpu, cpu_percent)
+        self.peak_rss       =   max(self.peak_rss, rss_mb)
+        self.peak_threads   =   max(self.peak_threads, threads)
+        self.peak_processes =   max(self.peak_processes, alive)
+        if self._writer:
+            read_bytes  =   sum(io[0] for io in self.io_by_pid.values())
+            write_bytes =   sum(io[1] for io in self.io_by_pid.values())
+            self._writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), round(time.time() - self.started, 1),
+                                   round(cpu_percent, 1), round(rss_mb, 1), read_bytes, write_bytes, threads, alive])
+            self._handle.flush()
+
+    def summary(self) -> Dict[str, Any]:
+        ticks = max(self.ticks, 1)
+        return {
+            'wall_s'            :   round(time.time() - self.started, 1),
+            'cpu_s'             :   round(sum(self.cpu_by_pid.values()), 1),
+            'cpu_mean_percent'  :   round(self.cpu_sum / ticks, 1),
+            'cpu_peak_percent'  :   round(self.peak_cpu, 1),
+            'rss_mean_gb'       :   round(self.rss_sum / ticks / 1024, 2),
+            'rss_peak_gb'       :   round(self.peak_rss / 1024, 2),
+            'read_gb'           :   round(sum(io[0] for io in self.io_by_pid.values()) / 1024 ** 3, 2),
+            'write_gb'          :   round(sum(io[1] for io in self.io_by_pid.values()) / 1024 ** 3, 2),
+            'threads_peak'      :   self.peak_threads,
+            'processes_peak'    :   self.peak_processes,
+            'samples'           :   self.ticks,
+        }
+
+    def close(self):
+        if self._handle:
+            self._handle.close()
+            self._handle, self._writer = None, None
+
+
+class ProcessTreeSampler(threading.Thread):
+    """Фоновый опрос деревьев процессов: watch() после Popen, finish() после завершения процесса"""
+
+    def __init__(self, interval: float = 15):
+        super().__init__(name='process-sampler', daemon=True)
+        self.interval   =   interval
+        self.enabled    =   psutil is not None
+        self._watched: Dict[str, _Watched] = {}
+        self._lock      =   threading.Lock()
+        self._stop_event=   threading.Event()
+        if not self.enabled:
+            log("⚠️[Monitoring] psutil is not installed, tool resource sampling is disabled")
+
+    def watch(self, key: str, pid: int, series_file: Optional[str] = None, **meta):
+        if not self.enabled:
+            return
+        with self._lock:
+            watched = _Watched(pid, series_file, meta)
+            watched.sample()
+            self._watched[key] = watched
+
+    def finish(self, key: str, save: bool = True, **meta) -> Optional[Dict[str, Any]]:
+        """Сводка по процессу и запись профиля инструмента (save=False - без записи); None - процесс не наблюдался"""
+        with self._lock:
+            watched = self._watched.pop(key, None)
+        if watched is None:
+            return None
+        watched.close()
+        summary = watched.summary()
+        record  = dict(watched.meta, **meta)
+        record.update(summary)
+        record['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if save:
+            append_tool_profile(record)
+        return summary
+
+    def cpu_percent(self, key: str) -> Optional[float]:
+        """Загрузка CPU дерева процессов на последнем опросе; None - не наблюдается или ещё не измерена"""
+        with self._lock:
+            watched = self._watched.get(key)
+        return watched.cpu_percent if watched is not None and watched.ticks > 1 else None
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                watched = list(self._watched.values())
+            for item in watched:
+                try:
+                    item.sample()
+                except Exception as e:
+                    log(f"⚠️[Monitoring] Sampling pid {item.pid} failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock:
+            for item in self._watched.values():
+                item.close()
+            self._watched.clear()
+
+
+def append_tool_profile(record: Dict[str, Any], path: str = None):
+    path = path or profiles_path()
+    try:
+        with _PROFILES_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    except OSError as e:
+        log(f"⚠️[Monitoring] Failed to write tool profile: {e}")
+
+
+def resource_columns(summary: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Колонки сводной таблицы флоуселла"""
+    if not summary:
+        return {}
+    return {
+        'Run time, h'       :   f"{summary['wall_s'] / 3600:.2f}",
+        'CPU mean, %'       :   f"{summary['cpu_mean_percent']:.0f}",
+        'CPU peak, %'       :   f"{summary['cpu_peak_percent']:.0f}",
+        'RSS mean, GB'      :   f"{summary['rss_mean_gb']:.1f}",
+        'RSS peak, GB'      :   f"{summary['rss_peak_gb']:.1f}",
+        'Read, GB'          :   f"{summary['read_gb']:.1f}",
+        'Write, GB'         :   f"{summary['write_gb']:.1f}",
+    }
@@ -0,0 +1,222 @@
+"""
+Логирование пайплайна: одна очередь на все процессы, JSONL с ротацией и дублирование в консоль.
+
+    setup_logging()                                         # run.main, один раз в главном процессе
+    log(f"✅[3.1.2 Processing] Sample {sample_id} done")    # вместо print
+    with log_context(flowcell=flowcell, sample=sample_id):
+        ...
+    ProcessPoolExecutor(max_workers=4, **pool_options())    # воркеры пишут в ту же очередь
+
+Запись в файл и в stdout делает QueueListener в фоновом потоке главного процесса, вызывающий код
+только кладёт запись в очередь. flowcell/sample/stage берутся из явных полей, log_context или текущего
+спана instrumentation; stage по умолчанию - тег сообщения ('[3.1.2 Processing]').
+"""
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import logging
+import multiprocessing
+import logging.handlers
+from io import StringIO
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+LOGGER_name     =   'sc'
+CONTEXT_fields  =   ('flowcell', 'sample', 'seq_type', 'stage')
+_ANSI           =   re.compile(r'\033\[[0-9;]*m')
+_STAGE_tag      =   re.compile(r'\[([^\]]+)\]')
+
+_CONTEXT: ContextVar[Dict[str, Any]] = ContextVar('sc_log_context', default={})
+_QUEUE          =   None
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_LEVEL          =   logging.INFO
+_CONFIGURED     =   False
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Поля flowcell/sample/seq_type/stage для всех записей внутри блока (в этом потоке)"""
+    token = _CONTEXT.set({**_CONTEXT.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def _context_fields() -> Dict[str, Any]:
+    fields = {}
+    try:
+        from main._4_Monitoring.instrumentation import current_span
+        current = current_span()
+        if current is not None:
+            fields.update({key: current.fields[key] for key in CONTEXT_fields if key in current.fields})
+            fields.setdefault('stage', current.stage)
+    except ImportError:
+        pass
+    fields.update(_CONTEXT.get())
+    return fields
+
+
+class _ContextFilter(logging.Filter):
+    """Добавляет поля контекста в запись; выполняется в процессе и потоке, где запись создана"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context_fields().items():
+            if getattr(record, key, None) is None:
+                setattr(record, key, value)
+        if getattr(record, 'stage', None) is None:
+            tag = _STAGE_tag.search(str(record.msg))
+            if tag:
+                record.stage = tag.group(1)
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time'      :   time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level'     :   record.levelname,
+            'logger'    :   record.name,
+            'message'   :   _ANSI.sub('', record.getMessage()),
+        }
+        for key in CONTEXT_fields:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry['pid']        =   record.process
+        entry['process']    =   record.processName
+        entry['thread']     =   record.threadName
+        if record.exc_info:
+            entry['exc']    =   self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc']    =   record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _queue_handler(queue) -> logging.handlers.QueueHandler:
+    handler = logging.handlers.QueueHandler(queue)
+    handler.addFilter(_ContextFilter())
+    return handler
+
+
+def _install(queue, level: int):
+    global _QUEUE, _LEVEL, _CONFIGURED
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_queue_handler(queue))
+    root.setLevel(level)
+    logging.captureWarnings(True)
+    _QUEUE, _LEVEL, _CONFIGURED = queue, level, True
+
+
+def setup_logging(path: str = None, level: str = None, max_bytes: int = None,
+                  backups: int = None, console: bool = None) -> logging.handlers.QueueListener:
+    """Очередь + слушатель с RotatingFileHandler (JSONL) и stdout; повторный вызов возвращает тот же слушатель"""
+    global _LISTENER
+    if _LISTENER is not None:
+        return _LISTENER
+    from main._1_Config.main_config import WORKDIR, Paths, LogParams
+    params      =   LogParams.args.value
+    path        =   path or f"{WORKDIR}/{Paths.MONITORING_log.value}"
+    level       =   logging.getLevelName(level or params['level'])
+    console     =   params['console'] if console is None else console
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(path,
+                                                        maxBytes    =   max_bytes or params['max_bytes'],
+                                                        backupCount =   backups if backups is not None else params['backups'],
+                                                        encoding    =   'utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(console_handler)
+
+    # multiprocessing.Queue: put не блокирует (запись в pipe делает фоновый поток очереди)
+    queue       =   multiprocessing.Queue(-1)
+    _LISTENER   =   logging.handlers.QueueListener(queue, *handlers, respect_handler_level=True)
+    _LISTENER.start()
+    _install(queue, level)
+    atexit.register(shutdown_logging)
+    return _LISTENER
+
+
+def shutdown_logging():
+    """Дописывает очередь и закрывает файлы"""
+    global _LISTENER
+    if _LISTENER is None:
+        return
+    _LISTENER.stop()
+    for handler in _LISTENER.handlers:
+        handler.close()
+    _LISTENER = None
+
+
+def worker_init(queue, level: int = logging.INFO):
+    """initializer для ProcessPoolExecutor: записи воркера уходят в очередь главного процесса"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    _install(queue, level)
+
+
+def pool_options() -> Dict[str, Any]:
+    """initializer/initargs для ProcessPoolExecutor; пусто, если логирование не настроено"""
+    if _QUEUE is None:
+        return {}
+    return {'initializer': worker_init, 'initargs': (_QUEUE, _LEVEL)}
+
+
+def get_logger(name: str = LOGGER_name) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if logger.level == logging.NOTSET:
+        logger.setLevel(_LEVEL)
+    return logger
+
+
+def _message_level(message: str) -> int:
+    if '❌' in message:
+        return logging.ERROR
+    if '⚠️' in message:
+        return logging.WARNING
+    return logging.INFO
+
+
+def log(message: Any = '', level: int = None, **fields):
+    """
+    Замена print: уровень по эмодзи (❌ - ERROR, ⚠️ - WARNING), поля - flowcell/sample/stage/seq_type.
+    Без setup_logging (sc-metrics, отдельные скрипты) просто печатает сообщение.
+    """
+    message = str(message)
+    if not _CONFIGURED:
+        print(message)
+        return
+    get_logger().log(level or _message_level(message), message, extra=fields)
+
+
+@contextmanager
+def capture_logs(**match) -> Iterator[StringIO]:
+    """
+    Копия записей (INFO+) в буфер, например, для сообщения об ошибке аннотации. Обработчик добавляется
+    к корневому логгеру и снимается после блока; match - только записи с такими полями контекста.
+    """
+    buffer  =   StringIO()
+    handler =   logging.StreamHandler(buffer)
+    handler.setLevel(logging.INFO)
+    handler.addFilter(_ContextFilter())
+    if match:
+        handler.addFilter(lambda record: all(getattr(record, key, None) == value for key, value in match.items()))
+    root    =   logging.getLogger()
+    root.addHandler(handler)
+    try:
+        yield buffer
+    finally:
+        root.removeHandler(handler)
+        handler.close()
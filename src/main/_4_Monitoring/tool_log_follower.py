@@ -0,0 +1,162 @@
+"""
+Чтение логов инструментов по мере записи: этапы martian (cellranger/spaceranger/cellranger-arc) и шаги
+seeksoultools, зависания.
+
+    follower = ToolLogFollower(sample_id, sample_processed['Path log'])
+    for event in follower.poll():           # в цикле опроса процессов
+        log(f"🔄[3.1.2 Progress] {sample_id}: {event}")
+    if follower.stalled(cpu_percent=sampler.cpu_percent(sample_id)):
+        kill_process_tree(proc)
+
+Зависание - лог не растёт stall_minutes минут и CPU дерева процессов ниже cpu_percent.
+Без замера CPU (нет psutil) зависание только сообщается, процесс не останавливается.
+"""
+import os
+import re
+import time
+import signal
+from glob import glob
+from typing import List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 2024-05-10 10:41:15 [runtime] (ready)           ID.S1.SC_RNA_COUNTER_CS.SC_MULTI_CORE.ALIGN_AND_COUNT
+# 2024-05-10 10:41:15 [runtime] (run:local)       ID.S1.SC_RNA_COUNTER_CS.SC_MULTI_CORE.ALIGN_AND_COUNT.fork0.chnk0.main
+MARTIAN_event   =   re.compile(r'\[runtime\]\s+\((?P<state>[\w:]+)\)\s+(?P<node>\S+)')
+MARTIAN_done    =   re.compile(r'Pipestance completed successfully')
+MARTIAN_fork    =   re.compile(r'\.fork\d+.*$')
+# seeksoultools: 'step1: barcode', 'run step3 ...'
+SEEKSOUL_step   =   re.compile(r'(?<![/\w])(?P<step>step\d+)(?![/\w])[:\s]*(?P<text>[\w \-]*)', re.IGNORECASE)
+READ_chunk      =   1024 ** 2
+
+
+class ToolLogFollower:
+    def __init__(self, key: str, path: str, stall_minutes: float = 60, cpu_percent: float = 5):
+        self.key            =   key
+        self.path           =   path
+        self.stall_seconds  =   stall_minutes * 60
+        self.cpu_threshold  =   cpu_percent
+        self.offset         =   0
+        self.partial        =   b''
+        self.last_growth    =   time.time()
+        self.stages: List[str]  =   []      # в порядке начала
+        self.completed      =   set()
+        self.current: Optional[str] = None
+        self.finished       =   False
+        self.last_line      =   ''
+        self.reported       =   False   # зависание без замера CPU уже сообщено
+
+    @staticmethod
+    def _martian_stage(node: str) -> str:
+        return MARTIAN_fork.sub('', node).rsplit('.', 1)[-1]
+
+    def _start(self, stage: str) -> Optional[str]:
+        if stage in self.stages:
+            return None
+        self.stages.append(stage)
+        self.current = stage
+        return f"{stage} (stage {len(self.stages)}, {len(self.completed)} completed)"
+
+    def _parse(self, line: str) -> Optional[str]:
+        match = MARTIAN_event.search(line)
+        if match:
+            stage = self._martian_stage(match.group('node'))
+            if match.group('state') == 'join_complete':
+                self.completed.add(stage)
+                return None
+            return self._start(stage)
+        if MARTIAN_done.search(line):
+            self.finished = True
+            return "pipestance completed"
+        match = SEEKSOUL_step.search(line)
+        if match:
+            step = match.group('step').lower()
+            if self.current and self.current != step:
+                self.completed.add(self.current)
+            if self._start(step) is None:
+                return None
+            return f"{step} {match.group('text').strip()}".strip() + f" (stage {len(self.stages)})"
+        return None
+
+    def poll(self) -> List[str]:
+        """Новые строки лога с последнего вызова; возвращает начавшиеся этапы"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:          # лог перезаписан (повторный запуск)
+            self.offset, self.partial = 0, b''
+        if size == self.offset:
+            return []
+        self.last_growth = time.time()
+        events = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(READ_chunk)
+                if not chunk:
+                    break
+                lines = (self.partial + chunk).split(b'\n')
+                self.partial = lines.pop()
+                for raw in lines:
+                    line = raw.decode('utf-8', errors='replace')
+                    if line.strip():
+                        self.last_line = line.strip()
+                    event = self._parse(line)
+                    if event:
+                        events.append(event)
+            self.offset = f.tell()
+        return events
+
+    def idle_seconds(self) -> float:
+        return time.time() - self.last_growth
+
+    def stalled(self, cpu_percent: Optional[float]) -> bool:
+        """True - лог не растёт дольше порога и CPU (если измерен) почти не используется"""
+        if self.idle_seconds() < self.stall_seconds:
+            return False
+        return cpu_percent is None or cpu_percent < self.cpu_threshold
+
+    def progress(self) -> str:
+        return f"{self.current or 'starting'} ({len(self.stages)} stages started, {len(self.completed)} completed)"
+
+
+def kill_process_tree(proc, timeout: float = 30):
+    """SIGTERM дереву процессов инструмента (mrp запускает стадии дочерними процессами), затем SIGKILL"""
+    children = []
+    if psutil is not None:
+        try:
+            children = psutil.Process(proc.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            children = []
+    for child in children:
+        try:
+            child.send_signal(signal.SIGTERM)
+        except psutil.NoSuchProcess:
+            pass
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except Exception:
+        proc.kill()
+        proc.wait()
+    if psutil is not None:
+        _, alive = psutil.wait_procs(children, timeout=timeout)
+        for child in alive:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+
+def release_pipestance(sample_processed: dict):
+    """Снимает блокировку martian ('_lock'), иначе перезапуск в той же директории не стартует"""
+    sample_dir = f"{sample_processed['Path local results']}/{sample_processed['Sample_ID']}_{sample_processed['Prefix reference']}"
+    for lock in glob(os.path.join(sample_dir, '_lock')):
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
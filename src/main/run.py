@@ -8,12 +8,16 @@ os.environ["PYTHONWARNINGS"] = "ignore"
 from main._1_Config.main_config import  ROOT_DIR,   WORKDIR, \
                                         Paths,      TypeConfig, RefsName,PrefixName,FilterParams,\
                                         SupportedTypes, MAX_diff_date_multiome,\
-                                        WORK_data_type
+                                        WORK_data_type, METRICS_port, RefRegistryParams
 sys.path.insert(0, ROOT_DIR)
 from main._3_Processing._0_PREprocessing.skip_flowcells             import load_skip_flowcells, add_to_skip_flowcells
 from main._3_Processing._0_PREprocessing.already_process_flowcell   import load_processed_flowcells
 from main._3_Processing._0_PREprocessing.start_steps                import get_credentials, get_mail_credentials, update_info_sheet
 from main._3_Processing.processing_code                             import full_process_flowcell
+from main._3_Processing._2_POSTprocessing.report.mail_queue         import start_mail_sender
+from main._4_Monitoring.metrics_server                              import start_metrics_server, metrics_port, flowcell_finished
+from main._4_Monitoring.structured_log                              import setup_logging, log
+from main._3_Processing._0_PREprocessing._4_process_flowcell.reference_registry import get_registry
 
 BCL_load                =   Paths.BCL_load.value                        # '/mnt/cephfs3_ro/BCL/uvd*'
 FASTQ_load              =   Paths.FASTQ_load.value                      # '/mnt/cephfs*_ro/FASTQS/uvd*'
@@ -27,6 +31,7 @@ RUNsheet_save           =   f"{WORKDIR}/{Paths.RUNsheet_save.value}"    # '/mnt/
 CEPH_sheet_parse        =   f"{WORKDIR}/{Paths.CEPH_sheet_parse.value}" # '/mnt/raid0/ofateev/projects/SC_auto/1.Data/Info/results_parsing.csv'
 IMG_save                =   f"{WORKDIR}/{Paths.IMG_save.value}"         # '/mnt/raid0/ofateev/projects/SC_auto/1.Data/Image'
 SKIP_list_save          =   f"{WORKDIR}/{Paths.SKIP_list_save.value}"   # '/mnt/raid0/ofateev/projects/SC_auto/src/main/_1_Config'
+MAIL_spool              =   f"{WORKDIR}/{Paths.MAIL_spool.value}"       # '/mnt/raid0/ofateev/projects/SC_auto/1.Data/MailSpool'
 
 SUPPORT_types           =   SupportedTypes.SUPPORT_types.value          # ['SC_TENX_RNA','SC_SeekGene_FullRNA','SC_TENX_ATAC','SC_SeekGene_RNA','SC_SeekGene_VDJ','SC_TENX_Multiome_RNA','SC_TENX_Multiome_ATAC','SC_SeekGene_Multiome_RNA','SC_SeekGene_Multiome_ATAC']
 CELLPLEX_types          =   SupportedTypes.CELLPLEX_types.value         # ['SC_TENX_CellPlex']
@@ -39,11 +44,11 @@ Filter_fastp_params     =   FilterParams.args.value                     # {'core
 def wait_and_retry(wait_hours=3):
     wait_seconds = wait_hours * 60 * 60
     
-    print(f"\n\033[93m{'='*60}\033[0m")
-    print(f"\033[93mAll flowcells processed. Waiting {wait_hours} hours...\033[0m")
-    print(f"\033[93mNext check: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + wait_seconds))}\033[0m")
-    print(f"\033[93mPress Ctrl+C to exit\033[0m")
-    print(f"\033[93m{'='*60}\033[0m")
+    log(f"\n\033[93m{'='*60}\033[0m")
+    log(f"\033[93mAll flowcells processed. Waiting {wait_hours} hours...\033[0m")
+    log(f"\033[93mNext check: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + wait_seconds))}\033[0m")
+    log(f"\033[93mPress Ctrl+C to exit\033[0m")
+    log(f"\033[93m{'='*60}\033[0m")
     
     try:
         # Wait with periodic status updates
@@ -51,53 +56,69 @@ def wait_and_retry(wait_hours=3):
             if remaining % 1800 == 0:  # Every 30 minutes
                 hours_left = remaining // 3600
                 mins_left = (remaining % 3600) // 60
-                print(f"\033[93mTime left: {hours_left}h {mins_left}m\033[0m")
+                log(f"\033[93mTime left: {hours_left}h {mins_left}m\033[0m")
             time.sleep(300)
         
-        print("\033[92mWaiting completed. Updating flowcells list...\033[0m")
+        log("\033[92mWaiting completed. Updating flowcells list...\033[0m")
         return True
         
     except KeyboardInterrupt:
-        print("\n\033[91mInterrupted by user. Exiting...\033[0m")
+        log("\n\033[91mInterrupted by user. Exiting...\033[0m")
         return False
 
 def main():
     """
     If you want to run specific flowcell, example 240918_A00926_0824_BHT35WDMXY
     """
+    setup_logging()
     specific_flowcell = None
     if len(sys.argv) > 1 and sys.argv[1].strip():
         specific_flowcell = sys.argv[1].strip()
-        print(f"\033[92m🕐[Main] Specific flowcell processing mode: {specific_flowcell}\033[0m")
+        log(f"\033[92m🕐[Main] Specific flowcell processing mode: {specific_flowcell}\033[0m")
     
+    port = metrics_port(METRICS_port)
+    if port:
+        start_metrics_server(port)
+
+    """
+    Verify local references in background (missing ones are synced from Ceph before the first flowcell that needs them)
+    """
+    if RefRegistryParams.args.value['enabled']:
+        verifying = get_registry().verify_all_async()
+        log(f"🕐[Main] Verifying {len(verifying)} local references in background")
+
     """
     Load list of flowcells who add to skip list by any reason
     """
     skip_flowcells      =   load_skip_flowcells(path_to_file        =   SKIP_list_save)
-    print(f"\033[92m✅[Main] Loaded {len(skip_flowcells)} flowcells in skip list\033[0m")
+    log(f"\033[92m✅[Main] Loaded {len(skip_flowcells)} flowcells in skip list\033[0m")
     if skip_flowcells:
-        print(f"\033[93m🕐[Main] Skipped flowcells: {len(skip_flowcells)}\033[0m")
+        log(f"\033[93m🕐[Main] Skipped flowcells: {len(skip_flowcells)}\033[0m")
         if specific_flowcell in skip_flowcells:
-            print(f"\033[93m❌[Main] Flowcell {specific_flowcell} in Skip list!\033[0m")
+            log(f"\033[93m❌[Main] Flowcell {specific_flowcell} in Skip list!\033[0m")
             return
 
     processed_flowcells =   load_processed_flowcells(path_to_file   =   SKIP_list_save)
     if processed_flowcells:
-        print(f"\033[93m🕐[Main] Processed flowcells: {len(processed_flowcells)}\033[0m")
+        log(f"\033[93m🕐[Main] Processed flowcells: {len(processed_flowcells)}\033[0m")
         if specific_flowcell in processed_flowcells:
-            print(f"\033[93m✅[Main] Flowcell {specific_flowcell} in Processed list!\033[0m")
+            log(f"\033[93m✅[Main] Flowcell {specific_flowcell} in Processed list!\033[0m")
             return
     
     """
     Enter you password and username
     """    
     username, password              =    get_credentials()
-    print(f"✅[Login] Using username: {username}")
-    print(f"✅[Login] Using password: {'*' * len(password)}")
+    log(f"✅[Login] Using username: {username}")
+    log(f"✅[Login] Using password: {'*' * len(password)}")
     sender_email, sender_password   =   get_mail_credentials()
-    print(f"✅[Login] Using mail username: {sender_email}")
-    print(f"✅[Login] Using mail password: {'*' * len(sender_password)}")
-    print("\033[91m" + "=" * 53 + "\033[0m")
+    log(f"✅[Login] Using mail username: {sender_email}")
+    log(f"✅[Login] Using mail password: {'*' * len(sender_password)}")
+    mail_sender                     =   start_mail_sender(sender_email      =   sender_email,
+                                                          sender_password   =   sender_password,
+                                                          config_path       =   f'{SKIP_list_save}/email_config.ini',
+                                                          spool_dir         =   MAIL_spool)
+    log("\033[91m" + "=" * 53 + "\033[0m")
     """
     First load Ceph Parse
     """
@@ -109,7 +130,7 @@ def main():
                                                 supported_types     =   SUPPORT_types,
                                                 info_sheet_ceph8    =   CEPH_sheet_parse_raw)
 
-    print("\033[91m" + "=" * 53 + "\033[0m")
+    log("\033[91m" + "=" * 53 + "\033[0m")
     """  
     If you want to run specific flowcell, example 240918_A00926_0824_BHT35WDMXY
     """  
@@ -135,15 +156,20 @@ def main():
                                         processed_skip      =   SKIP_list_save,
                                         email_config        =   f'{SKIP_list_save}/email_config.ini'
                                         )
+        flowcell_finished(None if success is None else success == True)
         if success == True:
-            print(f"\033[92m✅[Main] Completed processing flowcell: {specific_flowcell}\033[0m")
-            print(f"\033[92m✅[Main] Flowcell add to succesful processing list\033[0m")
+            log(f"\033[92m✅[Main] Completed processing flowcell: {specific_flowcell}\033[0m")
+            log(f"\033[92m✅[Main] Flowcell add to succesful processing list\033[0m")
+        elif success is None:
+            log(f"\033[93m🕐[Main] Flowcell {specific_flowcell} deferred: not enough disk space or reference unavailable, will retry later\033[0m")
         else:
             add_to_skip_flowcells(	path_to_file    =	SKIP_list_save,
 							 		flowcell	=	specific_flowcell, 
 									reason		=	f"Error in {specific_flowcell} processed")
-            print(f"\033[91m❌[Main] Failed to process flowcell: {specific_flowcell}\033[0m")
-            print(f"\033[91m❌[Main] Add flowcell {specific_flowcell} to skip list\033[0m")
+            log(f"\033[91m❌[Main] Failed to process flowcell: {specific_flowcell}\033[0m")
+            log(f"\033[91m❌[Main] Add flowcell {specific_flowcell} to skip list\033[0m")
+        if mail_sender is not None:
+            mail_sender.drain()
         return
     
     while True:
@@ -163,7 +189,7 @@ def main():
             sorted_list     =   sorted(set(sorted_list), 
                                 reverse=True)
             if not sorted_list:
-                print("\033[93mNo available flowcells for processing.\033[0m")
+                log("\033[93mNo available flowcells for processing.\033[0m")
                 if not wait_and_retry(wait_hours    =   5):
                     break
                 continue
@@ -189,24 +215,27 @@ def main():
                                                 processed_skip      =   SKIP_list_save,
                                                 email_config        =   f'{SKIP_list_save}/email_config.ini'
                                                 )
+                flowcell_finished(None if success is None else success == True)
                 if success == True:
-                    print(f"\033[92m✅[Main] Completed processing flowcell: {specific_flowcell}\033[0m")
-                    print(f"\033[92m✅[Main] Flowcell add to succesful processing list\033[0m")
+                    log(f"\033[92m✅[Main] Completed processing flowcell: {specific_flowcell}\033[0m")
+                    log(f"\033[92m✅[Main] Flowcell add to succesful processing list\033[0m")
+                elif success is None:
+                    log(f"\033[93m🕐[Main] Flowcell {specific_flowcell} deferred: not enough disk space or reference unavailable, will retry later\033[0m")
                 else:
                     add_to_skip_flowcells(	path_to_file    =	SKIP_list_save,
                                             flowcell	=	specific_flowcell, 
                                             reason		=	f"Error in {specific_flowcell} processed")
-                    print(f"\033[91m❌[Main] Failed to process flowcell: {specific_flowcell}\033[0m")
-                    print(f"\033[91m❌[Main] Add flowcell {specific_flowcell} to skip list\033[0m")
+                    log(f"\033[91m❌[Main] Failed to process flowcell: {specific_flowcell}\033[0m")
+                    log(f"\033[91m❌[Main] Add flowcell {specific_flowcell} to skip list\033[0m")
                 continue
             if not wait_and_retry(wait_hours    =   5):
                     break
         except Exception as e:
             error_msg = f"ERROR in main loop: {str(e)}"
-            print(f"\033[91m{error_msg}\033[0m")
-            print(f"Traceback: {traceback.format_exc()}")
+            log(f"\033[91m{error_msg}\033[0m")
+            log(f"Traceback: {traceback.format_exc()}")
             
-            print("\033[93mWaiting 1 hour before retry...\033[0m")
+            log("\033[93mWaiting 1 hour before retry...\033[0m")
             time.sleep(4 * 60 * 60)
 
 if __name__ == "__main__":
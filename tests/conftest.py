@@ -0,0 +1,5 @@
+import os
+import sys
+
+# пакет 'main' лежит в src (package_dir={'': 'src'})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,81 @@
+import json
+import os
+
+from main._4_Monitoring.benchmark_versions import bench_sample, load_panel, missing_fastq
+from main._4_Monitoring.process_sampler import sample_fastq_bytes
+
+RNA_flowcell        =   '240411_A01022_0750_AHNFHFDRXY'
+MULTIOME_flowcell   =   '240918_A00926_0824_BHT35WDMXY-240917_VH00195_169_AAF7WJLM5'
+
+
+def _fastq(root, flowcell, sample_id, size=100):
+    os.makedirs(os.path.join(root, flowcell), exist_ok=True)
+    for read in ('R1', 'R2'):
+        with open(os.path.join(root, flowcell, f"{sample_id}_S1_L001_{read}_001.fastq.gz"), 'wb') as f:
+            f.write(b'@' * size)
+
+
+def _sample(fastq_root, flowcell, sample_id, seq_type='SC_SeekGene_RNA'):
+    local = f"/w/2.Results/SG/scRNA/{flowcell}"
+    return {
+        'Sample_ID'                 :   sample_id,
+        'Flowcell'                  :   flowcell,
+        'SeqType'                   :   seq_type,
+        'Tool version'              :   'seeksoultools.1.2.2',
+        'Path data'                 :   os.path.join(fastq_root, flowcell),
+        'Path local results'        :   local,
+        'Path local sum stat'       :   f"{local}/{flowcell}-sum",
+        'Path result stat prefix'   :   f"{local}/{sample_id}_h/*_summary.csv",
+        'Path result html prefix'   :   f"{local}/{sample_id}_h/*_report.html",
+        'Path log'                  :   f"{local}/{sample_id}_h.log",
+        'Sample metrics'            :   {'median genes per cell': 1500},
+    }
+
+
+def test_panel_fastq_found_in_flowcell_layout(tmp_path):
+    fastq_root = str(tmp_path / 'FASTQ')
+    _fastq(fastq_root, RNA_flowcell, 'S1')
+    for part in MULTIOME_flowcell.split('-'):
+        _fastq(fastq_root, part, 'M1')
+    panel = {
+        f"{RNA_flowcell}:S1"        :   _sample(fastq_root, RNA_flowcell, 'S1'),
+        f"{RNA_flowcell}:S2"        :   _sample(fastq_root, RNA_flowcell, 'S2'),
+        f"{MULTIOME_flowcell}:M1"   :   _sample(fastq_root, MULTIOME_flowcell, 'M1', 'SC_SeekGene_Multiome'),
+    }
+    assert sample_fastq_bytes(panel[f"{RNA_flowcell}:S1"]) == 200
+    assert sample_fastq_bytes(panel[f"{MULTIOME_flowcell}:M1"]) == 400
+    assert missing_fastq(panel) == [f"{RNA_flowcell}:S2"]
+
+
+def test_fastq_dir_overrides_path_data(tmp_path):
+    _fastq(str(tmp_path / 'panel_fastq'), RNA_flowcell, 'S1')
+    panel = {f"{RNA_flowcell}:S1": _sample('/nonexistent', RNA_flowcell, 'S1')}
+    assert missing_fastq(panel) == [f"{RNA_flowcell}:S1"]
+    assert missing_fastq(panel, str(tmp_path / 'panel_fastq')) == []
+    bench = bench_sample(panel[f"{RNA_flowcell}:S1"], 'seeksoultools.1.3.0', str(tmp_path / 'out'), 1,
+                         str(tmp_path / 'panel_fastq'))
+    assert sample_fastq_bytes(bench) == 200
+
+
+def test_bench_sample_moves_local_paths(tmp_path):
+    sample = _sample('/fq', RNA_flowcell, 'S1')
+    bench = bench_sample(sample, 'seeksoultools.1.3.0', str(tmp_path), 2)
+    root = os.path.join(str(tmp_path), 'seeksoultools.1.3.0', 'r2', RNA_flowcell)
+    assert bench['Tool version'] == 'seeksoultools.1.3.0'
+    assert bench['Path install tool'].endswith('/seeksoultools.1.3.0')
+    assert bench['Path log'] == f"{root}/S1_h.log"
+    assert bench['Path result stat prefix'] == f"{root}/S1_h/*_summary.csv"
+    assert bench['Path data'] == sample['Path data']
+    assert 'Sample metrics' not in bench
+    assert os.path.isdir(root)
+    assert sample['Tool version'] == 'seeksoultools.1.2.2'
+
+
+def test_load_panel_filters(tmp_path):
+    path = tmp_path / 'flowcell_sample_processed_SC_SeekGene_RNA_count-1.json'
+    samples = {f"{RNA_flowcell}:S{i}": _sample('/fq', RNA_flowcell, f"S{i}") for i in range(4)}
+    samples[f"{RNA_flowcell}:V1"] = _sample('/fq', RNA_flowcell, 'V1', 'SC_SeekGene_VDJ')
+    path.write_text(json.dumps(samples))
+    assert len(load_panel([str(path)])) == 5
+    assert list(load_panel([str(path)], seq_type='SC_SeekGene_RNA', samples=2)) == [f"{RNA_flowcell}:S0", f"{RNA_flowcell}:S1"]
+    assert list(load_panel([str(path)], sample_ids=['V1'])) == [f"{RNA_flowcell}:V1"]
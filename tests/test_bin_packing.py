@@ -0,0 +1,121 @@
+import random
+
+import pytest
+
+from main._3_Processing._2_POSTprocessing.report.bin_packing import (
+    Item, _first_fit_decreasing, _units, lower_bound, pack, split_groups)
+
+MB = 1024 * 1024
+
+
+def _random_items(seed, n_files=300, n_samples=40):
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_files):
+        sample = f"sample{rng.randrange(n_samples)}"
+        kind = rng.random()
+        if kind < 0.2:
+            size = int(rng.lognormvariate(14.5, 0.6))
+        elif kind < 0.9:
+            size = int(rng.lognormvariate(12.0, 1.0))
+        else:
+            size = int(rng.lognormvariate(8.0, 1.0))
+        items.append(Item(f"{sample}/file{i}", size, sample))
+    return items
+
+
+def _loads(bins, items):
+    sizes = {item.key: item.size for item in items}
+    return [sum(sizes[key] for key in b) for b in bins]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('overhead', [0, 64 * 1024])
+def test_pack_never_exceeds_capacity(seed, overhead):
+    items = _random_items(seed)
+    capacity = 25 * MB
+    bins = pack(items, capacity, bin_overhead=overhead)
+    for load, b in zip(_loads(bins, items), bins):
+        assert load + overhead <= capacity or len(b) == 1
+    assert sorted(key for b in bins for key in b) == sorted(item.key for item in items)
+
+
+def test_bin_overhead_reduces_usable_capacity():
+    items = [Item('a', 60), Item('b', 40)]
+    assert pack(items, 100) == [['a', 'b']]
+    assert sorted(pack(items, 100, bin_overhead=1)) == [['a'], ['b']]
+
+
+def test_oversized_items_get_own_bins():
+    items = [Item('big', 150, 's1'), Item('small1', 30, 's1'), Item('small2', 30, 's2'), Item('huge', 500)]
+    bins = pack(items, 100)
+    assert ['big'] in bins and ['huge'] in bins
+    assert sorted(bins[0]) == ['small1', 'small2']
+    assert len(bins) == 3
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_bin_count_close_to_lower_bound(seed):
+    items = _random_items(seed)
+    capacity = 25 * MB
+    bins = pack(items, capacity)
+    bound = lower_bound([item.size for item in items], capacity)
+    ffd = _first_fit_decreasing(_units(items, capacity, keep_groups=False), capacity)
+    assert bound <= len(bins) <= len(ffd)
+    assert len(bins) <= bound + 1
+
+
+def test_lower_bound():
+    assert lower_bound([], 100) == 0
+    assert lower_bound([50, 50, 50], 100) == 2
+    assert lower_bound([60, 60, 60], 1000) == 1
+    assert lower_bound([60, 60, 60], 100) == 3
+
+
+def test_sample_groups_stay_together_when_they_fit():
+    items = [
+        Item('s1/a', 30, 's1'), Item('s2/a', 30, 's2'), Item('s1/b', 30, 's1'),
+        Item('s2/b', 30, 's2'), Item('s1/c', 30, 's1'), Item('s2/c', 30, 's2'),
+    ]
+    bins = pack(items, 100)
+    assert len(bins) == 2
+    assert split_groups(bins, {item.key: item.group for item in items}) == 0
+    assert sorted(sorted(b) for b in bins) == [['s1/a', 's1/b', 's1/c'], ['s2/a', 's2/b', 's2/c']]
+
+
+def test_fewer_bins_win_over_group_integrity():
+    # целиком по образцам - 3 корзины, с разбиением одного образца - 2
+    items = [Item('s1/a', 50, 's1'), Item('s1/b', 40, 's1'),
+             Item('s2/a', 50, 's2'), Item('s2/b', 40, 's2'),
+             Item('s3/a', 10, 's3'), Item('s3/b', 10, 's3')]
+    bins = pack(items, 100)
+    assert len(bins) == lower_bound([item.size for item in items], 100) == 2
+
+
+def test_pack_is_deterministic():
+    items = _random_items(7)
+    first = pack(items, 25 * MB)
+    for _ in range(3):
+        assert pack(list(items), 25 * MB) == first
+
+
+def test_empty():
+    assert pack([], 100) == []
+
+
+@pytest.mark.parametrize('n_files, n_samples', [(2000, 200), (5000, 400)])
+def test_benchmark_against_plain_ffd(n_files, n_samples):
+    """Масштаб _benchmark(): не больше корзин, чем FFD, меньше разнесённых образцов, разумное время"""
+    import time
+    items = _random_items(0, n_files, n_samples)
+    capacity = 25 * MB
+    key_group = {item.key: item.group for item in items}
+    ffd = _first_fit_decreasing(_units(items, capacity, keep_groups=False), capacity)
+    ffd_keys = [[item.key for unit in b for item in unit.items] for b in ffd]
+    start = time.perf_counter()
+    bins = pack(items, capacity)
+    elapsed = time.perf_counter() - start
+    assert len(bins) <= len(ffd_keys)
+    assert len(bins) == lower_bound([item.size for item in items], capacity)
+    assert split_groups(bins, key_group) < split_groups(ffd_keys, key_group) / 10
+    assert elapsed < 5
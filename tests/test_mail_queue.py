@@ -0,0 +1,165 @@
+import glob
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('requests_ntlm')
+pytest.importorskip('pandas')
+
+from main._3_Processing._2_POSTprocessing.report.fake_mail_server import start_fake_servers
+from main._3_Processing._2_POSTprocessing.report.mail_queue import MailSender, MailSpool, report_message_id
+
+BASE_delay = 60
+
+
+@pytest.fixture
+def fake_mail(tmp_path, request):
+    """Заглушки EWS и SMTP на свободных портах; fail_first - через параметр теста"""
+    fail_first = getattr(request, 'param', 0)
+    out_dir = str(tmp_path / 'fake_mail')
+    http_server, smtp_server = start_fake_servers(out_dir, http_port=0, smtp_port=0, fail_first=fail_first)
+    config = {
+        'sender_email'      :   'sc-processing@example.org',
+        'sender_username'   :   'sc-processing',
+        'sender_password'   :   'secret',
+        'ews_url'           :   f"http://127.0.0.1:{http_server.server_address[1]}/EWS/Exchange.asmx",
+        'smtp_server'       :   '127.0.0.1',
+        'smtp_port'         :   str(smtp_server.server_address[1]),
+        'smtp_starttls'     :   'false',
+    }
+    yield config, out_dir
+    for server in (http_server, smtp_server):
+        server.shutdown()
+        server.server_close()
+
+
+def _attachment(tmp_path, name='report.zip', data=b'PK\x05\x06' + b'\x00' * 18):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_successful_send_moves_message_to_sent(tmp_path, fake_mail):
+    config, out_dir = fake_mail
+    spool = MailSpool(str(tmp_path / 'spool'), base_delay=BASE_delay)
+    attachment = _attachment(tmp_path)
+    assert spool.enqueue('fc1-report', ['lab@example.org'], 'Flowcell fc1', '<p>done</p>', attachment)
+    assert not os.path.exists(attachment)              # вложение перенесено в спул
+
+    sender = MailSender(spool, config)
+    try:
+        assert sender.process_due() == 1
+    finally:
+        sender.reporter.close()
+
+    assert spool.pending() == []
+    with open(os.path.join(spool.spool_dir, 'sent', 'fc1-report.json')) as f:
+        record = json.load(f)
+    assert record['subject'] == 'Flowcell fc1' and record['attempts'] == 0 and record['sent']
+    assert not os.path.exists(os.path.join(spool.spool_dir, 'pending', 'fc1-report'))
+    received = glob.glob(os.path.join(out_dir, 'ews_*.txt'))
+    assert len(received) == 1
+    with open(received[0], 'rb') as f:
+        soap = f.read()
+    assert b'Flowcell fc1' in soap and b'report.zip' in soap
+
+
+@pytest.mark.parametrize('fake_mail', [100], indirect=True)
+def test_failure_increments_attempts_with_exponential_backoff(tmp_path, fake_mail):
+    config, _ = fake_mail
+    spool = MailSpool(str(tmp_path / 'spool'), max_attempts=8, base_delay=BASE_delay)
+    spool.enqueue('fc2-report', ['lab@example.org'], 'Flowcell fc2', '<p>done</p>', _attachment(tmp_path))
+    sender = MailSender(spool, config)
+    try:
+        for attempt in (1, 2, 3):
+            started = time.time()
+            assert sender.process_due() == 0
+            message, = spool.pending()
+            assert message['attempts'] == attempt
+            assert message['last_error'] == 'delivery failed'
+            delay = BASE_delay * 2 ** (attempt - 1)
+            assert started + delay <= message['next_attempt'] <= time.time() + delay
+            assert spool.due() == []                   # до next_attempt письмо не отправляется
+            message['next_attempt'] = 0                # время повтора наступило
+            spool._write(message)
+    finally:
+        sender.reporter.close()
+    assert os.listdir(os.path.join(spool.spool_dir, 'sent')) == []
+
+
+@pytest.mark.parametrize('fake_mail', [100], indirect=True)
+def test_max_attempts_moves_message_to_failed(tmp_path, fake_mail):
+    config, _ = fake_mail
+    spool = MailSpool(str(tmp_path / 'spool'), max_attempts=2, base_delay=BASE_delay)
+    spool.enqueue('fc3-report', ['lab@example.org'], 'Flowcell fc3', '<p>done</p>', _attachment(tmp_path))
+    sender = MailSender(spool, config)
+    try:
+        sender.process_due()
+        message, = spool.pending()
+        message['next_attempt'] = 0
+        spool._write(message)
+        sender.process_due()
+    finally:
+        sender.reporter.close()
+
+    assert spool.pending() == []
+    failed_dir = os.path.join(spool.spool_dir, 'failed', 'fc3-report')
+    with open(os.path.join(failed_dir, 'message.json')) as f:
+        message = json.load(f)
+    assert message['attempts'] == 2
+    assert os.path.exists(os.path.join(failed_dir, 'report.zip'))
+
+
+@pytest.mark.parametrize('fake_mail', [1], indirect=True)
+def test_retry_succeeds_after_temporary_failure(tmp_path, fake_mail):
+    config, _ = fake_mail
+    spool = MailSpool(str(tmp_path / 'spool'), base_delay=BASE_delay)
+    spool.enqueue('fc4-report', ['lab@example.org'], 'Flowcell fc4', '<p>done</p>')
+    sender = MailSender(spool, config)
+    try:
+        # первая попытка: EWS 503, SMTP fallback 451 - в очереди остаётся
+        assert sender.process_due() == 0
+        message, = spool.pending()
+        message['next_attempt'] = 0
+        spool._write(message)
+        assert sender.process_due() == 1
+    finally:
+        sender.reporter.close()
+    assert os.path.exists(os.path.join(spool.spool_dir, 'sent', 'fc4-report.json'))
+
+
+def test_duplicate_enqueue_is_dropped_and_attachment_removed(tmp_path, fake_mail):
+    config, out_dir = fake_mail
+    spool = MailSpool(str(tmp_path / 'spool'))
+    first = _attachment(tmp_path, 'first.zip')
+    second = _attachment(tmp_path, 'second.zip')
+    assert spool.enqueue('fc5-report', ['lab@example.org'], 'Flowcell fc5', '<p>done</p>', first)
+    assert not spool.enqueue('fc5-report', ['lab@example.org'], 'Flowcell fc5', '<p>again</p>', second)
+    assert not os.path.exists(second)
+
+    message, = spool.pending()
+    assert message['attachment'] == 'first.zip'
+    assert spool.load_body(message) == '<p>done</p>'
+
+    sender = MailSender(spool, config)
+    try:
+        assert sender.process_due() == 1
+    finally:
+        sender.reporter.close()
+    third = _attachment(tmp_path, 'third.zip')
+    assert not spool.enqueue('fc5-report', ['lab@example.org'], 'Flowcell fc5', '<p>again</p>', third)
+    assert not os.path.exists(third)
+    assert len(glob.glob(os.path.join(out_dir, 'ews_*.txt'))) == 1
+
+
+def test_report_message_id_follows_archive_content(tmp_path):
+    first = _attachment(tmp_path, 'first.zip', b'report v1')
+    same = _attachment(tmp_path, 'same.zip', b'report v1')
+    reprocessed = _attachment(tmp_path, 'reprocessed.zip', b'report v2')
+    assert report_message_id('fc6_reports', first) == report_message_id('fc6_reports', same)
+    assert report_message_id('fc6_reports', first) != report_message_id('fc6_reports', reprocessed)
+    assert report_message_id('fc6_reports', first).startswith('fc6_reports_')
+    assert report_message_id('fc6_reports') == 'fc6_reports'
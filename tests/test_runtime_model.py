@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from main._3_Processing._0_PREprocessing._4_process_flowcell.runtime_model import (
+    RuntimeModel, load_profiles, plan_resources)
+
+GB = 1024 ** 3
+
+
+def _profile(fastq_gb, seq_type='SC_SeekGene_RNA', tool='seeksoultools.1.2.2', reference='GRCh38', **extra):
+    record = {
+        'seq_type'      :   seq_type,
+        'tool'          :   tool,
+        'reference'     :   reference,
+        'cores'         :   10,
+        'fastq_bytes'   :   int(fastq_gb * GB),
+        'cpu_s'         :   1000 + 500 * fastq_gb,
+        'wall_s'        :   (1000 + 500 * fastq_gb) / (10 * 0.5),
+        'rss_peak_gb'   :   8 + 2 * fastq_gb,
+        'returncode'    :   0,
+    }
+    record.update(extra)
+    return record
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    path = tmp_path / 'tool_profiles.jsonl'
+    records = [_profile(gb) for gb in (10, 20, 40, 80)]
+    records += [
+        _profile(30, returncode=1),             # неуспешный запуск
+        _profile(0),                            # размер FASTQ неизвестен
+    ]
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.write('not json\n')
+    return str(path)
+
+
+def _sample(tmp_path, flowcell, sample_id, fastq_gb_files):
+    fastq_dir = tmp_path / 'FASTQ' / flowcell
+    fastq_dir.mkdir(parents=True, exist_ok=True)
+    for read, size in fastq_gb_files.items():
+        with open(fastq_dir / f"{sample_id}_S1_L001_{read}_001.fastq.gz", 'wb') as f:
+            f.truncate(size)                    # разреженный файл нужного размера
+    return {
+        'Sample_ID'         :   sample_id,
+        'Flowcell'          :   flowcell,
+        'SeqType'           :   'SC_SeekGene_RNA',
+        'Tool version'      :   'seeksoultools.1.2.2',
+        'Reference name'    :   'GRCh38',
+        'Path data'         :   str(fastq_dir),
+    }
+
+
+def test_load_profiles_keeps_successful_runs_with_fastq_size(profiles):
+    records = load_profiles(profiles)
+    assert len(records) == 4
+    assert all(record['fastq_bytes'] > 0 and record['returncode'] == 0 for record in records)
+
+
+def test_model_recovers_linear_fit(profiles):
+    model = RuntimeModel.from_history(profiles)
+    prediction = model.predict('SC_SeekGene_RNA', 'seeksoultools.1.2.2', 'GRCh38', 50 * GB)
+    assert prediction.key == ('SC_SeekGene_RNA', 'seeksoultools.1.2.2', 'GRCh38')
+    assert prediction.runs == 4
+    assert prediction.cpu_s == pytest.approx(1000 + 500 * 50, rel=1e-6)
+    assert prediction.rss_gb == pytest.approx(8 + 2 * 50, rel=1e-6)
+    assert prediction.utilization == pytest.approx(0.5)
+    assert prediction.wall_s(10) == pytest.approx((1000 + 500 * 50) / 5, rel=1e-6)
+
+
+def test_model_falls_back_to_wider_key(profiles):
+    model = RuntimeModel.from_history(profiles)
+    prediction = model.predict('SC_SeekGene_RNA', 'seeksoultools.1.3.0', 'MM10', 20 * GB)
+    assert prediction.key == ('SC_SeekGene_RNA',)
+    assert model.predict('SC_TENX_RNA', 'cellranger-10.0.0', 'GRCh38', 20 * GB) is None
+    assert model.predict('SC_SeekGene_RNA', 'seeksoultools.1.2.2', 'GRCh38', 0) is None
+
+
+def test_plan_resources_sizes_fastq_from_flowcell_layout(profiles, tmp_path):
+    samples = {
+        'FC:big'    :   _sample(tmp_path, '240411_A01022_0750_AHNFHFDRXY', 'big',   {'R1': 30 * GB, 'R2': 30 * GB}),
+        'FC:small'  :   _sample(tmp_path, '240411_A01022_0750_AHNFHFDRXY', 'small', {'R1': 5 * GB, 'R2': 5 * GB}),
+    }
+    plans = plan_resources(samples, total_cores=40, total_memory=400, model=RuntimeModel.from_history(profiles))
+    assert plans is not None
+    assert [plan.key for plan in plans] == ['FC:big', 'FC:small']
+    by_key = {plan.key: plan for plan in plans}
+    assert by_key['FC:big'].prediction.cpu_s == pytest.approx(1000 + 500 * 60, rel=1e-6)
+    assert by_key['FC:big'].cores > by_key['FC:small'].cores
+    assert sum(plan.cores for plan in plans) <= 40
+    assert sum(plan.memory_gb for plan in plans) <= 400